@@ -1,47 +1,363 @@
 # Add this to EACH of your 5 AI apps
+import asyncio
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from itsdangerous import URLSafeTimedSerializer
+from shared.passport import app_key as derive_app_key, decode, encode, InvalidPassport
+
+
+class SpendLedger:
+    """Local record of what each passport has spent, settled to the bank later.
+
+    Keyed by passport_id: the budget is taken from the passport the first time
+    it is seen and only ever goes down after that, so replaying an older copy
+    of the same passport can't restore spent budget.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("PASSPORT_LEDGER_PATH", "passport_ledger.db")
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS passports
+                        (passport_id TEXT PRIMARY KEY, email TEXT, budget_remaining INTEGER,
+                         first_seen REAL, revoked INTEGER DEFAULT 0)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS settlements
+                        (id TEXT PRIMARY KEY, passport_id TEXT, email TEXT, tokens INTEGER,
+                         description TEXT, created REAL, status TEXT)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_settlements_status ON settlements (status, created)')
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def debit(self, passport, cost, description):
+        """Spend from the passport's local budget. Returns remaining budget or None if refused."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT OR IGNORE INTO passports (passport_id, email, budget_remaining, first_seen) '
+                         'VALUES (?, ?, ?, ?)',
+                         (passport["passport_id"], passport["email"], passport["budget"], time.time()))
+            updated = conn.execute('UPDATE passports SET budget_remaining = budget_remaining - ? '
+                                   'WHERE passport_id = ? AND revoked = 0 AND budget_remaining >= ?',
+                                   (cost, passport["passport_id"], cost)).rowcount
+            if not updated:
+                conn.execute('ROLLBACK')
+                return None
+            if cost:  # free operations have nothing to settle
+                conn.execute('INSERT INTO settlements VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (secrets.token_hex(12), passport["passport_id"], passport["email"],
+                              cost, description, time.time(), "pending"))
+            remaining = conn.execute('SELECT budget_remaining FROM passports WHERE passport_id = ?',
+                                     (passport["passport_id"],)).fetchone()[0]
+            conn.execute('COMMIT')
+            return remaining
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def pending(self, limit=100):
+        conn = self._connect()
+        rows = conn.execute('SELECT id, passport_id, email, tokens, description FROM settlements '
+                            'WHERE status = ? ORDER BY created LIMIT ?', ("pending", limit)).fetchall()
+        conn.close()
+        return [dict(zip(("id", "passport_id", "email", "tokens", "description"), row)) for row in rows]
+
+    def reconcile(self, results):
+        """Apply the bank's verdicts: settled/duplicate are done, rejected revokes the passport"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for settlement_id, verdict in results.items():
+                status = "rejected" if verdict == "rejected" else "settled"
+                conn.execute('UPDATE settlements SET status = ? WHERE id = ?', (status, settlement_id))
+                if status == "rejected":
+                    conn.execute('UPDATE passports SET revoked = 1 WHERE passport_id = '
+                                 '(SELECT passport_id FROM settlements WHERE id = ?)', (settlement_id,))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+
+def bank_app_key(app_id):
+    """This app's /settle credential: BANK_APP_KEY, or derived where BANK_APP_SECRET is known"""
+    return os.getenv("BANK_APP_KEY") or derive_app_key(app_id)
 
-serializer = URLSafeTimedSerializer('your-secret-key-here')
 
 class TokenMiddleware:
-    def __init__(self, app_id, dashboard_url):
+    def __init__(self, app_id, dashboard_url, ledger_path=None, settle_interval=5.0,
+                 settle_batch_size=100, start_settler=True, app_key=None):
         self.app_id = app_id
+        self.app_key = app_key or bank_app_key(app_id)
         self.dashboard_url = dashboard_url
-    
+        self.ledger = SpendLedger(ledger_path)
+        self.settle_interval = settle_interval
+        self.settle_batch_size = settle_batch_size
+        self._stop = threading.Event()
+        self._settler = None
+        if start_settler:
+            self._settler = threading.Thread(target=self._settle_forever, name="passport-settler", daemon=True)
+            self._settler.start()
+
     def check_and_spend(self, passport_token, operation, cost):
-        """Verify passport and spend tokens before AI operation"""
+        """Verify passport and spend tokens before AI operation.
+
+        No network call: the passport signature is checked locally and the
+        spend is debited from the local ledger, then settled with the bank
+        in the background.
+        """
         try:
-            # Decrypt the passport
-            passport = serializer.loads(passport_token, salt=f'passport-{self.app_id}')
-            
-            # Check if operation fits in budget
-            if cost > passport["budget"]:
+            # Verify the passport (v2 binary, or a v1 token during the rollout)
+            passport = decode(passport_token, self.app_id)
+        except InvalidPassport:
+            return {"error": "Invalid passport"}, 401
+
+        # Check if operation fits in budget
+        remaining = self.ledger.debit(passport, cost, operation)
+        if remaining is None:
+            return {"error": "Session budget exceeded"}, 403
+
+        # The token itself doesn't change: the ledger holds the live budget
+        return {"approved": True, "new_passport": passport_token, "remaining_budget": remaining}
+
+    def settle(self):
+        """Send pending spends to the bank in one batch. Returns how many were reconciled."""
+        batch = self.ledger.pending(self.settle_batch_size)
+        if not batch:
+            return 0
+        response = requests.post(
+            f"{self.dashboard_url}/settle",
+            json={"app_id": self.app_id, "entries": batch},
+            headers={"X-App-Key": self.app_key},
+            timeout=10
+        )
+        response.raise_for_status()
+        results = response.json()["results"]
+        self.ledger.reconcile(results)
+        return len(results)
+
+    def _settle_forever(self):
+        while not self._stop.wait(self.settle_interval):
+            try:
+                while self.settle() >= self.settle_batch_size:
+                    pass  # drain a backlog without waiting a full interval per batch
+            except Exception as e:
+                # Pending rows stay pending and go out with the next batch
+                print(f"⚠️ Passport settlement failed, will retry: {e}")
+
+    def stop(self):
+        """Stop the settler after one last flush"""
+        self._stop.set()
+        if self._settler:
+            self._settler.join(self.settle_interval + 10)
+        try:
+            self.settle()
+        except Exception as e:
+            print(f"⚠️ Final passport settlement failed: {e}")
+
+
+class TokenASGIMiddleware:
+    """Async version of TokenMiddleware for FastAPI/Starlette AI apps.
+
+    Charges only the routes listed in `routes` ({path: operation} or
+    {(method, path): operation}); the cost comes from the app catalog
+    (shared.catalog, so price reloads apply) unless `costs` is given. The passport is read from the X-Passport header
+    or the `passport` cookie, and the refreshed one is returned in both.
+
+    With a SpendLedger the spend is debited locally and settled in batches
+    (no round trip per charge); without one it goes to the bank's /spend over
+    a pooled async client.
+
+    aclose() flushes pending settlements and closes the client; it runs on
+    the app's lifespan shutdown, or call it yourself when not using lifespan.
+    """
+
+    def __init__(self, app, app_id, bank_url, routes, costs=None, ledger=None,
+                 cookie_name="passport", header_name="x-passport", max_connections=20,
+                 settle_interval=5.0, app_key=None):
+        # Only the async apps need these, so the sync helper keeps working without them
+        import httpx
+        from starlette.datastructures import MutableHeaders
+        from starlette.requests import HTTPConnection
+        from starlette.responses import JSONResponse
+        self._MutableHeaders = MutableHeaders
+        self._HTTPConnection = HTTPConnection
+        self._JSONResponse = JSONResponse
+        self.app = app
+        self.app_id = app_id
+        self.app_key = app_key or bank_app_key(app_id)
+        self.routes = routes
+        # Unknown apps or unpriced operations fail here, not on the first request
+        if costs is None:
+            from shared.catalog import get_catalog
+            catalog = get_catalog()
+            for operation in set(routes.values()):
+                catalog.cost(app_id, operation)  # CatalogError if there's no price
+            self._get_catalog = get_catalog
+        else:
+            unpriced = sorted(set(routes.values()) - set(costs))
+            if unpriced:
+                raise ValueError(f"No price for {', '.join(unpriced)}")
+        self.costs = costs
+        self.ledger = ledger
+        self.cookie_name = cookie_name
+        self.header_name = header_name
+        self.settle_interval = settle_interval
+        from shared.internal_auth import internal_headers
+        self._client = httpx.AsyncClient(
+            base_url=bank_url,
+            headers=internal_headers(),
+            timeout=5.0,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._settler = None
+        # One thread for ledger writes: they serialize in SQLite anyway, and
+        # queueing them here avoids lock contention (busy-wait sleeps) there
+        self._ledger_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="passport-ledger")
+
+    async def _in_ledger(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._ledger_executor, fn, *args)
+
+    def _operation_for(self, scope):
+        path = scope["path"]
+        return self.routes.get((scope["method"], path)) or self.routes.get(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.app(scope, self._closing_on_shutdown(receive), send)
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        operation = self._operation_for(scope)
+        if operation is None:
+            return await self.app(scope, receive, send)
+
+        connection = self._HTTPConnection(scope)
+        token = connection.headers.get(self.header_name) or connection.cookies.get(self.cookie_name)
+        try:
+            cost = self.cost_of(operation)
+        except (KeyError, ValueError):  # CatalogError is a ValueError
+            # The catalog was reloaded without this operation: never run it for free
+            return await self._JSONResponse({"error": "Operation has no price"}, status_code=503)(scope, receive, send)
+        outcome = await self.spend(token, operation, cost)
+        if isinstance(outcome, tuple):
+            error, status = outcome
+            return await self._JSONResponse(error, status_code=status)(scope, receive, send)
+
+        new_token = outcome["new_passport"]
+        scope.setdefault("state", {})["passport"] = outcome
+
+        async def send_with_passport(message):
+            if message["type"] == "http.response.start":
+                headers = self._MutableHeaders(scope=message)
+                headers.append(self.header_name, new_token)
+                headers.append("set-cookie", f"{self.cookie_name}={new_token}; HttpOnly; Path=/; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_passport)
+
+    def cost_of(self, operation):
+        """Price of operation; KeyError/CatalogError if it has none"""
+        if self.costs is not None:
+            return self.costs[operation]
+        return self._get_catalog().cost(self.app_id, operation)
+
+    async def spend(self, passport_token, operation, cost):
+        """Same contract as TokenMiddleware.check_and_spend, without blocking the loop"""
+        if not passport_token:
+            return {"error": "Missing passport"}, 401
+        try:
+            passport = decode(passport_token, self.app_id)
+        except InvalidPassport:
+            return {"error": "Invalid passport"}, 401
+
+        if self.ledger is not None:
+            self._ensure_settler()
+            remaining = await self._in_ledger(self.ledger.debit, passport, cost, operation)
+            if remaining is None:
                 return {"error": "Session budget exceeded"}, 403
-            
-            # Ask central bank to deduct tokens
-            spend_request = {
-                "email": passport["email"],
+            return {"approved": True, "new_passport": passport_token, "remaining_budget": remaining}
+
+        if cost > passport["budget"]:
+            return {"error": "Session budget exceeded"}, 403
+        if not cost:
+            return {"approved": True, "new_passport": passport_token, "remaining_budget": passport["budget"]}
+        try:
+            response = await self._client.post("/spend", json={
+                "email": passport["email"] or "",
+                "passport_id": passport["passport_id"],
                 "app_id": self.app_id,
                 "tokens": cost,
                 "description": operation
-            }
-            
-            response = requests.post(
-                f"{self.dashboard_url}/spend",
-                json=spend_request
-            )
-            
-            if response.status_code == 200:
-                # Update passport budget
-                passport["budget"] -= cost
-                new_token = serializer.dumps(passport, salt=f'passport-{self.app_id}')
-                return {"approved": True, "new_passport": new_token}
-            else:
-                return {"error": "Payment failed"}, 402
-                
-        except:
-            return {"error": "Invalid passport"}, 401
+            })
+        except Exception:
+            return {"error": "Bank unavailable"}, 503
+        if response.status_code != 200:
+            return {"error": "Payment failed"}, 402
+
+        passport["budget"] -= cost
+        new_token = encode(passport)
+        return {"approved": True, "new_passport": new_token, "remaining_budget": passport["budget"]}
+
+    def _ensure_settler(self):
+        if self._settler is None or self._settler.done():
+            self._settler = asyncio.get_running_loop().create_task(self._settle_forever())
+
+    async def settle(self):
+        batch = await self._in_ledger(self.ledger.pending, 100)
+        if not batch:
+            return 0
+        response = await self._client.post("/settle", json={"app_id": self.app_id, "entries": batch},
+                                           headers={"X-App-Key": self.app_key})
+        response.raise_for_status()
+        results = response.json()["results"]
+        await self._in_ledger(self.ledger.reconcile, results)
+        return len(results)
+
+    async def _settle_forever(self):
+        while True:
+            await asyncio.sleep(self.settle_interval)
+            try:
+                while await self.settle() >= 100:
+                    pass
+            except Exception as e:
+                print(f"⚠️ Passport settlement failed, will retry: {e}")
+
+    def _closing_on_shutdown(self, receive):
+        async def receive_or_close():
+            message = await receive()
+            if message["type"] == "lifespan.shutdown":
+                await self.aclose()
+            return message
+        return receive_or_close
+
+    async def aclose(self):
+        """Stop the settler after one last flush, then close the bank client"""
+        if self._settler is not None:
+            self._settler.cancel()
+            try:
+                await self._settler
+            except asyncio.CancelledError:
+                pass
+            self._settler = None
+        if self.ledger is not None:
+            try:
+                while await self.settle() >= 100:
+                    pass
+            except Exception as e:
+                # Still in the ledger: the next start settles them
+                print(f"⚠️ Final passport settlement failed: {e}")
+        await self._client.aclose()
+        self._ledger_executor.shutdown(wait=False)
 
 # Usage in your existing AI app:
 # middleware = TokenMiddleware(app_id="image_generator", dashboard_url="https://dashboard.yoursite.com")
@@ -51,3 +367,7 @@ class TokenMiddleware:
 # if result["approved"]:
 #     # Call AI API
 #     # Update passport token in session
+
+# Or, in an async FastAPI app, charge routes without blocking the event loop:
+# app.add_middleware(TokenASGIMiddleware, app_id="thumbnail_wizard",
+#                    bank_url="https://bank.yoursite.com", routes={("POST", "/analyze"): "analyze"})
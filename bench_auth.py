@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Session token benchmarks.
+
+    python bench_auth.py [sessions] [lookups]
+
+Fills two throwaway databases with the same number of live sessions (default
+1M): one with itsdangerous tokens keyed by their text in magic_links (the old
+scheme), one with opaque tokens keyed by their 16-byte hash in sessions.
+Reports database size and verify_magic_link latency on random tokens.
+"""
+import os
+import random
+import secrets
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shared import auth
+
+BATCH = 50000
+
+
+def build_legacy(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE magic_links
+                    (token TEXT PRIMARY KEY, email TEXT, created DATETIME, used BOOLEAN)''')
+    tokens = []
+    for start in range(0, count, BATCH):
+        rows = []
+        for i in range(start, min(start + BATCH, count)):
+            token = auth.serializer.dumps(f"user{i}@example.com", salt="magic-link")
+            rows.append((token, f"user{i}@example.com", "2026-01-01 00:00:00", False))
+            tokens.append(token)
+        conn.executemany("INSERT INTO magic_links VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    conn.close()
+    return tokens
+
+
+def build_opaque(path, count):
+    conn = sqlite3.connect(path)
+    auth.ensure_sessions_table(conn)
+    now = time.time()
+    tokens = []
+    for start in range(0, count, BATCH):
+        rows = []
+        for i in range(start, min(start + BATCH, count)):
+            token = secrets.token_urlsafe(16)
+            rows.append((auth.token_hash(token), f"user{i}@example.com", now, now + 3600))
+            tokens.append(token)
+        conn.executemany("INSERT INTO sessions (token_hash, email, created, expires) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    conn.close()
+    return tokens
+
+
+def time_verify(path, tokens, lookups):
+    os.environ["BANK_DB_PATH"] = path
+    sample = random.sample(tokens, lookups)
+    auth.verify_magic_link(sample[0], max_age=3600, mark_used=False)  # warm the page cache
+    started = time.perf_counter()
+    for token in sample:
+        assert auth.verify_magic_link(token, max_age=3600, mark_used=False)
+    return (time.perf_counter() - started) / lookups * 1e6
+
+
+def main(count, lookups):
+    workdir = tempfile.mkdtemp()
+    results = {}
+    for label, build in (("itsdangerous + text key", build_legacy), ("opaque + hash key", build_opaque)):
+        path = os.path.join(workdir, f"{build.__name__}.db")
+        started = time.perf_counter()
+        tokens = build(path, count)
+        built = time.perf_counter() - started
+        per_verify = time_verify(path, tokens, lookups)
+        results[label] = per_verify
+        print(f"{label}:")
+        print(f"  token length      {len(tokens[0]):8d} chars")
+        print(f"  database size     {os.path.getsize(path) / 1024 / 1024:8.1f} MB  ({count} sessions, built in {built:.0f}s)")
+        print(f"  verify            {per_verify:8.1f} µs/op  ({lookups} random tokens)")
+    legacy, opaque = results.values()
+    print(f"verify speedup: {legacy / opaque:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Connection-scale test for /balance/events (live dashboard balances).
+
+    python bench_balance_events.py [connections] [users]
+
+Starts platform_app in one uvicorn worker (bank in process, throwaway
+database), opens `connections` SSE streams spread over `users` logged-in
+users and waits for each stream's initial balance. Then:
+- reports the server's RSS growth per idle connection and its CPU use
+  while they sit idle for a few seconds
+- deposits tokens for every user through /bank/deposit (internal route,
+  authenticated with a throwaway BANK_INTERNAL_TOKEN) and measures how
+  long until every stream has seen its new balance (fan-out latency)
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+IDLE_SECONDS = 5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def proc_stat(pid):
+    """(RSS in KB, user+system CPU seconds)"""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return rss, (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class Stream:
+    """One raw SSE connection; remembers the balances it has seen"""
+
+    def __init__(self, port, session_id):
+        self.port = port
+        self.session_id = session_id
+        self.balances = []
+        self.changed = asyncio.Event()
+        self.seen_at = None
+
+    async def run(self, connected):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(f"GET /balance/events HTTP/1.1\r\nHost: bench\r\nCookie: session={self.session_id}\r\n"
+                     "Accept: text/event-stream\r\n\r\n".encode())
+        await writer.drain()
+        try:
+            async for line in reader:
+                if line.startswith(b"data: "):
+                    self.balances.append(json.loads(line[6:])["balance"])
+                    self.seen_at = time.perf_counter()
+                    if len(self.balances) == 1:
+                        connected.release()
+                    self.changed.set()
+        finally:
+            writer.close()
+
+
+async def main(connections, users):
+    env = dict(os.environ, BANK_DB_PATH=tempfile.mkstemp(suffix=".db")[1], DB_COMPACTION_INTERVAL="3600",
+               BANK_INTERNAL_TOKEN=secrets.token_hex(16))
+    os.environ.update(env)
+    import central_bank
+    from shared.session_store import SessionStore, SQLiteSessionBackend
+    from shared.worker_safety import enable_wal
+    enable_wal()  # as serve.py does in production
+    store = SessionStore(SQLiteSessionBackend())
+    emails = [f"user{n}@example.com" for n in range(users)]
+    sessions = {email: store.create(email) for email in emails}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for email in emails:
+            central_bank.get_balance(email)  # existing accounts, 15 tokens each
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "platform_app:app", "--host", "127.0.0.1",
+                               "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+                              env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    tasks = []
+    try:
+        wait_for(port)
+        await asyncio.sleep(1)
+        base_rss, _ = proc_stat(server.pid)
+
+        connected = asyncio.Semaphore(0)
+        streams = [Stream(port, sessions[emails[n % users]]) for n in range(connections)]
+        started = time.perf_counter()
+        for n, stream in enumerate(streams):
+            tasks.append(asyncio.create_task(stream.run(connected)))
+            if n % 200 == 199:
+                await asyncio.sleep(0.05)  # don't overrun the listen backlog
+        for _ in streams:
+            await asyncio.wait_for(connected.acquire(), 60)
+        print(f"{connections} SSE connections over {users} users open in {time.perf_counter() - started:.1f}s")
+
+        rss, cpu = proc_stat(server.pid)
+        await asyncio.sleep(IDLE_SECONDS)
+        _, idle_cpu = proc_stat(server.pid)
+        print(f"  server RSS {base_rss / 1024:.1f} MB -> {rss / 1024:.1f} MB "
+              f"({(rss - base_rss) / connections:.1f} KB per connection)")
+        print(f"  idle CPU over {IDLE_SECONDS}s: {(idle_cpu - cpu) / IDLE_SECONDS * 100:.1f}%")
+
+        import httpx
+        for stream in streams:
+            stream.changed.clear()
+        # Deposits have to happen inside the server process to reach its balance
+        # hub, so they go through the bank's internal route rather than
+        # central_bank.deposit_funds() here
+        from shared.internal_auth import internal_headers
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=internal_headers()) as client:
+            published = time.perf_counter()
+            responses = await asyncio.gather(*(client.post("/bank/deposit", json={"email": email, "tokens": 100,
+                                                                                  "payment_id": "bench"})
+                                               for email in emails))
+        refused = [response.status_code for response in responses if response.status_code != 200]
+        assert not refused, f"deposits refused: {refused[:5]}"
+        await asyncio.wait_for(asyncio.gather(*(stream.changed.wait() for stream in streams)), 60)
+        latencies = sorted(stream.seen_at - published for stream in streams)
+        assert all(stream.balances[-1] == 115 for stream in streams), "a stream missed its deposit"
+        print(f"  {users} deposits -> all {connections} streams updated: "
+              f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms after the first deposit was sent")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 100))
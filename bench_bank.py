@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Bank call benchmarks.
+
+    python bench_bank.py [iterations]
+
+Compares the in-process LocalBankClient with HttpBankClient talking to the
+bank over localhost (uvicorn in a background thread), both on a throwaway
+database.
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+
+import uvicorn
+
+import central_bank
+from shared.bank_client import LocalBankClient, HttpBankClient
+
+EMAIL = "bench@example.com"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_bank_server():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(central_bank.app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def seed(tokens):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (EMAIL, tokens))
+    conn.commit()
+    conn.close()
+
+
+async def time_ops(label, coro_factory, iterations):
+    await coro_factory()  # warm up connections / caches
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await coro_factory()
+    elapsed = time.perf_counter() - started
+    per_op_us = elapsed / iterations * 1e6
+    print(f"  {label:<28} {per_op_us:10.1f} µs/op   {iterations / elapsed:10.0f} ops/s")
+    return per_op_us
+
+
+async def bench_client(name, client, iterations):
+    print(f"{name}:")
+    results = {}
+    results["balance"] = await time_ops("get_balance", lambda: client.get_balance(EMAIL), iterations)
+
+    async def charge():
+        hold = await client.reserve(EMAIL, "bench", 1, "bench")
+        await client.capture(hold["hold_id"])
+
+    results["charge"] = await time_ops("reserve + capture", charge, iterations)
+    return results
+
+
+async def main(iterations):
+    server, base_url = start_bank_server()
+    seed(iterations * 10)
+    local = LocalBankClient()
+    remote = HttpBankClient(base_url=base_url)
+    try:
+        local_results = await bench_client("LocalBankClient (in-process)", local, iterations)
+        remote_results = await bench_client(f"HttpBankClient ({base_url})", remote, iterations)
+    finally:
+        await remote.aclose()
+        server.should_exit = True
+
+    print("speedup (http / local):")
+    for key in local_results:
+        print(f"  {key:<28} {remote_results[key] / local_results[key]:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Token table compaction benchmark.
+
+    python bench_compaction.py [rows] [live fraction]
+
+Builds a throwaway database (incremental auto-vacuum) with a synthetic
+sessions table of `rows` rows (default 3M) of which only `live fraction`
+(default 0.1) are still valid, then runs Compactor passes until nothing is
+left to delete and the free pages are returned. Reports file size, the
+longest single delete batch (how long a login could wait on the lock) and
+live-token lookup latency before and after.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shared.auth import ensure_sessions_table, token_hash
+from shared.db_maintenance import Compactor, table_sizes
+
+BATCH = 100000
+
+
+def build(path, rows, live_fraction):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    ensure_sessions_table(conn)
+    now = time.time()
+    live = []
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(start + BATCH, rows)):
+            token = f"bench-token-{i}"
+            alive = random.random() < live_fraction
+            expires = now + 3600 if alive else now - random.uniform(60, 30 * 86400)
+            batch.append((token_hash(token), f"user{i % 50000}@example.com", expires - 3600, expires))
+            if alive:
+                live.append(token)
+        conn.executemany("INSERT INTO sessions (token_hash, email, created, expires) VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    conn.close()
+    return live
+
+
+def lookup_latency(path, live, samples=20000):
+    # Small page cache so the lookup actually depends on how many pages the table spans
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA cache_size = -2000")
+    now = time.time()
+    timings = []
+    for token in random.choices(live, k=samples):
+        started = time.perf_counter()
+        row = conn.execute("SELECT email, used FROM sessions WHERE token_hash = ? AND expires > ?",
+                           (token_hash(token), now)).fetchone()
+        timings.append(time.perf_counter() - started)
+        assert row
+    conn.close()
+    timings.sort()
+    return statistics.median(timings) * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+def report(label, path, live):
+    conn = sqlite3.connect(path)
+    sizes = table_sizes(conn, detailed=True)
+    conn.close()
+    p50, p99 = lookup_latency(path, live)
+    rows = sizes["tables"]["sessions"]["rows"]
+    print(f"{label}: {rows} rows, file {sizes['file_bytes'] / 1024 / 1024:.1f} MB, "
+          f"lookup p50 {p50:.1f} µs p99 {p99:.1f} µs")
+
+
+def main(rows, live_fraction):
+    path = tempfile.mkstemp(suffix=".db")[1]
+    os.remove(path)
+    started = time.perf_counter()
+    live = build(path, rows, live_fraction)
+    print(f"built {rows} sessions ({len(live)} live) in {time.perf_counter() - started:.0f}s")
+    report("before", path, live)
+
+    compactor = Compactor(db_path=path)
+    started = time.perf_counter()
+    longest = 0.0
+    while True:
+        stats = compactor.run_once(measure=False)
+        longest = max(longest, stats["longest_batch_ms"])
+        if not any(stats["deleted"].values()) and not stats["freed_pages"]:
+            break
+    print(f"compaction: {compactor.deleted_total} rows deleted in {compactor.passes} passes, "
+          f"{time.perf_counter() - started:.1f}s total, longest batch {longest:.1f} ms "
+          f"(batch {compactor.batch_size}, vacuum {compactor.vacuum_pages} pages/pass)")
+    report("after", path, live)
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Bandwidth and CPU of response compression.
+
+    python bench_compression.py [requests]
+
+bodies:  bytes on the wire for a wizard step, the single-page wizard bundle,
+         a ~1500-word result page and the dashboard, uncompressed and in each
+         available encoding, plus the CPU to compress one response at the
+         middleware's level vs. a precompressed cache hit
+/dashboard and /prompt-wizard/step/6: whole routes through clean_app
+         in-process (httpx ASGI transport, throwaway database, logged-in
+         session), with and without Accept-Encoding
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+
+import httpx
+
+import clean_app
+from shared.compression import available_encodings, compress, precompressed
+from shared.session_store import get_session_store
+
+STEP_6 = "/prompt-wizard/step/6?goal=explain&audience=students&depth=balanced&style=direct&tone=friendly"
+
+
+def result_page(words=1500):
+    rng = random.Random(1)
+    vocabulary = ("the prompt model answer example context audience explain step detail clear "
+                  "structure tone result write quickly because users often need simple").split()
+    paragraphs = ["## Optimized prompt"]
+    for _ in range(words // 60):
+        paragraphs.append(" ".join(rng.choice(vocabulary) for _ in range(60)) + ".")
+    answer = "\n\n".join(paragraphs)
+    return clean_app.layout("Result", clean_app.prompt_result_content(
+        answer, "explain", "students", "balanced", "direct", "friendly", "Explain prompts"))
+
+
+def us_per_call(func, calls=200):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def get(client, path, accept_encoding):
+    """(response, raw body); the body is not decoded, so client CPU stays out of the timing"""
+    async with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        assert response.status_code == 200, (path, response.status_code)
+        return response, b"".join([chunk async for chunk in response.aiter_raw()])
+
+
+async def routes(total):
+    session_id = get_session_store().create("bench@example.com")
+    transport = httpx.ASGITransport(app=clean_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app",
+                                 cookies={"session": session_id}) as client:
+        _, dashboard = await get(client, "/dashboard", "identity")
+        for path in ("/dashboard", STEP_6):
+            for _ in range(total // 10):  # warm up
+                await get(client, path, "gzip")
+            # alternate encodings request by request so drift hits both alike
+            elapsed = {"identity": 0.0, "gzip": 0.0}
+            wire = {"identity": 0, "gzip": 0}
+            for _ in range(total):
+                for accept_encoding in elapsed:
+                    started = time.perf_counter()
+                    _, body = await get(client, path, accept_encoding)
+                    elapsed[accept_encoding] += time.perf_counter() - started
+                    wire[accept_encoding] += len(body)
+            for accept_encoding in elapsed:
+                print(f"  {path.split('?')[0]:<24} {accept_encoding:<9} {total / elapsed[accept_encoding]:7.0f} req/s  "
+                      f"{wire[accept_encoding] / total / 1024:5.1f} KB per response")
+    return dashboard
+
+
+def main(total):
+    print(f"GET through clean_app, {total} requests each:")
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        dashboard = asyncio.run(routes(total))
+    print("\n".join(line for line in out.getvalue().splitlines() if line.startswith("  /")))
+
+    bodies = {
+        "wizard step 6": clean_app.PROMPT_WIZARD.render(6, httpx.QueryParams(STEP_6.split("?", 1)[1])),
+        "wizard bundle": clean_app.prompt_wizard_bundle()[0],
+        "result page": result_page(),
+        "dashboard": dashboard.decode(),
+    }
+    print(f"Response bodies (encodings available: {', '.join(available_encodings())}):")
+    for label, body in bodies.items():
+        raw = body.encode()
+        sizes = "  ".join(f"{encoding} {len(compress(raw, encoding)) / 1024:5.1f} KB "
+                          f"({us_per_call(lambda: compress(raw, encoding)):5.0f} µs)"
+                          for encoding in available_encodings())
+        precompressed(body)
+        cached = us_per_call(lambda: precompressed(body), 5000)
+        best = precompressed(body).encoded
+        best_sizes = "  ".join(f"{encoding} {len(data) / 1024:5.1f} KB" for encoding, data in best.items())
+        print(f"  {label:<14} identity {len(raw) / 1024:5.1f} KB  {sizes}  |  precompressed {best_sizes} "
+              f"({cached:.2f} µs per hit)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+/dashboard render cost with and without the cached app grid fragment.
+
+    python bench_dashboard.py [requests] [concurrency]
+
+template: dashboard.html alone, grid rendered every time vs. pasted from
+          render_fragment's cache (µs per render)
+/dashboard: the whole route through clean_app in-process (httpx ASGI
+          transport, throwaway database, logged-in session, handler
+          prints discarded)
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+
+import httpx
+from starlette.requests import Request
+
+import clean_app
+from shared.catalog import get_catalog
+from shared.session_store import get_session_store
+from shared.templates import get_templates, render_fragment
+
+
+def template_us(version, renders):
+    request = Request({"type": "http", "method": "GET", "path": "/dashboard", "headers": [],
+                       "query_string": b"", "router": None})
+    started = time.perf_counter()
+    for _ in range(renders):
+        grid = render_fragment("_app_grid.html", version, apps=get_catalog().apps)
+        get_templates().TemplateResponse("dashboard.html", {
+            "request": request, "user_email": "bench@example.com", "balance": 1450, "app_grid": grid})
+    return (time.perf_counter() - started) / renders * 1e6
+
+
+async def route_rps(total, concurrency):
+    session_id = get_session_store().create("bench@example.com")
+    transport = httpx.ASGITransport(app=clean_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app",
+                                 cookies={"session": session_id}) as client:
+        assert (await client.get("/dashboard")).status_code == 200
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                assert (await client.get("/dashboard")).status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+def main(total, concurrency):
+    print("dashboard.html template, 5000 renders:")
+    for label, version in (("grid every time", None), ("cached grid", get_catalog().version)):
+        print(f"  {label:<16} {template_us(version, 5000):7.1f} µs")
+
+    print(f"GET /dashboard, {total} requests, concurrency {concurrency}:")
+    uncached = lambda name, version, **context: render_fragment(name, None, **context)
+    for label, renderer in (("grid every time", uncached), ("cached grid", render_fragment)):
+        clean_app.render_fragment = renderer
+        with contextlib.redirect_stdout(io.StringIO()):
+            rps = asyncio.run(route_rps(total, concurrency))
+        print(f"  {label:<16} {rps:7.0f} req/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
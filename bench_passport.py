@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Passport charging benchmarks.
+
+    python bench_passport.py [requests] [concurrency]
+    python bench_passport.py codec [iterations]
+
+Drives a stand-in async AI app (one charged route that "calls the model" by
+sleeping 20 ms) with concurrent requests, charging each one through:
+- no charge:   the same app without any passport check, as the ceiling
+- legacy:      blocking requests.post to the bank's /spend inside the handler
+- sync ledger: TokenMiddleware.check_and_spend (local ledger, still blocking)
+- asgi bank:   TokenASGIMiddleware spending over the pooled async client
+- asgi ledger: TokenASGIMiddleware with a SpendLedger
+The bank runs under uvicorn in a background thread on a throwaway database,
+with BANK_RTT (default 10 ms) added to every request to stand in for the
+network between an AI app and the dashboard.
+
+"codec" times passport encode/decode for the v1 itsdangerous format against
+the v2 binary one and prints the token sizes.
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+
+from bench_bank import free_port
+import central_bank
+from ai_app_middleware import TokenMiddleware, TokenASGIMiddleware, SpendLedger
+from shared import passport as passports
+
+APP_ID = "thumbnail_wizard"
+EMAIL = "bench@example.com"
+MODEL_LATENCY = 0.02
+BANK_RTT = float(os.getenv("BANK_RTT", "0.01"))
+
+
+async def remote_bank(scope, receive, send):
+    if scope["type"] == "http":
+        await asyncio.sleep(BANK_RTT)
+    await central_bank.app(scope, receive, send)
+
+
+def start_bank_server():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(remote_bank, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def seed(tokens):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (EMAIL, tokens))
+    conn.commit()
+    conn.close()
+
+
+def make_passport(budget, version=None):
+    token, passport = passports.issue(EMAIL, APP_ID, budget, version=version)
+    central_bank.register_passport(passport)
+    return token
+
+
+def temp_ledger():
+    return SpendLedger(tempfile.mkstemp(suffix=".db")[1])
+
+
+def legacy_app(bank_url):
+    app = FastAPI()
+
+    @app.post("/analyze")
+    async def analyze(request: Request):
+        passport = passports.decode(request.headers["x-passport"], APP_ID)
+        response = requests.post(f"{bank_url}/spend", json={
+            "passport_id": passport["passport_id"], "app_id": APP_ID, "tokens": 4, "description": "analyze"
+        })
+        assert response.status_code == 200
+        passport["budget"] -= 4
+        passports.encode(passport)
+        await asyncio.sleep(MODEL_LATENCY)
+        return {"ok": True}
+
+    return app
+
+
+def sync_ledger_app(bank_url):
+    app = FastAPI()
+    middleware = TokenMiddleware(APP_ID, bank_url, ledger_path=tempfile.mkstemp(suffix=".db")[1],
+                                 start_settler=False)
+
+    @app.post("/analyze")
+    async def analyze(request: Request):
+        result = middleware.check_and_spend(request.headers["x-passport"], "analyze", 4)
+        assert not isinstance(result, tuple), result
+        await asyncio.sleep(MODEL_LATENCY)
+        return {"ok": True}
+
+    return app
+
+
+def asgi_app(bank_url, ledger=None, charged=True):
+    app = FastAPI()
+
+    @app.post("/analyze")
+    async def analyze():
+        await asyncio.sleep(MODEL_LATENCY)
+        return {"ok": True}
+
+    if charged:
+        app.add_middleware(TokenASGIMiddleware, app_id=APP_ID, bank_url=bank_url,
+                           routes={("POST", "/analyze"): "analyze"}, ledger=ledger)
+    return app
+
+
+async def drive(app, total, concurrency):
+    token = make_passport(budget=total * 10)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai-app") as client:
+        await client.post("/analyze", headers={"x-passport": token})  # warm up
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.post("/analyze", headers={"x-passport": token})
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+def main(total, concurrency):
+    server, bank_url = start_bank_server()
+    seed(total * 100)
+    variants = [
+        ("no charge", asgi_app(bank_url, charged=False)),
+        ("legacy", legacy_app(bank_url)),
+        ("sync ledger", sync_ledger_app(bank_url)),
+        ("asgi bank", asgi_app(bank_url)),
+        ("asgi ledger", asgi_app(bank_url, ledger=temp_ledger())),
+    ]
+    print(f"{total} charged requests, concurrency {concurrency}, {MODEL_LATENCY * 1000:.0f} ms model call, "
+          f"{BANK_RTT * 1000:.0f} ms bank round trip:")
+    baseline = None
+    try:
+        for label, app in variants:
+            rps = asyncio.run(drive(app, total, concurrency))
+            baseline = baseline or rps
+            print(f"  {label:<12} {rps:8.0f} req/s   ({rps / baseline:6.1%} of uncharged)")
+    finally:
+        server.should_exit = True
+
+
+def time_op(label, fn, iterations):
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_op_us = (time.perf_counter() - started) / iterations * 1e6
+    print(f"  {label:<24} {per_op_us:8.2f} µs/op")
+    return per_op_us
+
+
+def main_codec(iterations):
+    print(f"passport codec, {iterations} iterations:")
+    results = {}
+    for version in (1, 2):
+        token, passport = passports.issue(EMAIL, APP_ID, 1000, version=version)
+        decoded = passports.decode(token, APP_ID)
+        print(f"v{version}: {len(token)} byte token")
+        results[version] = (
+            time_op(f"v{version} encode", lambda: passports.encode(decoded), iterations),
+            time_op(f"v{version} decode", lambda: passports.decode(token, APP_ID), iterations),
+        )
+    print(f"v2 speedup: encode {results[1][0] / results[2][0]:.1f}x, decode {results[1][1] / results[2][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["codec"]:
+        main_codec(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 50)
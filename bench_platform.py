@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Four servers over localhost HTTP vs. one composed platform_app.
+
+    python bench_platform.py [requests] [concurrency]
+
+separate: clean_app, central_bank, dashboard/app.py and thumbnail_proxy each
+          in their own uvicorn process; clean_app reaches the bank with
+          BANK_CLIENT=http (one extra hop per balance lookup)
+unified:  platform_app in one process, bank calls in process
+
+Drives GET /dashboard (session lookup + balance + render) through the
+front door of each topology and reports req/s, latency and the summed RSS
+of every server process. Throwaway database.
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start(target, port, env):
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning", "--app-dir", ROOT],
+                            env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def separate(env):
+    bank_port, front_port = free_port(), free_port()
+    env = dict(env, BANK_CLIENT="http", CENTRAL_BANK_URL=f"http://127.0.0.1:{bank_port}")
+    servers = [start("central_bank:app", bank_port, env), start("clean_app:app", front_port, env),
+               start("dashboard.app:app", free_port(), env), start("thumbnail_proxy:app", free_port(), env)]
+    wait_for(bank_port)
+    return front_port, servers
+
+
+def unified(env):
+    port = free_port()
+    return port, [start("platform_app:app", port, dict(env, BANK_CLIENT="local"))]
+
+
+async def drive(port, session_id, total, concurrency):
+    import httpx
+    latencies = []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", cookies={"session": session_id},
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        for _ in range(20):  # warm up pools and caches
+            assert (await client.get("/dashboard")).status_code == 200
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get("/dashboard")
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started), latencies
+
+
+def main(total, concurrency):
+    env = dict(os.environ, BANK_DB_PATH=tempfile.mkstemp(suffix=".db")[1], DB_COMPACTION_INTERVAL="3600")
+    os.environ.update(env)
+    from shared.session_store import SessionStore, SQLiteSessionBackend
+    session_id = SessionStore(SQLiteSessionBackend()).create("bench@example.com")
+
+    print(f"GET /dashboard, {total} requests, concurrency {concurrency}:")
+    for label, topology in (("separate", separate), ("unified", unified)):
+        port, servers = topology(env)
+        try:
+            wait_for(port)
+            rps, latencies = asyncio.run(drive(port, session_id, total, concurrency))
+            memory = sum(rss_kb(server.pid) for server in servers) / 1024
+        finally:
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.wait(timeout=30)
+        latencies.sort()
+        print(f"  {label:<9} {len(servers)} process(es)  {rps:7.0f} req/s  "
+              f"p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms  RSS {memory:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+thumbnail_proxy benchmarks against a local upstream.
+
+    python bench_proxy.py [requests] [concurrency]
+    python bench_proxy.py memory
+
+Starts a tiny stand-in thumbnail app and the proxy (both uvicorn, throwaway
+bank database). The default mode compares hitting the upstream directly with
+going through the proxy. "memory" runs the proxy in its own process and
+reports its peak RSS while 1/10/50 MB bodies stream through it both ways.
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+UPSTREAM_PORT = free_port()
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+os.environ["THUMBNAIL_APP_URL"] = f"http://127.0.0.1:{UPSTREAM_PORT}"
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+
+import central_bank
+import thumbnail_proxy
+from shared.session_store import get_session_store
+
+EMAIL = "bench@example.com"
+COOKIES = {}  # dashboard_token, a real session created by seed_bank()
+
+upstream_app = FastAPI()
+SMALL_BODY = b"x" * 1024
+
+
+@upstream_app.get("/thumb")
+async def thumb():
+    return Response(SMALL_BODY, media_type="image/png")
+
+
+@upstream_app.post("/upload")
+async def upload(request: Request):
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+    except ClientDisconnect:
+        pass  # the proxy gave up on an over-limit upload
+    return {"bytes": received}
+
+
+@upstream_app.get("/blob/{size_mb}")
+async def blob(size_mb: int):
+    chunk = b"\0" * (64 * 1024)
+
+    async def body():
+        for _ in range(size_mb * 16):
+            yield chunk
+
+    return StreamingResponse(body(), media_type="application/octet-stream",
+                             headers={"Content-Length": str(size_mb * 1024 * 1024)})
+
+
+def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def seed_bank():
+    central_bank.init_bank()
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (EMAIL, 1000))
+    conn.commit()
+    conn.close()
+    # In the bank database, so the proxy process sees it too
+    COOKIES["dashboard_token"] = get_session_store().create(EMAIL)
+
+
+async def run_load(base_url, path, total, concurrency):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, cookies=COOKIES, limits=limits) as client:
+        await client.get(path)  # warm up
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path)
+                assert response.status_code == 200, response.status_code
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def report(label, result):
+    print(f"  {label:<10} {result['rps']:8.0f} req/s   p50 {result['p50_ms']:7.2f} ms   p99 {result['p99_ms']:7.2f} ms")
+
+
+async def bench_overhead(proxy_url, upstream_url, total, concurrency):
+    print(f"GET /thumb (1 KB), {total} requests, concurrency {concurrency}:")
+    direct = await run_load(upstream_url, "/thumb", total, concurrency)
+    proxied = await run_load(proxy_url, "/thumb", total, concurrency)
+    report("direct", direct)
+    report("proxied", proxied)
+    print(f"  proxy overhead: +{proxied['p50_ms'] - direct['p50_ms']:.2f} ms p50")
+
+    async with httpx.AsyncClient(base_url=proxy_url, cookies=COOKIES) as client:
+        before = (await client.get("/_proxy/metrics")).json()
+        posts = max(1, total // 10)
+        for _ in range(posts):
+            await client.post("/upload", content=SMALL_BODY)
+        after = (await client.get("/_proxy/metrics")).json()
+    print(f"bank checks: {total} page loads + {posts} billable POSTs -> "
+          f"{after['bank_checks'] - before['bank_checks']} bank call(s) "
+          f"({after['auth_cache_hits'] - before['auth_cache_hits']} served from the {after['auth_cache_ttl']:.0f}s cache)")
+
+
+# ---------- memory ----------
+
+def proc_status_kb(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak_rss(pid):
+    """Reset VmHWM so the next reading is the peak of the next test only (Linux)"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def start_proxy_process(port):
+    env = dict(os.environ, PROXY_MAX_BODY_BYTES=str(200 * 1024 * 1024))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "thumbnail_proxy:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "error"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/thumb", cookies=COOKIES, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("proxy did not start")
+
+
+async def upload_body(size_mb):
+    chunk = b"\1" * (64 * 1024)
+    for _ in range(size_mb * 16):
+        yield chunk
+
+
+async def transfer(client, direction, size_mb):
+    if direction == "download":
+        async with client.stream("GET", f"/blob/{size_mb}") as response:
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+        assert received == size_mb * 1024 * 1024, received
+    else:
+        response = await client.post("/upload", content=upload_body(size_mb))
+        assert response.json()["bytes"] == size_mb * 1024 * 1024, response.text
+
+
+async def bench_memory(proxy_url, pid):
+    baseline = proc_status_kb(pid, "VmRSS")
+    resettable = reset_peak_rss(pid)
+    print(f"proxy pid {pid}, idle RSS {baseline / 1024:.1f} MB"
+          + ("" if resettable else " (peak not resettable, readings are cumulative)"))
+    async with httpx.AsyncClient(base_url=proxy_url, cookies=COOKIES, timeout=120) as client:
+        for direction in ("download", "upload"):
+            for size_mb, parallel in ((1, 1), (10, 1), (50, 1), (50, 4)):
+                reset_peak_rss(pid)
+                started = time.perf_counter()
+                await asyncio.gather(*(transfer(client, direction, size_mb) for _ in range(parallel)))
+                elapsed = time.perf_counter() - started
+                peak = proc_status_kb(pid, "VmHWM")
+                moved = size_mb * parallel
+                print(f"  {direction:<8} {parallel} x {size_mb:>2} MB   peak RSS {peak / 1024:6.1f} MB "
+                      f"(+{(peak - baseline) / 1024:5.1f})   {moved / elapsed:7.1f} MB/s")
+
+
+def main_memory():
+    seed_bank()
+    proxy_port = free_port()
+    upstream_server = serve(upstream_app, UPSTREAM_PORT)
+    process = start_proxy_process(proxy_port)
+    try:
+        asyncio.run(bench_memory(f"http://127.0.0.1:{proxy_port}", process.pid))
+    finally:
+        process.terminate()
+        upstream_server.should_exit = True
+
+
+def main(total, concurrency):
+    seed_bank()
+    proxy_port = free_port()
+    servers = [serve(upstream_app, UPSTREAM_PORT), serve(thumbnail_proxy.app, proxy_port)]
+    try:
+        asyncio.run(bench_overhead(f"http://127.0.0.1:{proxy_port}", f"http://127.0.0.1:{UPSTREAM_PORT}",
+                                   total, concurrency))
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["memory"]:
+        main_memory()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 10)
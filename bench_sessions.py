@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Wizard page throughput under the three ways of resolving a session.
+
+    python bench_sessions.py [requests] [concurrency]
+
+Walks /prompt-wizard/step/1..6 through clean_app in-process (httpx ASGI
+transport, throwaway database) with a logged-in session cookie:
+- store, no cache: every request reads web_sessions (what a worker that
+  hasn't seen the session yet pays)
+- store + LRU: the default session store
+- stateless: StatelessSessionMiddleware, signed session_sig cookie
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+
+import httpx
+
+import clean_app
+from shared import session_store
+from shared.session_store import SessionStore, SQLiteSessionBackend, StatelessSessionMiddleware
+
+STEPS = [f"/prompt-wizard/step/{n}" for n in range(1, 7)]
+
+
+async def walk(app, session_id, total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app",
+                                 cookies={"session": session_id}) as client:
+        response = await client.get(STEPS[0])  # warm up (and pick up session_sig if any)
+        assert response.status_code == 200, response.status_code
+        remaining = iter(range(total))
+
+        async def worker():
+            for n in remaining:
+                response = await client.get(STEPS[n % len(STEPS)])
+                assert response.status_code == 200, response.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+def main(total, concurrency):
+    backend = SQLiteSessionBackend()
+    variants = [
+        ("store, no cache", SessionStore(backend, cache_ttl=0), clean_app.app),
+        ("store + LRU", SessionStore(backend), clean_app.app),
+        ("stateless", SessionStore(backend),
+         StatelessSessionMiddleware(clean_app.app, paths=clean_app.STATELESS_PATHS)),
+    ]
+    print(f"/prompt-wizard/step/1..6, {total} requests, concurrency {concurrency}:")
+    baseline = None
+    for label, store, app in variants:
+        session_store._store = store
+        session_id = store.create("bench@example.com")
+        rps = asyncio.run(walk(app, session_id, total, concurrency))
+        baseline = baseline or rps
+        print(f"  {label:<16} {rps:8.0f} req/s  ({rps / baseline:4.2f}x)  session store misses: {store.misses}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Template cost before/after the shared Jinja2 environment.
+
+    python bench_templates.py [renders]
+
+first render: a fresh interpreter (imports done) builds its templates object
+              and renders dashboard.html once (median of 5 processes), with
+              - default: Jinja2Templates(directory=...) as the apps used to
+              - shared, cold: shared.templates with an empty bytecode cache
+              - shared, warm: same, cache filled by an earlier process
+per request:  TemplateResponse("dashboard.html") in a loop, default
+              (auto_reload: stat() per render) vs shared production
+              settings (auto_reload off)
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+CONTEXT = {"user_email": "bench@example.com", "balance": 1450, "apps": [
+    {"name": f"Wizard {n}", "cost": n, "icon": "✨", "status": "ready", "url": f"/w{n}", "description": "Bench"}
+    for n in range(6)]}
+
+FIRST_RENDER = """
+import sys, time
+sys.path.insert(0, {root!r})
+import jinja2
+from starlette.requests import Request
+from starlette.templating import Jinja2Templates
+started = time.perf_counter()  # imports excluded: same for every mode
+if {mode!r} == "default":
+    templates = Jinja2Templates(directory={root!r} + "/dashboard/templates")
+else:
+    from shared.templates import build_templates
+    templates = build_templates(auto_reload=False, cache_dir={cache_dir!r})
+request = Request({{"type": "http", "method": "GET", "path": "/dashboard", "headers": [],
+                   "query_string": b"", "router": None}})
+templates.TemplateResponse("dashboard.html", dict(request=request, **{context!r}))
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def first_render_ms(mode, cache_dir, runs=5):
+    timings = []
+    for _ in range(runs):
+        if mode == "shared, cold":
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        code = FIRST_RENDER.format(root=ROOT, mode=mode, cache_dir=cache_dir, context=CONTEXT)
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def per_request_us(templates, renders):
+    from starlette.requests import Request
+    request = Request({"type": "http", "method": "GET", "path": "/dashboard", "headers": [],
+                       "query_string": b"", "router": None})
+    templates.TemplateResponse("dashboard.html", dict(request=request, **CONTEXT))
+    started = time.perf_counter()
+    for _ in range(renders):
+        templates.TemplateResponse("dashboard.html", dict(request=request, **CONTEXT))
+    return (time.perf_counter() - started) / renders * 1e6
+
+
+def main(renders):
+    from starlette.templating import Jinja2Templates
+    from shared.templates import build_templates
+
+    cache_dir = tempfile.mkdtemp(prefix="jinja-bench-")
+    print("dashboard.html, first render in a new process (median of 5):")
+    for mode in ("default", "shared, cold", "shared, warm"):
+        print(f"  {mode:<13} {first_render_ms(mode, cache_dir):7.1f} ms")
+
+    print(f"dashboard.html, per request ({renders} renders):")
+    default = Jinja2Templates(directory=os.path.join(ROOT, "dashboard", "templates"))
+    shared = build_templates(auto_reload=False, cache_dir=cache_dir)
+    for label, templates in (("default", default), ("shared", shared)):
+        print(f"  {label:<13} {per_request_us(templates, renders):7.1f} µs")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
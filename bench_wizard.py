@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Prompt wizard navigation: six server-rendered steps vs. the single-page bundle.
+
+    python bench_wizard.py [runs]
+
+Walks one wizard to the prompt form `runs` times through clean_app in-process
+(httpx ASGI transport, throwaway database, logged-in session) and reports
+requests, bytes and server time per walk. The final /prompt-wizard/generate
+is the same one request in both modes and is not sent (it calls the LLM).
+Also times the wizard engine's page build alone for the six steps, with its
+page cache and without.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["BANK_DB_PATH"] = tempfile.mkstemp(suffix=".db")[1]
+
+import httpx
+
+import clean_app
+from shared.session_store import get_session_store
+
+STEP_URLS = [
+    "/prompt-wizard/step/1",
+    "/prompt-wizard/step/2?goal=explain",
+    "/prompt-wizard/step/3?goal=explain&audience=students",
+    "/prompt-wizard/step/4?goal=explain&audience=students&depth=balanced",
+    "/prompt-wizard/step/5?goal=explain&audience=students&depth=balanced&style=direct",
+    "/prompt-wizard/step/6?goal=explain&audience=students&depth=balanced&style=direct&tone=friendly",
+]
+
+
+async def walk(runs, urls, headers=None):
+    """(requests, bytes, ms) per walk"""
+    session_id = get_session_store().create("bench@example.com")
+    transport = httpx.ASGITransport(app=clean_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app",
+                                 cookies={"session": session_id}) as client:
+        received = 0
+        started = time.perf_counter()
+        for _ in range(runs):
+            for url in urls:
+                response = await client.get(url, headers=headers)
+                assert response.status_code in (200, 304), (url, response.status_code)
+                received += len(response.content)
+        elapsed = time.perf_counter() - started
+    return len(urls), received / runs, elapsed / runs * 1000
+
+
+def build_us(runs, cached):
+    """µs to build the six step pages once, without HTTP or auth"""
+    wizard = clean_app.PROMPT_WIZARD
+    params = httpx.QueryParams(STEP_URLS[-1].split("?", 1)[1])
+    if cached:
+        render = wizard.render
+    else:
+        render = lambda number, params: wizard._render.__wrapped__(
+            number, tuple(params.get(step.field) for step in wizard.steps[:number - 1]))
+    started = time.perf_counter()
+    for _ in range(runs):
+        for number in range(1, wizard.last + 1):
+            render(number, params)
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def main(runs):
+    _, etag = clean_app.prompt_wizard_bundle()
+    modes = (
+        ("six server steps", STEP_URLS, None),
+        ("bundle, first visit", ["/prompt-wizard/app"], None),
+        ("bundle, revisit (304)", ["/prompt-wizard/app"], {"If-None-Match": etag}),
+    )
+    print(f"Wizard to prompt form, {runs} walks (+1 request for /prompt-wizard/generate in every mode):")
+    for label, urls, headers in modes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            requests, received, ms = asyncio.run(walk(runs, urls, headers))
+        print(f"  {label:<22} {requests} requests  {received / 1024:6.1f} KB  {ms:6.2f} ms server time")
+    print(f"Six step pages built by the wizard engine, {runs * 10} walks:")
+    for label, cached in (("page cache", True), ("rendered every time", False)):
+        print(f"  {label:<22} {build_us(runs * 10, cached):6.1f} µs")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
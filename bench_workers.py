@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+clean_app throughput with 1, 2, 4 and 8 worker processes.
+
+    python bench_workers.py [seconds] [concurrency] [workers...]
+
+Starts serve.py (throwaway WAL database, SQLite session store) for each
+worker count and drives /prompt-wizard/step/1..6 with a logged-in session
+from several client processes, so the load generator isn't the bottleneck
+on a multi-core box. Scaling is bounded by the cores available: on a
+single-core machine all counts land at about the same number.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+STEPS = [f"/prompt-wizard/step/{n}" for n in range(1, 7)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+async def drive(port, session_id, seconds, concurrency):
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                 cookies={"session": session_id}) as client:
+        deadline = time.perf_counter() + seconds
+        done = 0
+
+        async def worker(offset):
+            nonlocal done
+            n = offset
+            while time.perf_counter() < deadline:
+                response = await client.get(STEPS[n % len(STEPS)])
+                assert response.status_code == 200, response.status_code
+                done += 1
+                n += 1
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return done
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def run(workers, seconds, concurrency, session_id, env):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py"), "clean_app:app",
+                               "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        time.sleep(1 + 0.25 * workers)  # let every worker finish its startup hooks
+        clients = max(2, min(workers, os.cpu_count() or 1))
+        per_client = max(1, concurrency // clients)
+        with multiprocessing.Pool(clients) as pool:
+            started = time.perf_counter()
+            total = sum(pool.map(client_process, [(port, session_id, seconds, per_client)] * clients))
+            return total / (time.perf_counter() - started)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(seconds, concurrency, worker_counts):
+    env = dict(os.environ, BANK_DB_PATH=tempfile.mkstemp(suffix=".db")[1], SESSION_BACKEND="sqlite",
+               DB_COMPACTION_INTERVAL="3600")
+    os.environ.update(env)
+    from shared.session_store import SessionStore, SQLiteSessionBackend
+    from shared.worker_safety import enable_wal
+    enable_wal()
+    session_id = SessionStore(SQLiteSessionBackend()).create("bench@example.com")
+
+    print(f"/prompt-wizard/step/1..6, {seconds}s per run, concurrency {concurrency}, "
+          f"{os.cpu_count()} CPU(s):")
+    baseline = None
+    for workers in worker_counts:
+        rps = run(workers, seconds, concurrency, session_id, env)
+        baseline = baseline or rps
+        print(f"  {workers} worker(s)  {rps:8.0f} req/s  ({rps / baseline:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 32,
+         [int(n) for n in sys.argv[3:]] or [1, 2, 4, 8])
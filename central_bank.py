@@ -1,9 +1,14 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel, conint
+import asyncio
 import sqlite3
 import secrets
+import time
 from datetime import datetime, timedelta
 from shared.auth import get_db_path
+from shared.bank_client import InsufficientTokens, HoldNotFound
+from shared.balance_events import balance_hub
+from shared.passport import verify_app_key
 
 app = FastAPI()
 
@@ -16,6 +21,18 @@ def init_bank():
                  (email TEXT PRIMARY KEY, tokens INTEGER DEFAULT 0)''')
     c.execute('''CREATE TABLE IF NOT EXISTS transactions
                  (id TEXT, email TEXT, amount INTEGER, description TEXT, timestamp DATETIME)''')
+    # Tokens reserved for an in-flight operation (already deducted from accounts)
+    c.execute('''CREATE TABLE IF NOT EXISTS holds
+                 (id TEXT PRIMARY KEY, email TEXT, app_id TEXT, amount INTEGER, description TEXT,
+                  status TEXT, created DATETIME, expires REAL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_holds_status_expires ON holds (status, expires)')
+    # Spends reported by AI apps after the fact (passport ledger), deduplicated by id
+    c.execute('''CREATE TABLE IF NOT EXISTS settlements
+                 (id TEXT PRIMARY KEY, passport_id TEXT, email TEXT, app_id TEXT, tokens INTEGER,
+                  status TEXT, created DATETIME)''')
+    # Who each passport belongs to: v2 passports only carry a hash of the email
+    c.execute('''CREATE TABLE IF NOT EXISTS issued_passports
+                 (passport_id TEXT PRIMARY KEY, email TEXT, app_id TEXT, budget INTEGER, expires REAL)''')
     conn.commit()
     conn.close()
 
@@ -23,13 +40,14 @@ init_bank()
 
 class Deposit(BaseModel):
     email: str
-    tokens: int
+    tokens: conint(gt=0)
     payment_id: str  # From Stripe
 
 class SpendRequest(BaseModel):
-    email: str
+    email: str = ""
+    passport_id: str = ""  # instead of email, for v2 passports
     app_id: str
-    tokens: int
+    tokens: conint(gt=0)
     description: str
 
 @app.post("/deposit")
@@ -52,34 +70,327 @@ def deposit_funds(deposit: Deposit):
     
     conn.commit()
     conn.close()
-    return {"status": "deposited", "new_balance": get_balance(deposit.email)}
+    new_balance = get_balance(deposit.email)
+    balance_hub.publish(deposit.email, new_balance, deposit.tokens, "deposit")
+    return {"status": "deposited", "new_balance": new_balance}
 
 @app.post("/spend")
 def spend_tokens(spend: SpendRequest):
     """When an AI app uses tokens"""
+    email = spend.email or passport_email(spend.passport_id)
+    if not email:
+        raise HTTPException(status_code=404, detail="Unknown passport")
+    try:
+        remaining = spend_now(email, spend.app_id, spend.tokens, spend.description)
+    except InsufficientTokens:
+        raise HTTPException(status_code=402, detail="Insufficient tokens")
+    return {"status": "spent", "remaining": remaining}
+
+def spend_now(email: str, app_id: str, tokens: int, description: str) -> int:
+    """Deduct tokens and record the spend. Returns the remaining balance."""
+    if tokens <= 0:
+        raise ValueError("tokens must be > 0")  # a negative spend would mint tokens
     from shared.auth import get_db_path
     conn = sqlite3.connect(get_db_path())   
     c = conn.cursor()
     
-    # Check balance
-    c.execute('SELECT tokens FROM accounts WHERE email = ?', (spend.email,))
-    result = c.fetchone()
-    if not result or result[0] < spend.tokens:
-        raise HTTPException(status_code=402, detail="Insufficient tokens")
-    
-    # Deduct
-    c.execute('UPDATE accounts SET tokens = tokens - ? WHERE email = ?',
-              (spend.tokens, spend.email))
+    # Check balance and deduct in one statement so parallel spends can't overdraw
+    c.execute('UPDATE accounts SET tokens = tokens - ? WHERE email = ? AND tokens >= ?',
+              (tokens, email, tokens))
+    if c.rowcount == 0:
+        conn.close()
+        raise InsufficientTokens(email)
     
     # Record spend
     tx_id = secrets.token_hex(8)
     c.execute('INSERT INTO transactions VALUES (?, ?, ?, ?, ?)',
-              (tx_id, spend.email, -spend.tokens, 
-               f"{spend.app_id}: {spend.description}", datetime.utcnow()))
+              (tx_id, email, -tokens, 
+               f"{app_id}: {description}", datetime.utcnow()))
+    c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
+    remaining = c.fetchone()[0]
     
     conn.commit()
     conn.close()
-    return {"status": "spent", "remaining": get_balance(spend.email)}
+    balance_hub.publish(email, remaining, -tokens, app_id)
+    return remaining
+
+@app.get("/balance")
+def balance(email: str):
+    return {"email": email, "balance": get_balance(email)}
+
+# ==================== TOKEN HOLDS ====================
+# reserve -> tokens leave the balance immediately (one transaction)
+# capture -> the hold becomes a real spend in transactions
+# release -> tokens go back to the balance (also done automatically on expiry)
+
+HOLD_TTL_SECONDS = 300
+MAX_HOLD_TTL_SECONDS = 3600  # a hold is for one operation, not a standing reservation
+
+class HoldRequest(BaseModel):
+    email: str
+    app_id: str
+    tokens: conint(gt=0)
+    description: str = ""
+    ttl_seconds: conint(gt=0, le=MAX_HOLD_TTL_SECONDS) = HOLD_TTL_SECONDS
+
+def _hold_connection():
+    from shared.auth import get_db_path
+    # Autocommit mode so we control BEGIN IMMEDIATE ourselves
+    return sqlite3.connect(get_db_path(), timeout=10, isolation_level=None)
+
+def reserve_tokens(email: str, tokens: int, app_id: str, description: str = "",
+                   ttl_seconds: int = HOLD_TTL_SECONDS) -> dict:
+    """Deduct tokens into a hold. Raises InsufficientTokens if the balance can't cover it."""
+    if tokens < 0:
+        raise ValueError("tokens must be >= 0")
+    hold_id = secrets.token_hex(12)
+    expires = time.time() + ttl_seconds
+    
+    conn = _hold_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('UPDATE accounts SET tokens = tokens - ? WHERE email = ? AND tokens >= ?',
+                  (tokens, email, tokens))
+        if c.rowcount == 0:
+            c.execute('ROLLBACK')
+            raise InsufficientTokens(email)
+        c.execute('INSERT INTO holds VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                  (hold_id, email, app_id, tokens, description, "held", datetime.utcnow(), expires))
+        c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
+        remaining = c.fetchone()[0]
+        c.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    
+    balance_hub.publish(email, remaining, -tokens, app_id)
+    return {"hold_id": hold_id, "tokens": tokens, "expires_at": expires, "remaining": remaining}
+
+def _balance_if_watched(c, email):
+    """Balance inside the current transaction, only if a dashboard is listening"""
+    if not balance_hub.watching(email):
+        return None
+    c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def _settle_hold(hold_id: str, capture: bool) -> dict:
+    refunded = None
+    expired = False
+    conn = _hold_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT email, app_id, amount, description, expires FROM holds WHERE id = ? AND status = ?',
+                  (hold_id, "held"))
+        hold = c.fetchone()
+        if not hold:
+            c.execute('ROLLBACK')
+            raise HoldNotFound(hold_id)
+        email, app_id, amount, description, expires = hold
+        
+        if capture and expires < time.time():
+            # Past its expiry the hold is the sweeper's: refund it instead of charging late
+            expired = True
+            c.execute('UPDATE holds SET status = ? WHERE id = ?', ("expired", hold_id))
+            c.execute('UPDATE accounts SET tokens = tokens + ? WHERE email = ?', (amount, email))
+            refunded = _balance_if_watched(c, email)
+        elif capture:
+            c.execute('UPDATE holds SET status = ? WHERE id = ?', ("captured", hold_id))
+            c.execute('INSERT INTO transactions VALUES (?, ?, ?, ?, ?)',
+                      (secrets.token_hex(8), email, -amount, f"{app_id}: {description}", datetime.utcnow()))
+        else:
+            c.execute('UPDATE holds SET status = ? WHERE id = ?', ("released", hold_id))
+            c.execute('UPDATE accounts SET tokens = tokens + ? WHERE email = ?', (amount, email))
+            refunded = _balance_if_watched(c, email)
+        c.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    
+    if refunded is not None:
+        balance_hub.publish(email, refunded, amount, "expired hold" if expired else "refund")
+    if expired:
+        raise HoldNotFound(hold_id)
+    return {"hold_id": hold_id, "status": "captured" if capture else "released", "tokens": amount}
+
+def capture_hold(hold_id: str) -> dict:
+    """Turn a hold into a recorded spend"""
+    return _settle_hold(hold_id, capture=True)
+
+def release_hold(hold_id: str) -> dict:
+    """Give held tokens back"""
+    return _settle_hold(hold_id, capture=False)
+
+def expire_holds() -> int:
+    """Release every hold past its expiry. Returns how many were released."""
+    conn = _hold_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT id, email, amount FROM holds WHERE status = ? AND expires < ?',
+                  ("held", time.time()))
+        expired = c.fetchall()
+        refunds = {}
+        for hold_id, email, amount in expired:
+            c.execute('UPDATE holds SET status = ? WHERE id = ?', ("expired", hold_id))
+            c.execute('UPDATE accounts SET tokens = tokens + ? WHERE email = ?', (amount, email))
+            refunds[email] = refunds.get(email, 0) + amount
+        balances = {email: _balance_if_watched(c, email) for email in refunds}
+        c.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    
+    for email, balance in balances.items():
+        if balance is not None:
+            balance_hub.publish(email, balance, refunds[email], "expired hold")
+    if expired:
+        print(f"⏰ Released {len(expired)} expired hold(s)")
+    return len(expired)
+
+@app.post("/holds")
+def create_hold(hold: HoldRequest):
+    """Reserve tokens for an operation that is about to run"""
+    try:
+        return reserve_tokens(hold.email, hold.tokens, hold.app_id, hold.description, hold.ttl_seconds)
+    except InsufficientTokens:
+        raise HTTPException(status_code=402, detail="Insufficient tokens")
+
+@app.post("/holds/{hold_id}/capture")
+def capture_hold_route(hold_id: str):
+    try:
+        return capture_hold(hold_id)
+    except HoldNotFound:
+        raise HTTPException(status_code=404, detail="Hold not found or already settled")
+
+@app.post("/holds/{hold_id}/release")
+def release_hold_route(hold_id: str):
+    try:
+        return release_hold(hold_id)
+    except HoldNotFound:
+        raise HTTPException(status_code=404, detail="Hold not found or already settled")
+
+# ==================== PASSPORT SETTLEMENT ====================
+# AI apps debit passports locally (ai_app_middleware.SpendLedger) and report
+# the spends here in batches. Each entry id is applied at most once.
+
+class SettlementEntry(BaseModel):
+    id: str
+    passport_id: str
+    email: str | None = None  # v2 passports: looked up from issued_passports
+    tokens: conint(gt=0)
+    description: str = ""
+
+class SettlementBatch(BaseModel):
+    app_id: str
+    entries: list[SettlementEntry]
+
+def settle_spends(app_id: str, entries: list) -> dict:
+    """Apply a batch of offline spends. Returns {entry id: settled|duplicate|rejected}.
+
+    A batch with any non-positive amount is refused as a whole (ValueError);
+    spends on a passport issued to another app are rejected.
+    """
+    invalid = [entry.id for entry in entries if entry.tokens <= 0]
+    if invalid:
+        raise ValueError(f"Settlement amounts must be positive: {', '.join(invalid)}")
+    results = {}
+    settled = {}  # email -> tokens, for the balance events
+    conn = _hold_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        for entry in entries:
+            c.execute('SELECT status FROM settlements WHERE id = ?', (entry.id,))
+            previous = c.fetchone()
+            if previous:
+                # Retried batch (e.g. the response got lost) - report the original verdict
+                results[entry.id] = "duplicate" if previous[0] == "settled" else previous[0]
+                continue
+            
+            c.execute('SELECT email, app_id FROM issued_passports WHERE passport_id = ?', (entry.passport_id,))
+            issued = c.fetchone()
+            email = issued[0] if issued else entry.email
+            if issued and issued[1] != app_id:
+                email = None  # another app's passport: nothing to charge
+            c.execute('UPDATE accounts SET tokens = tokens - ? WHERE email = ? AND tokens >= ?',
+                      (entry.tokens, email, entry.tokens))
+            status = "settled" if c.rowcount else "rejected"
+            if status == "settled":
+                settled[email] = settled.get(email, 0) + entry.tokens
+            c.execute('INSERT INTO settlements VALUES (?, ?, ?, ?, ?, ?, ?)',
+                      (entry.id, entry.passport_id, email, app_id, entry.tokens, status, datetime.utcnow()))
+            if status == "settled":
+                c.execute('INSERT INTO transactions VALUES (?, ?, ?, ?, ?)',
+                          (entry.id, email, -entry.tokens, f"{app_id}: {entry.description}", datetime.utcnow()))
+            results[entry.id] = status
+        balances = {email: _balance_if_watched(c, email) for email in settled}
+        c.execute('COMMIT')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    for email, balance in balances.items():
+        if balance is not None:
+            balance_hub.publish(email, balance, -settled[email], app_id)
+    return results
+
+def register_passport(passport: dict):
+    """Remember who a newly issued passport belongs to"""
+    register_passports([passport])
+
+def register_passports(passports: list):
+    """Same as register_passport for a batch, in one transaction"""
+    conn = sqlite3.connect(get_db_path())
+    conn.executemany('INSERT OR REPLACE INTO issued_passports VALUES (?, ?, ?, ?, ?)',
+                     [(p["passport_id"], p["email"], p["app_id"], p["budget"], p["expires"])
+                      for p in passports])
+    conn.commit()
+    conn.close()
+
+def passport_email(passport_id: str):
+    if not passport_id:
+        return None
+    conn = sqlite3.connect(get_db_path())
+    row = conn.execute('SELECT email FROM issued_passports WHERE passport_id = ?', (passport_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+@app.post("/settle")
+def settle(batch: SettlementBatch, x_app_key: str = Header("")):
+    """Batch settlement endpoint for passport-ledger spends; apps sign in with their app key"""
+    if not verify_app_key(batch.app_id, x_app_key):
+        raise HTTPException(status_code=401, detail="Invalid app credentials")
+    try:
+        return {"results": settle_spends(batch.app_id, batch.entries)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _expire_holds_forever(interval=30):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(expire_holds)
+        except Exception as e:
+            print(f"⚠️ Hold expiry sweep failed: {e}")
+
+@app.on_event("startup")
+async def start_hold_sweeper():
+    expire_holds()
+    asyncio.create_task(_expire_holds_forever())
 
 def get_balance(email: str) -> int:
     from shared.auth import get_db_path
@@ -93,11 +404,14 @@ def get_balance(email: str) -> int:
     if result:
         balance = result[0]
     else:
-        # Create account with free plan tokens (15)
-        c.execute('INSERT INTO accounts (email, tokens) VALUES (?, ?)', (email, 15))
+        # Create account with free plan tokens (15); a concurrent first read may have won
+        c.execute('INSERT OR IGNORE INTO accounts (email, tokens) VALUES (?, ?)', (email, 15))
+        created = c.rowcount
         conn.commit()
-        balance = 15
-        print(f"💰 Created new account for {email} with {balance} tokens")
+        c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
+        balance = c.fetchone()[0]
+        if created:
+            print(f"💰 Created new account for {email} with {balance} tokens")
     
     conn.close()
     return balance
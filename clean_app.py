@@ -1,20 +1,56 @@
 # clean_app.py
+if __name__ == "__main__":
+    # Run as a script: .env must be loaded before the imports below read their
+    # settings (serve.py and `uvicorn --env-file .env` do the same)
+    from dotenv import load_dotenv
+    load_dotenv()
+
 from fastapi import FastAPI, Request, Cookie, Form, Query
-from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse, Response
 from shared.auth import verify_magic_link
-from dotenv import load_dotenv
-from requests.exceptions import Timeout, ConnectionError
-import requests
+from shared.session_store import (get_session_store, session_email, request_email, signed_cookies,
+                                  StatelessSessionMiddleware, STATELESS_SESSIONS, SIGNED_COOKIE)
+from shared.llm_client import get_llm_client, LLMError, CircuitOpenError
+from shared.job_queue import JobQueue, WorkerPool, DONE, FAILED
+from shared.bank_client import get_bank_client, BankError
+from shared.db_maintenance import Compactor
+from shared.templates import get_templates, precompile, render_fragment
+from shared.catalog import get_catalog, watch_catalog
+from shared.compression import CompressionMiddleware, precompressed_response
+from shared.wizard import Wizard, Step, Option, FORM_FIELDS, BACK, checked
+from shared.balance_events import (balance_hub, HEARTBEAT_INTERVAL as BALANCE_HEARTBEAT_INTERVAL,
+                                   RESYNC_INTERVAL as BALANCE_RESYNC_INTERVAL)
 import os
 import html
+import json
+import asyncio
+import functools
+import hashlib
 import re
+from urllib.parse import quote
 
 app = FastAPI()
-template_dir = os.path.join(os.path.dirname(__file__), "dashboard", "templates")
-templates = Jinja2Templates(directory=template_dir)
-
-load_dotenv()
+# Read-only pages whose auth can come from the signed session cookie alone
+STATELESS_PATHS = ("/prompt-wizard/step/", "/prompt-wizard/app", "/prompt-wizard/intro", "/settings")
+# PROMPT_WIZARD_SPA=1 sends the wizard to the single-page version (/prompt-wizard/app)
+WIZARD_SPA = os.getenv("PROMPT_WIZARD_SPA", "0") == "1"
+if STATELESS_SESSIONS:
+    app.add_middleware(StatelessSessionMiddleware, paths=STATELESS_PATHS)
+app.add_middleware(CompressionMiddleware)
+# Keep import free of side effects (cold starts): the route listing happens
+# when the server actually starts. .env is loaded by the entry points
+# (serve.py, __main__, uvicorn --env-file) before this module is imported.
+@app.on_event("startup")
+async def list_routes():
+    print("✅ ROUTES REGISTERED:")
+    for route in app.routes:
+        if hasattr(route, "path"):
+            print(f"  {route.path}")
+
+@app.on_event("startup")
+async def warm_templates():
+    stats = await asyncio.to_thread(precompile)
+    print(f"🧩 Precompiled {stats['templates']} templates in {stats['seconds']}s")
 
 # ==================== PROMPT WIZARD ROUTES BEGIN ====================
 
@@ -66,33 +102,19 @@ Generate a detailed, comprehensive answer suitable for a {depth}-level audience.
 
 Final answer:"""
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 2500
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
     
     try:
-        response = requests.post(
-            "https://api.deepseek.com/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=45
-        )
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"].strip()
-        else:
-            return f"## API Error {response.status_code}\n{response.text}"
+        return get_llm_client().chat(messages, api_key, temperature=0.7, max_tokens=2500)
+    except CircuitOpenError:
+        return "## Error: The AI service is temporarily unavailable. Please try again in a minute."
+    except LLMError as e:
+        if e.status_code:
+            return f"## API Error {e.status_code}\n{e}"
+        return f"## Error: {str(e)}"
     except Exception as e:
         return f"## Error: {str(e)}"
 
@@ -137,6 +159,100 @@ ICON_MAP = {
     "humorous": "fa-solid fa-face-laugh-beam",
 }
 
+# ========== PROMPT WIZARD DEFINITION ==========
+# The steps, their options and the final form; icons come from ICON_MAP.
+# Both the server-rendered steps and the single-page bundle are built from it.
+PROMPT_WIZARD_STEPS = (
+    Step("goal", "Goal", "What's your goal?", "What do you want the AI to help you with?", (
+        Option("explain", "Explain", "Break down complex topics"),
+        Option("create", "Create", "Generate content or ideas"),
+        Option("analyze", "Analyze", "Review data or text"),
+        Option("solve", "Solve", "Find solutions to problems"),
+        Option("brainstorm", "Brainstorm", "Generate possibilities"),
+        Option("edit", "Edit/Improve", "Refine existing content"),
+    )),
+    Step("audience", "Audience", "Who is your audience?", "Who will read or use this output?", (
+        Option("general", "General Public", "Anyone without specific expertise"),
+        Option("experts", "Experts", "People with deep knowledge"),
+        Option("students", "Students", "Learners at various levels"),
+        Option("business", "Business", "Professionals, clients, stakeholders"),
+        Option("technical", "Technical", "Developers, engineers, scientists"),
+        Option("beginners", "Beginners", "New to the topic, need basics"),
+    )),
+    Step("depth", "Depth", "How detailed do you want the response?", "Choose the depth of the AI's answer", (
+        Option("quick", "Quick Answer", "Concise, to‑the‑point"),
+        Option("balanced", "Balanced", "Clear explanation with examples"),
+        Option("comprehensive", "Comprehensive", "Step‑by‑step, includes tips & mistakes", checks="background"),
+        Option("expert", "Expert Deep Dive", "Advanced techniques, frameworks, citations", checks="background"),
+    ), default="balanced"),
+    Step("style", "Style", "What style do you prefer?", "How should the AI structure its response?", (
+        Option("direct", "Direct", "Straight to the point"),
+        Option("structured", "Structured", "Organized with headings"),
+        Option("creative", "Creative", "Imaginative, free-flowing"),
+        Option("technical", "Technical", "Detailed with specifications"),
+        Option("conversational", "Conversational", "Natural, chat-like"),
+        Option("step-by-step", "Step-by-Step", "Guided instructions"),
+    )),
+    Step("tone", "Tone", "What tone should it use?", "The overall mood or attitude of the response", (
+        Option("professional", "Professional", "Formal, business-appropriate"),
+        Option("friendly", "Friendly", "Warm, approachable, casual"),
+        Option("authoritative", "Authoritative", "Confident, expert-like"),
+        Option("enthusiastic", "Enthusiastic", "Energetic, passionate"),
+        Option("neutral", "Neutral", "Objective, unbiased"),
+        Option("humorous", "Humorous", "Funny, lighthearted"),
+    )),
+)
+
+PROMPT_WIZARD_FORM = f'''
+        <form action="/prompt-wizard/generate" method="get">
+            {FORM_FIELDS}
+            <div class="grid">
+                <div>
+                    <label for="user_prompt">
+                        <h3>Your Original Prompt:</h3>
+                        <p>Type what you'd normally ask the AI</p>
+                    </label>
+                    <textarea
+                        id="user_prompt"
+                        name="prompt"
+                        rows="8"
+                        placeholder="Example: 'Explain quantum computing like I'm 5' or 'Write a blog post about climate change'"
+                        required
+                        style="font-size: 1rem; padding: 1rem;"
+                    ></textarea>
+                </div>
+
+                <div>
+                    <h3>Tips for Great Prompts:</h3>
+                    <div class="card" style="height: 100%;">
+                        <ul style="margin: 0; padding-left: 1.5rem;">
+                            <li>Be specific about what you want</li>
+                            <li>Include context when relevant</li>
+                            <li>Mention length or format if needed</li>
+                            <li>Add examples if helpful</li>
+                            <li>Don't worry about perfection – AI will optimize it!</li>
+                        </ul>
+                    </div>
+                </div>
+            </div>
+
+            <label style="margin-top: 1rem;">
+                <input type="checkbox" name="background" value="true"{checked("background")}>
+                Generate in the background (recommended for long answers - you get a page to check back on)
+            </label>
+
+            <div style="text-align: center; margin-top: 2rem;">
+                <button type="submit" class="primary" style="padding: 1rem 2rem; font-size: 1.1rem;">
+                    <i class="fas fa-magic"></i> Generate Optimized Prompt
+                </button>
+
+                <a href="{BACK}" class="secondary" style="margin-left: 1rem;">
+                    <i class="fas fa-arrow-left"></i> Back
+                </a>
+            </div>
+        </form>
+'''
+
 def format_ai_output(raw_text):
     """Convert basic Markdown and code fences to HTML."""
     if not raw_text:
@@ -168,22 +284,15 @@ async def prompt_wizard_intro(request: Request, session: str = Cookie(default=No
     if not session:
         return RedirectResponse("/login?next=/prompt-wizard/intro")
     
-    email = verify_magic_link(session, mark_used=False)
+    email = request_email(request, session)
     if not email:
         return RedirectResponse("/login")
     
-    return templates.TemplateResponse("prompt_wizard_intro.html", {
+    return get_templates().TemplateResponse("prompt_wizard_intro.html", {
         "request": request,
         "user_email": email
     })
 
-print("=" * 60)
-print("✅ ROUTES REGISTERED:")
-for route in app.routes:
-    if hasattr(route, "path"):
-        print(f"  {route.path}")
-print("=" * 60)
-
 @app.get("/prompt-wizard/generate", response_class=HTMLResponse)
 async def generate_optimized_prompt(
     request: Request,
@@ -193,22 +302,33 @@ async def generate_optimized_prompt(
     style: str,
     tone: str,
     prompt: str,
+    background: bool = False,
     session: str = Cookie(default=None)
 ):
     """Generate the final optimized prompt"""
     # Auth
     if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/generate?goal={goal}&audience={audience}&platform={platform}&style={style}&tone={tone}&prompt={prompt}")
-    email = verify_magic_link(session, mark_used=False)
+        return RedirectResponse(f"/login?next=/prompt-wizard/generate?goal={goal}&audience={audience}&depth={depth}&style={style}&tone={tone}&prompt={prompt}")
+    email = session_email(session)
     if not email:
         return RedirectResponse("/login")
 
     # TODO: Add token check/deduction here (optional for now)
 
-    # Call DeepSeek
-    optimized = call_deepseek_for_prompt(goal, audience, depth, style, tone, prompt)
+    params = {"goal": goal, "audience": audience, "depth": depth, "style": style, "tone": tone, "prompt": prompt}
+
+    # Long generations: hand off to the job queue and show the job page right away
+    if background:
+        job_id = get_job_queue().enqueue("prompt_wizard", params, email=email)
+        return RedirectResponse(f"/jobs/{job_id}", status_code=303)
+
+    # Call DeepSeek on a worker thread: retries sleep, and a call can take up to LLM_DEADLINE
+    optimized = await asyncio.to_thread(call_deepseek_for_prompt, goal, audience, depth, style, tone, prompt)
 
-    # Result page
+    return layout("Generated Prompt", prompt_result_content(optimized, **params))
+
+def prompt_result_content(optimized, goal, audience, depth, style, tone, prompt):
+    """Result page body for a finished generation"""
     content = f'''
     <article>
         <header style="text-align: center; margin-bottom: 2rem;">
@@ -305,512 +425,337 @@ async def generate_optimized_prompt(
     </article>
     '''
 
-    return layout("Generated Prompt", content)
-
-@app.get("/prompt-wizard/step/1", response_class=HTMLResponse)
-async def prompt_wizard_step1(request: Request, session: str = Cookie(default=None)):
-    """Step 1: Goal selection with visual cards"""
-    # Auth check
+    return content
+
+# ========== BACKGROUND GENERATION JOBS ==========
+
+_job_queue = None
+_job_workers = None
+# Every worker runs its own pool and compactor loop against the shared database
+WORKER_LOCAL = ("_job_workers", "compactor")
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+def run_prompt_wizard_job(params):
+    """Job handler: same DeepSeek call as the inline route, run on a worker thread"""
+    return call_deepseek_for_prompt(
+        params["goal"], params["audience"], params["depth"],
+        params["style"], params["tone"], params["prompt"]
+    )
+
+JOB_HANDLERS = {"prompt_wizard": run_prompt_wizard_job}
+
+@app.on_event("startup")
+async def start_job_workers():
+    global _job_workers
+    _job_workers = WorkerPool(get_job_queue(), JOB_HANDLERS)
+    _job_workers.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if _job_workers:
+        _job_workers.stop()
+
+# ========== DATABASE HOUSEKEEPING ==========
+
+compactor = None  # created at startup: it resolves the database path
+
+_catalog_watcher = None  # asyncio.Task, cancelled on shutdown
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    global _catalog_watcher
+    get_catalog()
+    _catalog_watcher = asyncio.create_task(watch_catalog())
+
+@app.on_event("shutdown")
+async def stop_catalog_watcher():
+    global _catalog_watcher
+    if _catalog_watcher:
+        _catalog_watcher.cancel()
+        await asyncio.gather(_catalog_watcher, return_exceptions=True)
+        _catalog_watcher = None
+
+_compactor_task = None  # asyncio.Task, cancelled on shutdown
+
+@app.on_event("startup")
+async def start_compactor():
+    global compactor, _compactor_task
+    compactor = Compactor()
+    # Every worker runs this loop; only the one holding the lease compacts
+    _compactor_task = asyncio.create_task(compactor.run_forever())
+
+@app.on_event("shutdown")
+async def stop_compactor():
+    global _compactor_task
+    if _compactor_task:
+        _compactor_task.cancel()
+        await asyncio.gather(_compactor_task, return_exceptions=True)
+        _compactor_task = None
+
+def load_user_job(job_id, session):
+    """Return the job if the session owns it, else None"""
     if not session:
-        return RedirectResponse("/login?next=/prompt-wizard/step/1")
-    email = verify_magic_link(session, mark_used=False)
-    if not email:
-        return RedirectResponse("/login")
-
-    goals = [
-        ("explain", "Explain", "Break down complex topics"),
-        ("create", "Create", "Generate content or ideas"),
-        ("analyze", "Analyze", "Review data or text"),
-        ("solve", "Solve", "Find solutions to problems"),
-        ("brainstorm", "Brainstorm", "Generate possibilities"),
-        ("edit", "Edit/Improve", "Refine existing content"),
-    ]
-
-    goal_cards = ""
-    for value, label, description in goals:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        goal_cards += f'''
-        <a href="/prompt-wizard/step/2?goal={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3>{label}</h3>
-            <p>{description}</p>
-        </a>
-        '''
-
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 1: What's your goal?</h1>
-                <p>What do you want the AI to help you with?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill" style="width: 16.6% !important;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step active">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Depth</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {goal_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/dashboard" class="secondary">
-                <i class="fas fa-home"></i> Back to Dashboard
-            </a>
-        </div>
-    </article>
-    '''
-
-    # Use the layout function you already have in clean_app.py
-    return layout("Step 1: Goal Selection", content)
-
-
-
-@app.get("/prompt-wizard/step/2", response_class=HTMLResponse)
-async def prompt_wizard_step2(request: Request, goal: str = "explain", session: str = Cookie(default=None)):
-    """Step 2: Audience selection"""
-    # Auth check
+        return None
+    email = session_email(session)
+    job = get_job_queue().get(job_id)
+    if not email or not job or job["email"] != email:
+        return None
+    return job
+
+@app.get("/jobs/{job_id}/status")
+async def job_status(job_id: str, session: str = Cookie(default=None)):
+    """Polling endpoint for a background generation"""
+    job = load_user_job(job_id, session)
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return {"id": job_id, "status": job["status"], "error": job["error"]}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, session: str = Cookie(default=None)):
+    """Server-sent events: pushes the job status until it finishes"""
+    job = load_user_job(job_id, session)
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def stream():
+        last_status = None
+        while True:
+            current = await asyncio.to_thread(get_job_queue().get, job_id)
+            if current is None:
+                # Deleted (e.g. compacted) while we were watching
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield f"event: status\ndata: {json.dumps({'status': last_status})}\n\n"
+            if last_status in (DONE, FAILED):
+                return
+            await asyncio.sleep(1.0)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}", response_class=HTMLResponse)
+async def job_page(job_id: str, session: str = Cookie(default=None)):
+    """Job page: result when finished, otherwise a waiting page that subscribes for completion"""
     if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/step/2?goal={goal}")
-    email = verify_magic_link(session, mark_used=False)
-    if not email:
-        return RedirectResponse("/login")
-
-    audiences = [
-        ("general", "General Public", "Anyone without specific expertise"),
-        ("experts", "Experts", "People with deep knowledge"),
-        ("students", "Students", "Learners at various levels"),
-        ("business", "Business", "Professionals, clients, stakeholders"),
-        ("technical", "Technical", "Developers, engineers, scientists"),
-        ("beginners", "Beginners", "New to the topic, need basics"),
-    ]
-
-    audience_cards = ""
-    for value, label, description in audiences:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        audience_cards += f'''
-        <a href="/prompt-wizard/step/3?goal={goal}&audience={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3>{label}</h3>
-            <p>{description}</p>
-        </a>
-        '''
+        return RedirectResponse(f"/login?next=/jobs/{job_id}")
+    job = load_user_job(job_id, session)
+    if not job:
+        return layout("Job not found", "<article><h2>Job not found</h2><a href=\"/prompt-wizard/step/1\">Start again</a></article>")
+
+    if job["status"] == DONE:
+        return layout("Generated Prompt", prompt_result_content(job["result"], **job["payload"]))
+
+    if job["status"] == FAILED:
+        return layout("Generation failed", f'''
+    <article style="text-align: center;">
+        <h2><i class="fas fa-triangle-exclamation"></i> Generation failed</h2>
+        <p>{html.escape(job["error"] or "Unknown error")}</p>
+        <a href="/prompt-wizard/step/1" class="primary">Try again</a>
+    </article>
+    ''')
 
     content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 2: Who is your audience?</h1>
-                <p>Who will read or use this output?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill" style="width: 33% !important;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step active">2. Audience</div>
-                    <div class="progress-step">3. Depth</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected Goal:</strong> {goal.capitalize()}</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {audience_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/1" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 1
-            </a>
-        </div>
+    <article style="text-align: center;">
+        <h1><i class="fas fa-hourglass-half" style="color: var(--primary);"></i> Generating your answer...</h1>
+        <p id="job-status">Status: {job["status"]}</p>
+        <p><small>You can leave this page open - it will update by itself. Bookmark it to come back later.</small></p>
+        <noscript><meta http-equiv="refresh" content="5"></noscript>
     </article>
+    <script>
+    (function() {{
+        function finish(status) {{
+            document.getElementById('job-status').textContent = 'Status: ' + status;
+            if (status === 'done' || status === 'failed') window.location.reload();
+        }}
+        if (window.EventSource) {{
+            const events = new EventSource('/jobs/{job_id}/events');
+            events.addEventListener('status', e => finish(JSON.parse(e.data).status));
+            events.onerror = () => {{ events.close(); setTimeout(() => window.location.reload(), 5000); }};
+        }} else {{
+            setInterval(() => fetch('/jobs/{job_id}/status').then(r => r.json()).then(d => finish(d.status)), 3000);
+        }}
+    }})();
+    </script>
     '''
+    return layout("Generating...", content)
 
-    return layout("Step 2: Audience Selection", content)
-
-@app.get("/prompt-wizard/step/3", response_class=HTMLResponse)
-async def prompt_wizard_step3(
-    request: Request,
-    goal: str = "explain",
-    audience: str = "general",
-    session: str = Cookie(default=None)
-):
-    """Step 3: Depth/Detail selection"""
+@app.get("/prompt-wizard/step/{number}", response_class=HTMLResponse)
+async def prompt_wizard_step(request: Request, number: int, session: str = Cookie(default=None)):
+    """Any wizard step: the precomputed page with this request's choices filled in"""
+    if number == 1 and WIZARD_SPA:
+        return RedirectResponse("/prompt-wizard/app")
     if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/step/3?goal={goal}&audience={audience}")
-    email = verify_magic_link(session, mark_used=False)
+        return RedirectResponse("/login?next=" + quote(f"{request.url.path}?{request.url.query}".rstrip("?"), safe="/"))
+    email = request_email(request, session)
     if not email:
         return RedirectResponse("/login")
 
-    depth_levels = [
-        ("quick", "Quick Answer", "Concise, to‑the‑point", "fa-solid fa-bolt"),
-        ("balanced", "Balanced", "Clear explanation with examples", "fa-solid fa-scale-balanced"),
-        ("comprehensive", "Comprehensive", "Step‑by‑step, includes tips & mistakes", "fa-solid fa-book"),
-        ("expert", "Expert Deep Dive", "Advanced techniques, frameworks, citations", "fa-solid fa-microscope"),
-    ]
+    page = PROMPT_WIZARD.render(number, request.query_params)
+    if page is None:
+        return RedirectResponse("/prompt-wizard/step/1")
+    if not PROMPT_WIZARD.known(number, request.query_params):
+        # Made-up choices: don't let them fill the precompressed cache; the
+        # compression middleware handles this one at its normal level
+        return HTMLResponse(page)
+    return precompressed_response(request, page)
 
-    depth_cards = ""
-    for value, label, description, icon in depth_levels:
-        depth_cards += f'''
-        <a href="/prompt-wizard/step/4?goal={goal}&audience={audience}&depth={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon}"></i>
-            </div>
-            <h3>{label}</h3>
-            <p>{description}</p>
-        </a>
-        '''
-
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 3: How detailed do you want the response?</h1>
-                <p>Choose the depth of the AI's answer</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill" style="width: 50%;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step active">3. Depth</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} audience</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {depth_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/2?goal={goal}" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 2
-            </a>
-        </div>
-    </article>
-    '''
 
-    return layout("Step 3: Depth Selection", content)
+@app.get("/prompt-wizard/app", response_class=HTMLResponse)
+async def prompt_wizard_app(request: Request, session: str = Cookie(default=None)):
+    """Single-page wizard: all steps in one cached bundle, choices kept in the browser.
 
-@app.get("/prompt-wizard/step/4", response_class=HTMLResponse)
-async def prompt_wizard_step4(
-    request: Request,
-    goal: str = "explain",
-    audience: str = "general",
-    depth: str = "balanced",   # new parameter
-    session: str = Cookie(default=None)
-):
-    """Step 4: Style selection"""
+    Only the final /prompt-wizard/generate goes back to the server, so a
+    generation is two authenticated requests instead of six. A revisit with
+    the bundle's ETag gets a bodyless 304.
+    """
     if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/step/4?goal={goal}&audience={audience}&depth={depth}")
-    email = verify_magic_link(session, mark_used=False)
+        return RedirectResponse("/login?next=/prompt-wizard/app")
+    email = request_email(request, session)
     if not email:
         return RedirectResponse("/login")
 
-    styles = [
-        ("direct", "Direct", "Straight to the point"),
-        ("structured", "Structured", "Organized with headings"),
-        ("creative", "Creative", "Imaginative, free-flowing"),
-        ("technical", "Technical", "Detailed with specifications"),
-        ("conversational", "Conversational", "Natural, chat-like"),
-        ("step-by-step", "Step-by-Step", "Guided instructions"),
-    ]
-
-    style_cards = ""
-    for value, label, description in styles:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        style_cards += f'''
-        <a href="/prompt-wizard/step/5?goal={goal}&audience={audience}&depth={depth}&style={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3>{label}</h3>
-            <p>{description}</p>
-        </a>
-        '''
-
-    content = f'''
+    body, etag = prompt_wizard_bundle()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return precompressed_response(request, body, headers=headers)
+
+@functools.lru_cache(maxsize=1)
+def prompt_wizard_bundle():
+    """(html, etag) of the single-page wizard, built once from PROMPT_WIZARD"""
+    steps = [{
+        "field": step.field,
+        "name": step.name,
+        "title": step.title,
+        "subtitle": step.subtitle,
+        "options": [{"value": option.value, "label": option.label, "description": option.description,
+                     "icon": PROMPT_WIZARD.icon(option.value), "checks": option.checks}
+                    for option in step.options],
+    } for step in PROMPT_WIZARD.steps]
+    progress = "".join(f'<div class="progress-step">{n}. {name}</div>'
+                       for n, name in enumerate([step["name"] for step in steps] + ["Prompt"], 1))
+    # JSON inside <script>: "</" must not close the tag early
+    steps_json = json.dumps(steps, ensure_ascii=False).replace("</", "<\\/")
+
+    content = """
     <article>
         <header style="text-align: center; margin-bottom: 2rem;">
             <hgroup>
-                <h1>Step 4: What style do you prefer?</h1>
-                <p>How should the AI structure its response?</p>
+                <h1 id="wizard-title">Prompt Wizard</h1>
+                <p id="wizard-subtitle"></p>
             </hgroup>
-            
+
             <div class="progress-container">
                 <div class="progress-bar">
-                    <div class="progress-fill" style="width: 66% !important;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Depth</div>
-                    <div class="progress-step active">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
+                    <div class="progress-fill" id="wizard-progress"></div>
                 </div>
+                <div class="progress-steps">__PROGRESS__</div>
             </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} (Depth: {depth.replace('-', ' ').title()})</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {style_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/3?goal={goal}&audience={audience}&depth={depth}" ... >
-                <i class="fas fa-arrow-left"></i> Back to Step 3
-            </a>
-        </div>
-    </article>
-    '''
 
-    return layout("Step 4: Style Selection", content)
-
-@app.get("/prompt-wizard/step/5", response_class=HTMLResponse)
-async def prompt_wizard_step5(
-    request: Request,
-    goal: str = "explain",
-    audience: str = "general",
-    depth: str = "balanced",
-    style: str = "direct",
-    session: str = Cookie(default=None)
-):
-    """Step 5: Tone selection"""
-    if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/step/5?goal={goal}&audience={audience}&depth={depth}&style={style}")
-    email = verify_magic_link(session, mark_used=False)
-    if not email:
-        return RedirectResponse("/login")
+            <div class="card secondary" id="wizard-summary" style="margin: 1rem auto; max-width: 600px; text-align: left;" hidden></div>
+        </header>
 
-    tones = [
-        ("professional", "Professional", "Formal, business-appropriate"),
-        ("friendly", "Friendly", "Warm, approachable, casual"),
-        ("authoritative", "Authoritative", "Confident, expert-like"),
-        ("enthusiastic", "Enthusiastic", "Energetic, passionate"),
-        ("neutral", "Neutral", "Objective, unbiased"),
-        ("humorous", "Humorous", "Funny, lighthearted"),
-    ]
+        <noscript>
+            <p>This wizard needs JavaScript. Use the <a href="/prompt-wizard/step/1">step-by-step version</a> instead.</p>
+        </noscript>
 
-    print(f"DEBUG: tones = {tones}")
+        <div class="grid" id="wizard-cards" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;"></div>
 
-    tone_cards = ""
-    for value, label, description in tones:
-        print(f"DEBUG inside loop: {value}, {label}")
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        tone_cards += f'''
-        <a href="/prompt-wizard/step/6?goal={goal}&audience={audience}&depth={depth}&style={style}&tone={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3>{label}</h3>
-            <p>{description}</p>
-        </a>
-        '''
-
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 5: What tone should it use?</h1>
-                <p>The overall mood or attitude of the response</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill" style="width: 83% !important;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Depth</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step active">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} (Depth: {depth.replace('-', ' ').title()}) in {style.replace('-', ' ').title()} style</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {tone_cards}
-        </div>
-        
-        
+        <div id="wizard-form" hidden>__FORM__</div>
 
         <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/4?goal={goal}&audience={audience}&depth={depth}" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 4
+            <a href="/dashboard" id="wizard-back" class="secondary">
+                <i class="fas fa-arrow-left"></i> <span>Back to Dashboard</span>
             </a>
         </div>
     </article>
-    '''
+    <script type="application/json" id="wizard-steps">__STEPS__</script>
+    <script>
+    (function() {
+        const steps = JSON.parse(document.getElementById('wizard-steps').textContent);
+        const saved = sessionStorage.getItem('prompt-wizard');
+        const choices = saved ? JSON.parse(saved) : {};
+        const form = document.querySelector('#wizard-form form');
+        const panel = document.getElementById('wizard-form');
+        const cards = document.getElementById('wizard-cards');
+        const summary = document.getElementById('wizard-summary');
+        const back = document.getElementById('wizard-back');
+
+        function labelOf(step) {
+            const option = step.options.find(o => o.value === choices[step.field]);
+            return option ? option.label : choices[step.field];
+        }
 
-    return layout("Step 5: Tone Selection", content)
+        function card(step, option, index) {
+            const a = document.createElement('a');
+            a.className = 'step-card';
+            a.href = '#step-' + (index + 2);
+            a.innerHTML = '<div class="step-icon"><i></i></div><h3></h3><p></p>';
+            a.querySelector('i').className = option.icon;
+            a.querySelector('h3').textContent = option.label;
+            a.querySelector('p').textContent = option.description;
+            a.addEventListener('click', () => {
+                choices[step.field] = option.value;
+                sessionStorage.setItem('prompt-wizard', JSON.stringify(choices));
+            });
+            return a;
+        }
 
-@app.get("/prompt-wizard/step/6", response_class=HTMLResponse)
-async def prompt_wizard_step6(
-    request: Request,
-    goal: str = "explain",
-    audience: str = "general",
-    depth: str = "balanced",    # ← replaced platform with depth
-    style: str = "direct",
-    tone: str = "professional",
-    session: str = Cookie(default=None)
-):
-    """Step 6: Enter your prompt"""
-    if not session:
-        return RedirectResponse(f"/login?next=/prompt-wizard/step/6?goal={goal}&audience={audience}&platform={platform}&style={style}&tone={tone}")
-    email = verify_magic_link(session, mark_used=False)
-    if not email:
-        return RedirectResponse("/login")
+        // Step from the URL hash, but never past the first choice not yet made
+        function current() {
+            const match = location.hash.match(/^#step-(\d+)$/);
+            const wanted = match ? parseInt(match[1], 10) - 1 : 0;
+            const missing = steps.findIndex(step => !(step.field in choices));
+            return Math.max(0, Math.min(wanted, missing === -1 ? steps.length : missing));
+        }
 
-    # Summary of selections
-    selections_html = f'''
-    <div class="card secondary" style="margin: 1rem 0 2rem 0;">
-        <div class="grid" style="grid-template-columns: repeat(5, 1fr); gap: 0.5rem; text-align: center;">
-            <div>
-                <small>Goal</small><br>
-                <strong>{goal.capitalize()}</strong>
-            </div>
-            <div>
-                <small>Audience</small><br>
-                <strong>{audience.capitalize()}</strong>
-            </div>
-            <div>
-                <small>Platform</small><br>
-                <strong>{depth.replace('-', ' ').title()}</strong>
-            </div>
-            <div>
-                <small>Style</small><br>
-                <strong>{style.replace('-', ' ').title()}</strong>
-            </div>
-            <div>
-                <small>Tone</small><br>
-                <strong>{tone.capitalize()}</strong>
-            </div>
-        </div>
-    </div>
-    '''
+        function show(index) {
+            const step = steps[index];
+            const last = index === steps.length;
+            document.getElementById('wizard-title').textContent =
+                'Step ' + (index + 1) + ': ' + (last ? 'Enter Your Prompt' : step.title);
+            document.getElementById('wizard-subtitle').textContent =
+                last ? 'Type your original prompt, and AI will optimize it' : step.subtitle;
+            document.getElementById('wizard-progress').style.width = ((index + 1) / (steps.length + 1) * 100) + '%';
+            document.querySelectorAll('.progress-step').forEach((el, i) => el.classList.toggle('active', i === index));
+
+            const picked = steps.slice(0, index).map(s => s.name + ': ' + labelOf(s));
+            summary.hidden = !picked.length;
+            summary.textContent = picked.join(' · ');
+
+            cards.hidden = last;
+            cards.replaceChildren(...(last ? [] : step.options.map(option => card(step, option, index))));
+            panel.hidden = !last;
+            back.hidden = last;
+            if (last) {
+                const ticked = steps.flatMap(s => s.options.filter(o => o.checks && o.value === choices[s.field]))
+                                    .map(o => o.checks);
+                steps.forEach(s => {
+                    form.elements[s.field].value = choices[s.field];
+                    s.options.forEach(o => { if (o.checks) form.elements[o.checks].checked = ticked.includes(o.checks); });
+                });
+            }
 
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 6: Enter Your Prompt</h1>
-                <p>Type your original prompt, and AI will optimize it</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill" style="width: 100% !important;"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Depth</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step active">6. Prompt</div>
-                </div>
-            </div>
-            
-            {selections_html}
-        </header>
-        
-        <form action="/prompt-wizard/generate" method="get">
-            <!-- Hidden fields to pass selections -->
-            <input type="hidden" name="goal" value="{goal}">
-            <input type="hidden" name="audience" value="{audience}">
-            <input type="hidden" name="depth" value="{depth}">
-            <input type="hidden" name="style" value="{style}">
-            <input type="hidden" name="tone" value="{tone}">
-            
-            <div class="grid">
-                <div>
-                    <label for="user_prompt">
-                        <h3>Your Original Prompt:</h3>
-                        <p>Type what you'd normally ask the AI</p>
-                    </label>
-                    <textarea 
-                        id="user_prompt" 
-                        name="prompt" 
-                        rows="8" 
-                        placeholder="Example: 'Explain quantum computing like I'm 5' or 'Write a blog post about climate change'"
-                        required
-                        style="font-size: 1rem; padding: 1rem;"
-                    ></textarea>
-                </div>
-                
-                <div>
-                    <h3>Tips for Great Prompts:</h3>
-                    <div class="card" style="height: 100%;">
-                        <ul style="margin: 0; padding-left: 1.5rem;">
-                            <li>Be specific about what you want</li>
-                            <li>Include context when relevant</li>
-                            <li>Mention length or format if needed</li>
-                            <li>Add examples if helpful</li>
-                            <li>Don't worry about perfection – AI will optimize it!</li>
-                        </ul>
-                    </div>
-                </div>
-            </div>
-            
-            <div style="text-align: center; margin-top: 2rem;">
-                <button type="submit" class="primary" style="padding: 1rem 2rem; font-size: 1.1rem;">
-                    <i class="fas fa-magic"></i> Generate Optimized Prompt
-                </button>
-                
-                <a href="/prompt-wizard/step/5?goal={goal}&audience={audience}&depth={depth}&style={style}" 
-                   class="secondary" style="margin-left: 1rem;">
-                    <i class="fas fa-arrow-left"></i> Back
-                </a>
-            </div>
-        </form>
-    </article>
-    '''
+            back.href = index ? '#step-' + index : '/dashboard';
+            back.querySelector('span').textContent = index ? 'Back to Step ' + index : 'Back to Dashboard';
+            document.title = 'Prompt Wizard - Step ' + (index + 1);
+        }
 
-    return layout("Step 6: Enter Your Prompt", content)
+        window.addEventListener('hashchange', () => show(current()));
+        show(current());
+    })();
+    </script>
+    """
+    body = layout("Prompt Wizard", content.replace("__PROGRESS__", progress).replace("__FORM__", PROMPT_WIZARD.blank_form())
+                  .replace("__STEPS__", steps_json))
+    return body, '"%s"' % hashlib.blake2b(body.encode(), digest_size=8).hexdigest()
 
 def layout(title, content):
     css = """
@@ -931,17 +876,19 @@ def layout(title, content):
     </html>
     """
 
+PROMPT_WIZARD = Wizard("/prompt-wizard", PROMPT_WIZARD_STEPS, PROMPT_WIZARD_FORM, layout, icons=ICON_MAP)
+
 # ==================== PROMPT WIZARD ROUTES END ====================
 
 # 1. Frontpage
 @app.get("/")
 async def root(request: Request):
-    return templates.TemplateResponse("frontpage.html", {"request": request})
+    return get_templates().TemplateResponse("frontpage.html", {"request": request})
 
 # 2. Login
 @app.get("/login")
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return get_templates().TemplateResponse("login.html", {"request": request})
 
 @app.get("/login-test")
 async def login_test_get():
@@ -1018,13 +965,15 @@ async def auth_callback(token: str):
     
     try:
         
-        # Use mark_used=False so dashboard can also verify it
-        email = verify_magic_link(token, mark_used=False)
+        # The magic link is single use: swap it for a session id right here
+        email = verify_magic_link(token, mark_used=True)
         
         if email:
             print(f"🔐 SUCCESS! Logging in: {email}")
+            session_id = get_session_store().create(email)
             response = RedirectResponse("/dashboard")
-            response.set_cookie(key="session", value=token, httponly=True, secure=False)
+            response.set_cookie(key="session", value=session_id, httponly=True, secure=False,
+                                max_age=get_session_store().ttl, samesite="lax")
             return response
         else:
             print(f"🔐 Token invalid or already used")
@@ -1043,9 +992,8 @@ async def dashboard(request: Request, session: str = Cookie(default=None)):
     
     # VERIFY THE SESSION TOKEN TO GET REAL USER EMAIL
     try:
-        from shared.auth import verify_magic_link
-        # session cookie contains the token
-        email = verify_magic_link(session, mark_used=False)
+        # session cookie holds a session id from /auth
+        email = session_email(session)
         if not email:
             print(f"❌ Token verification failed")
             return RedirectResponse("/login")
@@ -1054,49 +1002,69 @@ async def dashboard(request: Request, session: str = Cookie(default=None)):
         print(f"⚠️ shared.auth not found: {e}, using test email")
         email = "test@example.com"
     
-    # GET REAL BALANCE FROM DATABASE
+    # GET REAL BALANCE FROM THE BANK
     try:
-        from central_bank import get_balance as get_user_balance
-        balance = get_user_balance(email)
+        balance = await get_bank_client().get_balance(email)
         print(f"✅ User balance: {balance} tokens")
-    except ImportError as e:
-        print(f"⚠️ Balance module not found: {e}")
-        balance = 100
-    
-    # DEBUG: Print apps list
-    # In your dashboard function in clean_app.py
-    # In clean_app.py, update apps_list:
-    apps_list = [
-        {"name": "Thumbnail Wizard", "cost": 4, "icon": "🖼️", "status": "ready", 
-        "url": "/thumbnail-wizard", "description": "Create thumbnails"},
-        
-        {"name": "Document Wizard", "cost": 4, "icon": "📄", "status": "ready", 
-        "url": "/document-wizard", "description": "Process documents"},
-        
-        {"name": "Hook Wizard", "cost": 4, "icon": "🎣", "status": "ready", 
-        "url": "/hook-wizard", "description": "Create hooks"},
-        
-        {"name": "Prompt Wizard", "cost": 5, "icon": "✨", "status": "ready", 
-        "url": "/prompt-wizard/step/1", "description": "Build AI prompts"},  # ← FIXED!
-        
-        {"name": "Script Wizard", "cost": 3, "icon": "📝", "status": "ready", 
-        "url": "/script-wizard", "description": "Write scripts"},
-        
-        {"name": "A11y Wizard", "cost": 0, "icon": "♿", "status": "ready", 
-        "url": "/a11y-wizard", "description": "Accessibility tools"},
-    ]
-    
-    print(f"📊 Passing {len(apps_list)} apps to template")
-    for app in apps_list:
-        print(f"  - {app['name']}")
+    except BankError as e:
+        print(f"⚠️ Balance lookup failed: {e}")
+        balance = 0
     
-    return templates.TemplateResponse("dashboard.html", {
+    catalog = get_catalog()
+    return get_templates().TemplateResponse("dashboard.html", {
         "request": request,
         "user_email": email,
         "balance": balance,
-        "apps": apps_list
+        # Same for every user: rendered once per catalog version
+        "app_grid": render_fragment("_app_grid.html", catalog.version, apps=catalog.apps),
     })
 
+def balance_event(event):
+    return f"event: balance\ndata: {json.dumps(event)}\n\n"
+
+@app.get("/balance/events")
+async def balance_events(session: str = Cookie(default=None)):
+    """Server-sent events: the balance, pushed whenever the bank changes it (no polling)"""
+    email = session_email(session)
+    if not email:
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+
+    async def stream():
+        # Subscribe before reading, so a change in between isn't missed
+        subscription = balance_hub.subscribe(email)
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                balance = await get_bank_client().get_balance(email)
+                yield balance_event({"balance": balance, "delta": None, "reason": "current"})
+            except BankError:
+                balance = None
+            resync_at = loop.time() + BALANCE_RESYNC_INTERVAL
+            while True:
+                event = await subscription.next(BALANCE_HEARTBEAT_INTERVAL)
+                if event is not None:
+                    balance = event["balance"]
+                    yield balance_event(event)
+                elif BALANCE_RESYNC_INTERVAL > 0 and loop.time() >= resync_at:
+                    # Changes made by another worker don't reach this process's hub
+                    resync_at = loop.time() + BALANCE_RESYNC_INTERVAL
+                    try:
+                        current = await get_bank_client().get_balance(email)
+                    except BankError:
+                        current = balance
+                    if current != balance:
+                        yield balance_event({"balance": current, "delta": None, "reason": "resync"})
+                        balance = current
+                    else:
+                        yield ": keepalive\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/prompt-wizard")
 async def prompt_wizard(request: Request, session: str = Cookie(default=None)):
     """Prompt Wizard main form"""
@@ -1106,23 +1074,21 @@ async def prompt_wizard(request: Request, session: str = Cookie(default=None)):
         print("  🔀 No session, redirecting to login")
         return RedirectResponse("/login?next=/prompt-wizard")
     
-    from shared.auth import verify_magic_link
-    email = verify_magic_link(session, mark_used=False)
+    email = session_email(session)
     if not email:
         print("  🔀 Invalid session, redirecting to login")
         return RedirectResponse("/login")
     
     # Check balance
     try:
-        from central_bank import get_user_balance
-        balance = get_user_balance(email)
+        balance = await get_bank_client().get_balance(email)
         print(f"  💰 User balance: {balance} tokens")
     except Exception as e:
         print(f"  ⚠️ Balance check failed: {e}")
         balance = 0
     
     print(f"  ✅ Showing form for: {email}")
-    return templates.TemplateResponse("prompt_wizard.html", {
+    return get_templates().TemplateResponse("prompt_wizard.html", {
         "request": request,
         "user_email": email,
         "balance": balance
@@ -1133,17 +1099,20 @@ async def settings(request: Request, session: str = Cookie(default=None)):
     if not session:
         return RedirectResponse("/login")
     
-    return templates.TemplateResponse("settings.html", {"request": request})
+    return get_templates().TemplateResponse("settings.html", {"request": request})
 
 @app.get("/logout")
-async def logout():
+async def logout(session: str = Cookie(default=None)):
+    get_session_store().delete(session)
+    signed_cookies.revoke(session)
     response = RedirectResponse("/")
     response.delete_cookie(key="session")
+    response.delete_cookie(key=SIGNED_COOKIE)
     return response
 
 @app.get("/check-email")
 async def check_email(request: Request, email: str):
-    return templates.TemplateResponse("check_email.html", {
+    return get_templates().TemplateResponse("check_email.html", {
         "request": request,
         "email": email
     })
@@ -1234,12 +1203,12 @@ async def test_db_persistence():
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
-    # Count tokens
-    c.execute("SELECT COUNT(*) FROM magic_links")
+    # Count sessions (only token hashes are stored)
+    c.execute("SELECT COUNT(*) FROM sessions")
     count = c.fetchone()[0]
     
-    # List them
-    c.execute("SELECT token, email, used FROM magic_links")
+    # List the most recent ones
+    c.execute("SELECT hex(token_hash), email, used FROM sessions ORDER BY created DESC LIMIT 50")
     rows = c.fetchall()
     
     conn.close()
@@ -1248,11 +1217,17 @@ async def test_db_persistence():
         "db_path": db_path,
         "token_count": count,
         "tokens": [
-            {"token": r[0][:30] + "...", "email": r[1], "used": r[2]}
+            {"token_hash": r[0][:12] + "...", "email": r[1], "used": r[2]}
             for r in rows
         ]
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime health numbers (LLM breaker state, retries, latency, token table sizes, session cache, SSE)"""
+    return {"llm": get_llm_client().metrics(), "db": compactor.metrics() if compactor else None,
+            "sessions": get_session_store().metrics(), "balance_events": balance_hub.metrics()}
+
 # In clean_app.py, add this route (temporarily):
 @app.get("/test-ping")
 async def test_ping():
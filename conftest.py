@@ -0,0 +1,20 @@
+# conftest.py
+# One throwaway bank database per test session, so the real bank.db is never touched
+# Run the tests with `python -m pytest`: a test file run directly imports central_bank against bank.db
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_configure(config):
+    # Runs before the test modules are imported: central_bank creates its tables at import
+    os.environ["BANK_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bank-test-"), "bank.db")
+
+
+@pytest.fixture(scope="session")
+def bank_db_path():
+    return os.environ["BANK_DB_PATH"]
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 """
-ULTRA-SIMPLE Dashboard - No dependencies, just Python
+ULTRA-SIMPLE Dashboard - no web framework, just the standard library server
 """
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import sqlite3
-import secrets
 import urllib.parse
 import json
 
-sessions = {}
+from shared.auth import get_db_path
+from shared.session_store import get_session_store
 
 class DashboardHandler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -19,8 +19,8 @@ class DashboardHandler(BaseHTTPRequestHandler):
             
             # Check session
             session_id = self.get_cookie('session_id')
-            if session_id in sessions:
-                email = sessions[session_id]
+            email = get_session_store().get(session_id)
+            if email:
                 balance = self.get_balance(email)
                 html = f"""
                 <html><body>
@@ -44,6 +44,7 @@ class DashboardHandler(BaseHTTPRequestHandler):
             self.wfile.write(html.encode())
             
         elif self.path == '/logout':
+            get_session_store().delete(self.get_cookie('session_id'))
             self.send_response(302)
             self.send_header('Location', '/')
             self.send_header('Set-Cookie', 'session_id=; Max-Age=0')
@@ -61,8 +62,7 @@ class DashboardHandler(BaseHTTPRequestHandler):
             email = params.get('email', [''])[0]
             
             if email:
-                session_id = secrets.token_hex(16)
-                sessions[session_id] = email
+                session_id = get_session_store().create(email)
                 
                 self.send_response(302)
                 self.send_header('Location', '/')
@@ -81,7 +81,7 @@ class DashboardHandler(BaseHTTPRequestHandler):
         return None
     
     def get_balance(self, email):
-        conn = sqlite3.connect('bank.db')
+        conn = sqlite3.connect(get_db_path())
         c = conn.cursor()
         c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
         result = c.fetchone()
@@ -1,30 +1,78 @@
-from central_bank import app, get_balance
-import secrets
-from itsdangerous import URLSafeTimedSerializer
+from fastapi import HTTPException
+from pydantic import BaseModel
+from central_bank import app, get_balance, register_passports
+from shared.catalog import get_catalog
+from shared.passport import APP_CODES, issue
 
-serializer = URLSafeTimedSerializer('your-secret-key-here')
+def session_budget_for(balance: int) -> int:
+    # Limit how much can be spent in this session (e.g., 20% of balance or max 1000)
+    return min(1000, balance // 5) if balance > 0 else 0
+
+def split_budget(total: int, app_ids) -> dict:
+    """One session budget shared across the apps, so together they can't spend more"""
+    share, extra = divmod(total, len(app_ids)) if app_ids else (0, 0)
+    return {app_id: share + (1 if i < extra else 0) for i, app_id in enumerate(app_ids)}
+
+def check_app_ids(app_ids):
+    """ValueError unless every app is in the catalog and has a passport app code"""
+    catalog = get_catalog()
+    unknown = [app_id for app_id in app_ids if app_id not in catalog]
+    if unknown:
+        raise ValueError(f"Unknown apps: {', '.join(unknown)}")
+    # v2 passports carry the app as its APP_CODES index
+    uncoded = [app_id for app_id in app_ids if app_id not in APP_CODES]
+    if uncoded:
+        raise ValueError(f"No passport app code for: {', '.join(uncoded)}")
 
 @app.post("/issue-passport")
 def issue_passport(email: str, app_id: str):
     """Create a session token that includes spending authority"""
+    try:
+        check_app_ids([app_id])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     balance = get_balance(email)
-    
-    # Limit how much can be spent in this session (e.g., 20% of balance or max 1000)
-    session_budget = min(1000, balance // 5) if balance > 0 else 0
-    
-    passport = {
-        "email": email,
-        "app_id": app_id,
-        "budget": session_budget,
-        "issued_at": datetime.utcnow().isoformat(),
-        "passport_id": secrets.token_hex(16)
+    session_budget = session_budget_for(balance)
+
+    # Sign the passport (compact v2 format unless PASSPORT_FORMAT=1)
+    token, passport = issue(email, app_id, session_budget)
+    register_passports([passport])
+
+    return {
+        "passport": token,
+        "session_budget": session_budget,
+        "total_balance": balance,
+        "expires": passport["expires"]
     }
-    
-    # Encrypt the passport
-    encrypted_passport = serializer.dumps(passport, salt=f'passport-{app_id}')
-    
+
+class PassportBatchRequest(BaseModel):
+    email: str
+    app_ids: list[str] = []  # empty = every app in the catalog
+
+def issue_passports(email: str, app_ids=None) -> dict:
+    """Passports for several apps from a single balance read and a single registry write"""
+    catalog = get_catalog()
+    app_ids = list(app_ids or (entry.app_id for entry in catalog.apps))
+    check_app_ids(app_ids)
+
+    balance = get_balance(email)
+    session_budget = session_budget_for(balance)
+    budgets = split_budget(session_budget, app_ids)
+    issued = {app_id: issue(email, app_id, budgets[app_id]) for app_id in app_ids}
+    register_passports([passport for _, passport in issued.values()])
+
     return {
-        "passport": encrypted_passport,
+        "passports": {app_id: token for app_id, (token, _) in issued.items()},
         "session_budget": session_budget,
-        "total_balance": balance
+        "budgets": budgets,
+        "total_balance": balance,
+        "expires": min((passport["expires"] for _, passport in issued.values()), default=None)
     }
+
+@app.post("/issue-passports")
+def issue_passports_route(batch: PassportBatchRequest):
+    """Passports for all the dashboard's apps in one call"""
+    try:
+        return issue_passports(batch.email, batch.app_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+All of the platform in one ASGI app, one process.
+
+    uvicorn platform_app:app --port 10000
+    python serve.py platform_app:app --workers 4
+
+Instead of four servers talking over localhost HTTP, the apps are mounted
+side by side:
+
+    /bank/...           central_bank (+ passport issuing), internal only
+    /dashboard-app/...  dashboard/app.py
+    /wizard/...         prompt_wizard.router
+    /thumbnails/...     thumbnail_proxy
+    /...                clean_app (login, dashboard, wizard, jobs)
+
+The bank is reached through shared.bank_client's in-process client, so a
+dashboard render or a spend is a function call, not a hop. Over HTTP the
+bank answers only requests carrying BANK_INTERNAL_TOKEN (X-Internal-Token),
+except /bank/settle, which AI apps sign with their app key (see
+shared.internal_auth). Every app keeps
+its own `app` object and __main__ block and still runs on its own port.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__":
+    # .env before the apps below read their settings at import
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from fastapi import FastAPI
+from starlette.routing import Mount
+
+import central_bank
+import passport_generator  # noqa: F401  (adds /issue-passport(s) to the bank app)
+import thumbnail_proxy
+import clean_app
+from dashboard import app as dashboard_app
+from shared.compression import CompressionMiddleware
+from shared.internal_auth import InternalOnlyMiddleware
+from prompt_wizard import router as wizard_router
+
+wizard_app = FastAPI()
+wizard_app.include_router(wizard_router)
+
+# Order matters: clean_app owns "/" and must come last
+MOUNTS = [
+    ("/bank", central_bank.app),
+    ("/dashboard-app", dashboard_app.app),
+    ("/wizard", wizard_app),
+    ("/thumbnails", thumbnail_proxy.app),
+    ("/", clean_app.app),
+]
+
+# Mounts that browsers must not reach, with the paths that carry their own credentials
+INTERNAL_MOUNTS = {"/bank": ("/settle",)}
+
+app = FastAPI(routes=[
+    Mount(path, app=InternalOnlyMiddleware(sub_app, public_paths=INTERNAL_MOUNTS[path])
+          if path in INTERNAL_MOUNTS else sub_app)
+    for path, sub_app in MOUNTS
+])
+# One compression layer for every mount; responses clean_app already
+# compressed pass through it
+app.add_middleware(CompressionMiddleware)
+
+
+# Mounted apps don't get lifespan events, so run their hooks from here
+@app.on_event("startup")
+async def start_mounted_apps():
+    if os.getenv("BANK_CLIENT", "local").lower() == "http":
+        print("⚠️ BANK_CLIENT=http: bank calls will loop back over HTTP instead of staying in process")
+    for path, sub_app in MOUNTS:
+        await sub_app.router.startup()
+
+
+@app.on_event("shutdown")
+async def stop_mounted_apps():
+    for path, sub_app in reversed(MOUNTS):
+        await sub_app.router.shutdown()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "10000")))
@@ -1,12 +1,9 @@
 # token_bank/pricing.py
-PRICING = {
-    "thumbnail_wizard": {"analyze": 4},
-    "document_wizard": {"analyze": 4},
-    "prompt_wizard": {"optimize": 5},
-    "script_wizard": {"generate": 3},
-    "hook_wizard": {"generate": 4},
-    "a11y_wizard": {"check": 0}
-}
+from shared.catalog import get_catalog
+
+# Costs live in app_catalog.json (shared/catalog.py). This is a snapshot taken
+# at import for old callers; code that must see price reloads uses get_catalog().
+PRICING = get_catalog().pricing()
 
 ACCOUNT_TYPES = {
     "free": {
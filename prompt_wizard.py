@@ -1,15 +1,23 @@
 print("🟢 1. Script starting...")
 
 
-from fastapi import Request, Query, APIRouter, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import Request, Query, APIRouter, Depends, Cookie, BackgroundTasks
+from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+import asyncio
 import os
 import requests
 import json
+from shared.llm_client import get_llm_client, LLMError
+from shared.bank_client import get_bank_client, settle_hold, BankUnavailable, InsufficientTokens
+from shared.catalog import get_catalog
+from shared.compression import precompressed_response
+from shared.session_store import session_email
+from shared.wizard import Wizard, Step, Option, FORM_FIELDS, BACK, ROOT
 #import results
 
 router = APIRouter()
+APP_ID = "prompt_wizard"  # generating is priced in the app catalog as its "optimize" operation
 
 
 # ========== ICON MAPPING ==========
@@ -56,8 +64,14 @@ ICON_MAP = {
 }
 
 # ========== CORE LAYOUT FUNCTION ==========
-def layout(title: str, content: str, step: int = 1) -> HTMLResponse:
+def layout(title: str, content: str, step: int = 1, root: str = "", status_code: int = 200) -> HTMLResponse:
     """Base layout with aqua blue theme and progress bar"""
+    return HTMLResponse(content=page_html(title, content, step, root), status_code=status_code)
+
+
+def page_html(title: str, content: str, step: int = 1, root: str = "") -> str:
+    """The layout as a string (the wizard engine precomputes pages from it).
+    root is where this router is mounted, for links back into it."""
     
     # Calculate progress percentage
     progress_percent = (step / 6) * 100 if step <= 6 else 100
@@ -294,7 +308,7 @@ def layout(title: str, content: str, step: int = 1) -> HTMLResponse:
         </ul>
         <ul>
             <li><a href="/dashboard"><i class="fas fa-home"></i> Dashboard</a></li>
-            <li><a href="/prompt-wizard/step/1"><i class="fas fa-magic"></i> Prompt Wizard</a></li>
+            <li><a href="{root}/prompt-wizard/step/1"><i class="fas fa-magic"></i> Prompt Wizard</a></li>
             <li><a href="/script-wizard"><i class="fas fa-scroll"></i> Script Wizard</a></li>
         </ul>
     </nav>
@@ -343,11 +357,26 @@ def layout(title: str, content: str, step: int = 1) -> HTMLResponse:
     </script>
 </body>
 </html>'''
-    return HTMLResponse(content=html)
+    return html
 
 # ========== DEEPSEEK API FUNCTION ==========
 def call_deepseek_api(goal: str, audience: str, tone: str, platform: str, user_prompt: str) -> str:
-    """Call DeepSeek API to generate optimized prompt"""
+    """Call DeepSeek API to generate optimized prompt; failures come back as an error page text"""
+    try:
+        return optimize_prompt(goal, audience, tone, platform, user_prompt)
+    except Exception as e:
+        return failed_prompt(e, audience, tone, user_prompt)
+
+
+def failed_prompt(error, audience: str, tone: str, user_prompt: str) -> str:
+    """What the result page shows instead of a prompt when the API call failed"""
+    if isinstance(error, LLMError) and error.status_code:
+        return f"## Error: API returned status {error.status_code}\n\n{error}"
+    return f"## Error: {str(error)}\n\n## Fallback Prompt Structure:\n\nRole: AI Assistant\nTask: {user_prompt}\nAudience: {audience}\nTone: {tone}\nFormat: Structured response"
+
+
+def optimize_prompt(goal: str, audience: str, tone: str, platform: str, user_prompt: str) -> str:
+    """The optimized prompt from DeepSeek; raises LLMError if the call fails"""
     
     system_prompt = """You are a Prompt Engineering Expert. Create optimized, structured prompts.
 
@@ -374,39 +403,20 @@ CONTEXT:
 
 Make it DETAILED and READY-TO-USE. The user will copy-paste this into {platform}."""
 
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
     
-    data = {
-        "model": "deepseek-chat",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 1000,
-        "stream": False
-    }
+    prompt = get_llm_client().chat(
+        messages, os.getenv("DEEPSEEK_API_KEY"), temperature=0.7, max_tokens=1000, stream=False
+    )
     
-    try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=60)
+    # Ensure proper formatting
+    if not prompt.startswith("##"):
+        prompt = f"## AI-Optimized Prompt for {platform}\n\n{prompt}"
         
-        if response.status_code == 200:
-            result = response.json()
-            prompt = result["choices"][0]["message"]["content"].strip()
-            
-            # Ensure proper formatting
-            if not prompt.startswith("##"):
-                prompt = f"## AI-Optimized Prompt for {platform}\n\n{prompt}"
-                
-            return prompt
-        else:
-            return f"## Error: API returned status {response.status_code}\n\n{response.text}"
-            
-    except Exception as e:
-        return f"## Error: {str(e)}\n\n## Fallback Prompt Structure:\n\nRole: AI Assistant\nTask: {user_prompt}\nAudience: {audience}\nTone: {tone}\nFormat: Structured response"
+    return prompt
 
 
 print("🟢 2. Before route definitions...")
@@ -414,8 +424,9 @@ print("🟢 2. Before route definitions...")
 
 # ========== HOME PAGE ==========
 @router.get("/")
-async def home():
-    content = '''
+async def home(request: Request):
+    root = request.scope.get("root_path", "")
+    content = f'''
     <article style="text-align: center; padding: 3rem 0;">
         <h1>🧙 Prompt Wizard</h1>
         <p class="lead" style="font-size: 1.25rem; color: #666; margin: 1rem 0 2rem 0;">
@@ -439,411 +450,75 @@ async def home():
             </div>
         </div>
         
-        <a href="/prompt-wizard/step/1" role="button" class="primary" style="padding: 1rem 2rem; font-size: 1.1rem;">
+        <a href="{root}/prompt-wizard/step/1" role="button" class="primary" style="padding: 1rem 2rem; font-size: 1.1rem;">
             <i class="fas fa-play-circle"></i> Start Wizard
         </a>
         
         <div style="margin-top: 3rem; color: #888; font-size: 0.9rem;">
-            <p>No login required • All processing happens in your browser • Free to use</p>
-        </div>
-    </article>
-    '''
-    return layout("Home - Prompt Wizard", content, step=0)
-
-# ========== STEP 1: GOAL SELECTION ==========
-@router.get("/prompt-wizard/step/1")
-async def step1():
-    goals = [
-        ("explain", "Explain", "Break down complex topics"),
-        ("create", "Create", "Generate content or ideas"),
-        ("analyze", "Analyze", "Review data or text"),
-        ("solve", "Solve", "Find solutions to problems"),
-        ("brainstorm", "Brainstorm", "Generate possibilities"),
-        ("edit", "Edit/Improve", "Refine existing content"),
-    ]
-    
-    goal_cards = ""
-    for value, label, description in goals:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        
-        goal_cards += f'''
-        <a href="/prompt-wizard/step/2?goal={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3 style="margin: 0; color: #333;">{label}</h3>
-            <p style="margin: 0; color: #666; font-size: 0.9rem;">{description}</p>
-        </a>
-        '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 1: What's your goal?</h1>
-                <p>What do you want the AI to help you with?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step active">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Platform</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {goal_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/" class="secondary">
-                <i class="fas fa-home"></i> Back to Home
-            </a>
-        </div>
-    </article>
-    '''
-    
-    return layout("Step 1: Goal Selection", content, step=1)
-# ========== STEP 2: AUDIENCE SELECTION ==========
-@router.get("/prompt-wizard/step/2")
-async def step2(goal: str = Query("explain")):
-    audiences = [
-        ("general", "General Public", "Anyone without specific expertise"),
-        ("experts", "Experts", "People with deep knowledge"),
-        ("students", "Students", "Learners at various levels"),
-        ("business", "Business", "Professionals, clients, stakeholders"),
-        ("technical", "Technical", "Developers, engineers, scientists"),
-        ("beginners", "Beginners", "New to the topic, need basics"),
-    ]
-    
-    audience_cards = ""
-    for value, label, description in audiences:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        
-        audience_cards += f'''
-        <a href="/prompt-wizard/step/3?goal={goal}&audience={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3 style="margin: 0; color: #333;">{label}</h3>
-            <p style="margin: 0; color: #666; font-size: 0.9rem;">{description}</p>
-        </a>
-        '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 2: Who is your audience?</h1>
-                <p>Who will read or use this output?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step active">2. Audience</div>
-                    <div class="progress-step">3. Platform</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected Goal:</strong> {goal.capitalize()}</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {audience_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/1" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 1
-            </a>
-        </div>
-    </article>
-    '''
-    
-    return layout("Step 2: Audience Selection", content, step=2)
-# ========== STEP 3: PLATFORM SELECTION ==========
-@router.get("/prompt-wizard/step/3")
-async def step3(goal: str = Query("explain"), audience: str = Query("general")):
-    platforms = [
-        ("chatgpt", "ChatGPT", "OpenAI's conversational AI"),
-        ("claude", "Claude", "Anthropic's thoughtful assistant"),
-        ("gemini", "Gemini", "Google's multimodal AI"),
-        ("deepseek", "DeepSeek", "DeepSeek AI models"),
-        ("perplexity", "Perplexity", "Research-focused with citations"),
-        ("copilot", "GitHub Copilot", "Code completion and generation"),
-    ]
-    
-    platform_cards = ""
-    for value, label, description in platforms:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        
-        platform_cards += f'''
-        <a href="/prompt-wizard/step/4?goal={goal}&audience={audience}&platform={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3 style="margin: 0; color: #333;">{label}</h3>
-            <p style="margin: 0; color: #666; font-size: 0.9rem;">{description}</p>
-        </a>
-        '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 3: Which AI platform?</h1>
-                <p>Where will you use this prompt?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step active">3. Platform</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} audience</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {platform_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/2?goal={goal}" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 2
-            </a>
+            <p>Choosing is free • Log in to generate • Each prompt costs {get_catalog().cost(APP_ID, "optimize")} tokens</p>
         </div>
     </article>
     '''
-    
-    return layout("Step 3: Platform Selection", content, step=3)
-# ========== STEP 4: STYLE SELECTION ==========
-@router.get("/prompt-wizard/step/4")
-async def step4(goal: str = Query("explain"), audience: str = Query("general"), platform: str = Query("chatgpt")):
-    styles = [
-        ("direct", "Direct", "Straight to the point"),
-        ("structured", "Structured", "Organized with headings"),
-        ("creative", "Creative", "Imaginative, free-flowing"),
-        ("technical", "Technical", "Detailed with specifications"),
-        ("conversational", "Conversational", "Natural, chat-like"),
-        ("step-by-step", "Step-by-Step", "Guided instructions"),
-    ]
-    
-    style_cards = ""
-    for value, label, description in styles:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        
-        style_cards += f'''
-        <a href="/prompt-wizard/step/5?goal={goal}&audience={audience}&platform={platform}&style={value}" class="step-card">
+    return layout("Home - Prompt Wizard", content, step=0, root=root)
+
+# ========== WIZARD DEFINITION ==========
+WIZARD_STEPS = (
+    Step("goal", "Goal", "What's your goal?", "What do you want the AI to help you with?", (
+        Option("explain", "Explain", "Break down complex topics"),
+        Option("create", "Create", "Generate content or ideas"),
+        Option("analyze", "Analyze", "Review data or text"),
+        Option("solve", "Solve", "Find solutions to problems"),
+        Option("brainstorm", "Brainstorm", "Generate possibilities"),
+        Option("edit", "Edit/Improve", "Refine existing content"),
+    )),
+    Step("audience", "Audience", "Who is your audience?", "Who will read or use this output?", (
+        Option("general", "General Public", "Anyone without specific expertise"),
+        Option("experts", "Experts", "People with deep knowledge"),
+        Option("students", "Students", "Learners at various levels"),
+        Option("business", "Business", "Professionals, clients, stakeholders"),
+        Option("technical", "Technical", "Developers, engineers, scientists"),
+        Option("beginners", "Beginners", "New to the topic, need basics"),
+    )),
+    Step("platform", "Platform", "Which AI platform?", "Where will you use this prompt?", (
+        Option("chatgpt", "ChatGPT", "OpenAI's conversational AI"),
+        Option("claude", "Claude", "Anthropic's thoughtful assistant"),
+        Option("gemini", "Gemini", "Google's multimodal AI"),
+        Option("deepseek", "DeepSeek", "DeepSeek AI models"),
+        Option("perplexity", "Perplexity", "Research-focused with citations"),
+        Option("copilot", "GitHub Copilot", "Code completion and generation"),
+    )),
+    Step("style", "Style", "What style do you prefer?", "How should the AI structure its response?", (
+        Option("direct", "Direct", "Straight to the point"),
+        Option("structured", "Structured", "Organized with headings"),
+        Option("creative", "Creative", "Imaginative, free-flowing"),
+        Option("technical", "Technical", "Detailed with specifications"),
+        Option("conversational", "Conversational", "Natural, chat-like"),
+        Option("step-by-step", "Step-by-Step", "Guided instructions"),
+    )),
+    Step("tone", "Tone", "What tone should it use?", "The overall mood or attitude of the response", (
+        Option("professional", "Professional", "Formal, business-appropriate"),
+        Option("friendly", "Friendly", "Warm, approachable, casual"),
+        Option("authoritative", "Authoritative", "Confident, expert-like"),
+        Option("enthusiastic", "Enthusiastic", "Energetic, passionate"),
+        Option("neutral", "Neutral", "Objective, unbiased"),
+        Option("humorous", "Humorous", "Funny, lighthearted"),
+    )),
+)
+
+WIZARD_CARD = '''
+        <a href="{href}" class="step-card">
             <div class="step-icon">
-                <i class="{icon_class}"></i>
+                <i class="{icon}"></i>
             </div>
             <h3 style="margin: 0; color: #333;">{label}</h3>
             <p style="margin: 0; color: #666; font-size: 0.9rem;">{description}</p>
         </a>
         '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 4: What style do you prefer?</h1>
-                <p>How should the AI structure its response?</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Platform</div>
-                    <div class="progress-step active">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} on {platform.capitalize()}</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {style_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/3?goal={goal}&audience={audience}" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 3
-            </a>
-        </div>
-    </article>
-    '''
-    
-    return layout("Step 4: Style Selection", content, step=4)
-# ========== STEP 5: TONE SELECTION ==========
-@router.get("/prompt-wizard/step/5")
-async def step5(goal: str = Query("explain"), audience: str = Query("general"), 
-                platform: str = Query("chatgpt"), style: str = Query("direct")):
-    tones = [
-        ("professional", "Professional", "Formal, business-appropriate"),
-        ("friendly", "Friendly", "Warm, approachable, casual"),
-        ("authoritative", "Authoritative", "Confident, expert-like"),
-        ("enthusiastic", "Enthusiastic", "Energetic, passionate"),
-        ("neutral", "Neutral", "Objective, unbiased"),
-        ("humorous", "Humorous", "Funny, lighthearted"),
-    ]
-    
-    tone_cards = ""
-    for value, label, description in tones:
-        icon_class = ICON_MAP.get(value, "fa-solid fa-question")
-        
-        tone_cards += f'''
-        <a href="/prompt-wizard/step/6?goal={goal}&audience={audience}&platform={platform}&style={style}&tone={value}" class="step-card">
-            <div class="step-icon">
-                <i class="{icon_class}"></i>
-            </div>
-            <h3 style="margin: 0; color: #333;">{label}</h3>
-            <p style="margin: 0; color: #666; font-size: 0.9rem;">{description}</p>
-        </a>
-        '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 5: What tone should it use?</h1>
-                <p>The overall mood or attitude of the response</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Platform</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step active">5. Tone</div>
-                    <div class="progress-step">6. Prompt</div>
-                </div>
-            </div>
-            
-            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
-                <p><strong>Selected:</strong> {goal.capitalize()} for {audience.capitalize()} on {platform.capitalize()} in {style} style</p>
-            </div>
-        </header>
-        
-        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
-            {tone_cards}
-        </div>
-        
-        <div style="text-align: center; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/4?goal={goal}&audience={audience}&platform={platform}" class="secondary">
-                <i class="fas fa-arrow-left"></i> Back to Step 4
-            </a>
-        </div>
-    </article>
-    '''
-    
-    return layout("Step 5: Tone Selection", content, step=5)
-# ========== STEP 6: PROMPT INPUT ==========
-@router.get("/prompt-wizard/step/6")
-async def step6(goal: str = Query("explain"), audience: str = Query("general"), 
-                platform: str = Query("chatgpt"), style: str = Query("direct"), 
-                tone: str = Query("professional")):
-    
-    # Create a summary of selections
-    selections = f'''
-    <div class="card secondary" style="margin: 1rem 0 2rem 0;">
-        <div class="grid" style="grid-template-columns: repeat(5, 1fr); gap: 0.5rem; text-align: center;">
-            <div>
-                <small>Goal</small><br>
-                <strong>{goal.capitalize()}</strong>
-            </div>
-            <div>
-                <small>Audience</small><br>
-                <strong>{audience.capitalize()}</strong>
-            </div>
-            <div>
-                <small>Platform</small><br>
-                <strong>{platform.capitalize()}</strong>
-            </div>
-            <div>
-                <small>Style</small><br>
-                <strong>{style.replace('-', ' ').title()}</strong>
-            </div>
-            <div>
-                <small>Tone</small><br>
-                <strong>{tone.capitalize()}</strong>
-            </div>
-        </div>
-    </div>
-    '''
-    
-    content = f'''
-    <article>
-        <header style="text-align: center; margin-bottom: 2rem;">
-            <hgroup>
-                <h1>Step 6: Enter Your Prompt</h1>
-                <p>Type your original prompt, and AI will optimize it</p>
-            </hgroup>
-            
-            <div class="progress-container">
-                <div class="progress-bar">
-                    <div class="progress-fill"></div>
-                </div>
-                <div class="progress-steps">
-                    <div class="progress-step">1. Goal</div>
-                    <div class="progress-step">2. Audience</div>
-                    <div class="progress-step">3. Platform</div>
-                    <div class="progress-step">4. Style</div>
-                    <div class="progress-step">5. Tone</div>
-                    <div class="progress-step active">6. Prompt</div>
-                </div>
-            </div>
-            
-            {selections}
-        </header>
-        
-        <form id="promptForm" action="/prompt-wizard/generate" method="get" 
+
+WIZARD_FORM = f'''
+        <form id="promptForm" action="{ROOT}/prompt-wizard/generate" method="get" 
               onsubmit="showLoading(); return true;">
-            <!-- Hidden fields to pass selections -->
-            <input type="hidden" name="goal" value="{goal}">
-            <input type="hidden" name="audience" value="{audience}">
-            <input type="hidden" name="platform" value="{platform}">
-            <input type="hidden" name="style" value="{style}">
-            <input type="hidden" name="tone" value="{tone}">
+            {FORM_FIELDS}
             
             <div class="grid">
                 <div>
@@ -880,7 +555,7 @@ async def step6(goal: str = Query("explain"), audience: str = Query("general"),
                     <i class="fas fa-magic"></i> Generate Optimized Prompt
                 </button>
                 
-                <a href="/prompt-wizard/step/5?goal={goal}&audience={audience}&platform={platform}&style={style}" 
+                <a href="{BACK}"
                    class="secondary" style="margin-left: 1rem;">
                     <i class="fas fa-arrow-left"></i> Back
                 </a>
@@ -903,7 +578,6 @@ async def step6(goal: str = Query("explain"), audience: str = Query("general"),
                 <p><small>Do not refresh the page</small></p>
             </div>
         </div>
-    </article>
     
     <script>
         function showLoading() {{
@@ -917,26 +591,71 @@ async def step6(goal: str = Query("explain"), audience: str = Query("general"),
             document.getElementById('loading').scrollIntoView({{ behavior: 'smooth' }});
         }}
     </script>
-    '''
-    
-    return layout("Step 6: Enter Your Prompt", content, step=6)
+'''
+
+WIZARD = Wizard("/prompt-wizard", WIZARD_STEPS, WIZARD_FORM, lambda title, content: page_html(title, content, root=ROOT),
+                icons=ICON_MAP, exit_url="/", exit_label="Back to Home", card=WIZARD_CARD)
+
+
+# ========== WIZARD STEPS ==========
+@router.get("/prompt-wizard/step/{number}")
+async def step(request: Request, number: int):
+    root = request.scope.get("root_path", "")
+    page = WIZARD.render(number, request.query_params, root)
+    if page is None:
+        return RedirectResponse(f"{root}/prompt-wizard/step/1")
+    if not WIZARD.known(number, request.query_params):
+        # Made-up choices: don't let them fill the precompressed cache; the
+        # compression middleware handles this one at its normal level
+        return HTMLResponse(page)
+    return precompressed_response(request, page)
 # ========== GENERATE FINAL PROMPT ==========
 @router.get("/prompt-wizard/generate")
 async def generate_prompt(
+    request: Request,
+    background_tasks: BackgroundTasks,
     goal: str = Query("explain"),
     audience: str = Query("general"),
     platform: str = Query("chatgpt"),
     style: str = Query("direct"),
     tone: str = Query("professional"),
     prompt: str = Query(""),
+    session: str = Cookie(default=None),
 ):
     """GET route - works with URL parameters"""
+    root = request.scope.get("root_path", "")
     
-    # Token check happens automatically before this point
-    # If tokens insufficient, HTTPException is raised
+    # 1. AUTHENTICATION
+    email = session_email(session)
+    if not email:
+        return RedirectResponse(f"/login?next={root}/prompt-wizard/step/1")
     
-    # Call DeepSeek API with your parameters
-    optimized_prompt = call_deepseek_api(goal, audience, tone, platform, prompt)
+    # 2. RESERVE TOKENS (price from the app catalog) before spending anything on the API
+    bank = get_bank_client()
+    cost = get_catalog().cost(APP_ID, "optimize")
+    try:
+        hold = await bank.reserve(email, APP_ID, cost, f"Prompt: {prompt[:50]}")
+    except InsufficientTokens:
+        return layout("Not enough tokens", f'''
+    <article style="text-align: center;">
+        <h2><i class="fas fa-coins"></i> Not enough tokens</h2>
+        <p>A prompt costs {cost} tokens.</p>
+        <a href="/dashboard" role="button">Get more tokens</a>
+    </article>''', step=7, root=root, status_code=402)
+    except BankUnavailable as e:
+        print(f"Token hold error: {e}")
+        return layout("Bank Error", "<article><h2>Token system unavailable</h2></article>",
+                      step=7, root=root, status_code=503)
+    
+    # 3. CALL DEEPSEEK, then capture the hold on success or give it back on failure
+    # (on a worker thread: the client's retries block for up to LLM_DEADLINE)
+    try:
+        optimized_prompt = await asyncio.to_thread(optimize_prompt, goal, audience, tone, platform, prompt)
+    except Exception as e:
+        background_tasks.add_task(settle_hold, hold["hold_id"], "release")
+        optimized_prompt = failed_prompt(e, audience, tone, prompt)
+    else:
+        background_tasks.add_task(settle_hold, hold["hold_id"], "capture")
     
     # Your entire HTML template logic stays EXACTLY the same
     content = f'''
@@ -1021,7 +740,7 @@ async def generate_prompt(
         </div>
         
         <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem; margin-top: 3rem;">
-            <a href="/prompt-wizard/step/1" class="primary" style="text-align: center; padding: 1rem;">
+            <a href="{root}/prompt-wizard/step/1" class="primary" style="text-align: center; padding: 1rem;">
                 <i class="fas fa-redo"></i> Create Another Prompt
             </a>
             
@@ -1032,6 +751,6 @@ async def generate_prompt(
     </article>
     '''
     
-    return layout("Generated Prompt", content, step=7)
+    return layout("Generated Prompt", content, step=7, root=root)
 
 print("🟢 3. Reached end of file...")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Production launcher: one app, several uvicorn worker processes.
+
+    python serve.py [module:app] [--workers N] [--port P] [--host H] [--force]
+
+Defaults: clean_app:app, WEB_CONCURRENCY workers (or 1), PORT (or 10000).
+
+It loads .env (ENV_FILE, default .env next to this file) before anything
+else, since several settings (SESSION_BACKEND, STATELESS_SESSIONS,
+PROMPT_WIZARD_SPA, ...) are read when the app is imported; variables already
+in the environment win. With plain uvicorn, pass --env-file .env instead.
+
+Before forking it imports the app once, switches the bank database to WAL
+and refuses to start more than one worker while any of our modules keeps
+request state in a module-level dict/list/set (see shared/worker_safety.py).
+--force starts anyway.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from shared.worker_safety import check_multi_worker, enable_wal
+
+
+def load_env():
+    """.env into os.environ; workers inherit it"""
+    from dotenv import load_dotenv
+    load_dotenv(os.getenv("ENV_FILE", os.path.join(ROOT, ".env")))
+
+
+def our_modules():
+    """Loaded modules that come from this repository"""
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None) or ""
+        if path.startswith(ROOT + os.sep) and os.sep + "site-packages" + os.sep not in path:
+            yield module
+
+
+def preflight(target, workers):
+    """Import the app and return the problems that block multi-worker mode"""
+    module_name, _, attr = target.partition(":")
+    module = importlib.import_module(module_name)
+    if not hasattr(module, attr or "app"):
+        raise SystemExit(f"❌ {module_name} has no attribute {attr or 'app'}")
+    journal = enable_wal()
+    print(f"🗄️ Bank database journal mode: {journal}")
+    return check_multi_worker(our_modules(), workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("target", nargs="?", default="clean_app:app")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "10000")))
+    parser.add_argument("--force", action="store_true", help="start even if the checks fail")
+    args = parser.parse_args(argv)
+
+    load_env()
+    problems = preflight(args.target, args.workers)
+    for problem in problems:
+        print(f"⚠️ {problem}")
+    if problems and not args.force:
+        raise SystemExit(f"❌ Not safe to run {args.workers} workers (use --workers 1 or --force)")
+
+    import uvicorn
+    print(f"🚀 {args.target} on {args.host}:{args.port} with {args.workers} worker(s)")
+    # uvicorn needs the import string (not the object) to spawn workers
+    uvicorn.run(args.target, host=args.host, port=args.port, workers=args.workers,
+                app_dir=ROOT, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import hashlib
 import os
+import secrets
 import sqlite3
+import time
 from itsdangerous import URLSafeTimedSerializer
 
 SECRET_KEY = "your-secret-key-change-in-production"
@@ -7,6 +10,10 @@ serializer = URLSafeTimedSerializer(SECRET_KEY)
 
 def get_db_path():
     """Get the absolute path to bank.db, works both locally and on Render"""
+    # Explicit override (tests, multi-instance deployments)
+    if os.getenv("BANK_DB_PATH"):
+        return os.getenv("BANK_DB_PATH")
+    
     # Try several possible locations
     possible_paths = [
         os.path.join(os.path.dirname(__file__), 'bank.db'),  # Next to auth.py
@@ -25,74 +32,108 @@ def get_db_path():
     print(f"⚠️ Database not found, will create at: {default_path}")
     return default_path
 
+# Magic-link / session tokens are opaque: 128 random bits, stored only as a
+# 16-byte BLAKE2b hash in `sessions`. Verifying one is a single primary-key
+# lookup, no signature to decode. Tokens with a "." are the older
+# itsdangerous ones (magic_links table), still honoured until they expire.
+MAGIC_LINK_TTL = int(os.getenv("MAGIC_LINK_TTL", "900"))
+
+def token_hash(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def ensure_sessions_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions
+                    (token_hash BLOB PRIMARY KEY, email TEXT NOT NULL, created REAL NOT NULL,
+                     expires REAL NOT NULL, used INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)')
+
 def verify_magic_link(token: str, max_age=900, mark_used=True):
     """Verify magic link token"""
     
-    print(f"🔍 VERIFY called with token: {token[:30]}...")
-    
-    # Handle test tokens (simple tokens used locally)
-    if token.startswith("test_"):
-        print(f"🔍 Test token detected, returning email after 'test_' prefix")
+    # Handle test tokens (simple tokens used locally). Never in production:
+    # anyone can write "test_<email>" into a cookie.
+    if token.startswith("test_") and os.getenv("RENDER") is None:
         return token[5:]  # Remove "test_" prefix
     
-    # Handle JWT tokens (used on Render)
+    if "." in token:
+        return _verify_legacy_magic_link(token, max_age, mark_used)
+    
+    try:
+        now = time.time()
+        conn = sqlite3.connect(get_db_path())
+        c = conn.cursor()
+        if mark_used:
+            # Claim the token in one statement, so two requests racing with the
+            # same link can't both get in. Expire it too, so the compactor's
+            # expires index finds used rows.
+            c.execute("UPDATE sessions SET used = 1, expires = ? "
+                      "WHERE token_hash = ? AND used = 0 AND expires > ? AND created > ?",
+                      (now, token_hash(token), now, now - max_age))
+            if c.rowcount == 0:
+                print(f"🔍 Token unknown, expired or already used")
+                conn.close()
+                return None
+            c.execute("SELECT email FROM sessions WHERE token_hash = ?", (token_hash(token),))
+            result = c.fetchone()
+            conn.commit()
+        else:
+            c.execute("SELECT email FROM sessions WHERE token_hash = ? AND used = 0 AND expires > ? AND created > ?",
+                      (token_hash(token), now, now - max_age))
+            result = c.fetchone()
+            if not result:
+                print(f"🔍 Token unknown, expired or already used")
+        
+        conn.close()
+        return result[0] if result else None
+    
+    except sqlite3.Error as e:
+        print(f"🔍 ERROR in verification: {type(e).__name__}: {e}")
+        return None
+
+def _verify_legacy_magic_link(token: str, max_age, mark_used):
+    """itsdangerous tokens issued before the switch to opaque ones"""
     try:
-        print(f"🔍 Attempting JWT decode...")
         email = serializer.loads(token, salt="magic-link", max_age=max_age)
-        print(f"🔍 JWT decoded to: {email}")
         
         # Check database
-        db_path = get_db_path()
-        conn = sqlite3.connect(db_path)
+        conn = sqlite3.connect(get_db_path())
         c = conn.cursor()
         
-        c.execute("SELECT used FROM magic_links WHERE token = ?", (token,))
-        result = c.fetchone()
+        if mark_used:
+            # Check and mark in one statement (see verify_magic_link)
+            c.execute("UPDATE magic_links SET used = TRUE WHERE token = ? AND NOT used", (token,))
+            found = c.rowcount > 0
+            conn.commit()
+        else:
+            c.execute("SELECT used FROM magic_links WHERE token = ?", (token,))
+            result = c.fetchone()
+            found = bool(result) and not result[0]
         
-        if not result:
-            print(f"🔍 Token not found in database!")
-            conn.close()
-            return None
-            
-        if result[0]:  # Already used
-            print(f"🔍 Token already used")
+        if not found:
+            print(f"🔍 Legacy token not found or already used")
             conn.close()
             return None
-            
-        # Mark as used if requested
-        if mark_used:
-            c.execute("UPDATE magic_links SET used = TRUE WHERE token = ?", (token,))
-            conn.commit()
-            print(f"🔍 Token marked as used")
         
         conn.close()
-        print(f"🔍 SUCCESS! Verified: {email}")
         return email
         
     except Exception as e:
         print(f"🔍 ERROR in verification: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
         return None
 
-def store_magic_token(email: str, token: str) -> bool:
+def store_magic_token(email: str, token: str, ttl=MAGIC_LINK_TTL) -> bool:
     """Store a magic link token in database for later verification"""
-    import datetime
-    
     db_path = get_db_path()
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    
-    # Ensure table exists
-    c.execute('''CREATE TABLE IF NOT EXISTS magic_links
-                 (token TEXT PRIMARY KEY, email TEXT, created DATETIME, used BOOLEAN)''')
     
-    # Store the token
+    # Store only the hash: a leaked database doesn't leak live sessions
     try:
-        c.execute("INSERT OR REPLACE INTO magic_links VALUES (?, ?, ?, ?)",
-                  (token, email, datetime.datetime.utcnow(), False))
+        ensure_sessions_table(conn)
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO sessions (token_hash, email, created, expires) VALUES (?, ?, ?, ?)",
+                     (token_hash(token), email, now, now + ttl))
         conn.commit()
-        print(f"📝 Stored token for {email}: {token[:30]}...")
+        print(f"📝 Stored session for {email}")
         success = True
     except Exception as e:
         print(f"❌ Failed to store token: {e}")
@@ -104,15 +145,14 @@ def store_magic_token(email: str, token: str) -> bool:
 
 def create_magic_link(email: str) -> str:
     """Generate a magic link token"""
-    import os
     
     # Detect environment
     is_render = os.getenv("RENDER") is not None
     
     if is_render:
-        # PRODUCTION (Render): Use JWT tokens
-        token = serializer.dumps(email, salt="magic-link")
-        print(f"🔐 PRODUCTION: Created JWT token for {email}")
+        # PRODUCTION (Render): opaque random token, 128 bits
+        token = secrets.token_urlsafe(16)
+        print(f"🔐 PRODUCTION: Created session token for {email}")
     else:
         # LOCAL DEVELOPMENT: Use simple tokens for debugging
         token = f"test_{email}"
@@ -121,4 +161,3 @@ def create_magic_link(email: str) -> str:
     # Store in database (works for both)
     store_magic_token(email, token)
     return token
-
@@ -0,0 +1,108 @@
+"""In-process pub/sub for balance changes, feeding the dashboard's SSE stream.
+
+central_bank publishes the new balance whenever it changes one (spend,
+deposit, hold, release, settlement). Each open /balance/events connection is
+a Subscription: an asyncio.Event plus the latest event, no queue and no task
+of its own, so thousands of idle dashboards cost little more than their
+sockets. Only the newest balance matters, so events that arrive faster than
+a client reads them are conflated.
+
+Publishers may run in worker threads (sync FastAPI routes, asyncio.to_thread
+in the local bank client); wake-ups are handed to the subscriber's loop with
+call_soon_threadsafe. Events only reach subscribers in the same process as
+the bank, so the SSE stream also re-reads the balance every
+BALANCE_RESYNC_INTERVAL seconds to catch changes made by other workers.
+"""
+import asyncio
+import os
+import threading
+
+HEARTBEAT_INTERVAL = float(os.getenv("BALANCE_HEARTBEAT_INTERVAL", "25"))
+RESYNC_INTERVAL = float(os.getenv("BALANCE_RESYNC_INTERVAL", "60"))
+
+
+class Subscription:
+    __slots__ = ("hub", "email", "latest", "_loop", "_event")
+
+    def __init__(self, hub, email):
+        self.hub = hub
+        self.email = email
+        self.latest = None
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def push(self, event):
+        self.latest = event
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._event.set()
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                pass  # loop already closed: the connection is gone
+
+    async def next(self, timeout=None):
+        """Newest event, or None if nothing arrived within timeout"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        event, self.latest = self.latest, None
+        return event
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class BalanceHub:
+    def __init__(self):
+        self._subscribers = {}  # email -> set of Subscription
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def watching(self, email):
+        """Anyone listening for this email? Lets publishers skip extra reads."""
+        return email in self._subscribers
+
+    def subscribe(self, email):
+        """Must be called from the event loop that will read the subscription"""
+        subscription = Subscription(self, email)
+        with self._lock:
+            self._subscribers.setdefault(email, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.email)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.email]
+
+    def publish(self, email, balance, delta=None, reason=""):
+        """Push a new balance to everyone watching email. Returns how many were told."""
+        if email not in self._subscribers:
+            return 0
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(email, ()))
+        event = {"balance": balance, "delta": delta, "reason": reason}
+        for subscription in subscribers:
+            subscription.push(event)
+        self.published += 1
+        return len(subscribers)
+
+    def metrics(self):
+        with self._lock:
+            connections = sum(len(subscribers) for subscribers in self._subscribers.values())
+            users = len(self._subscribers)
+        return {"connections": connections, "users": users, "published": self.published}
+
+
+balance_hub = BalanceHub()
+# Subscribers are this worker's open streams; other workers' changes arrive by resync
+WORKER_LOCAL = ("balance_hub",)
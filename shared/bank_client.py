@@ -0,0 +1,169 @@
+"""One way for every app to talk to the central bank.
+
+Two interchangeable backends:
+- LocalBankClient: calls central_bank functions in-process (no HTTP at all)
+- HttpBankClient: pooled keep-alive async client for a bank running elsewhere
+
+get_bank_client() picks one from BANK_CLIENT ("local" or "http", default local)
+and CENTRAL_BANK_URL.
+"""
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+
+
+class BankError(Exception):
+    pass
+
+
+class InsufficientTokens(BankError):
+    pass
+
+
+class HoldNotFound(BankError):
+    pass
+
+
+class BankUnavailable(BankError):
+    pass
+
+
+class BankClient(ABC):
+    """Interface shared by both backends (all methods are async)"""
+
+    @abstractmethod
+    async def get_balance(self, email: str) -> int:
+        ...
+
+    @abstractmethod
+    async def spend(self, email: str, app_id: str, tokens: int, description: str = "") -> int:
+        """Deduct tokens now. Returns the remaining balance."""
+
+    @abstractmethod
+    async def reserve(self, email: str, app_id: str, tokens: int, description: str = "",
+                      ttl_seconds: int = 300) -> dict:
+        """Hold tokens for an operation. Returns the hold (hold_id, remaining, ...)."""
+
+    @abstractmethod
+    async def capture(self, hold_id: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def release(self, hold_id: str) -> dict:
+        ...
+
+    async def can_spend(self, email: str, tokens: int) -> bool:
+        return await self.get_balance(email) >= tokens
+
+    async def aclose(self):
+        pass
+
+
+class LocalBankClient(BankClient):
+    """Direct calls into central_bank; SQLite work runs in a worker thread"""
+
+    def __init__(self):
+        import central_bank
+        self._bank = central_bank
+
+    async def _call(self, func, *args):
+        """func(*args) in a thread; database errors become BankUnavailable, as HTTP errors do"""
+        try:
+            return await asyncio.to_thread(func, *args)
+        except sqlite3.Error as e:
+            raise BankUnavailable(f"{type(e).__name__}: {e}") from e
+
+    async def get_balance(self, email):
+        return await self._call(self._bank.get_balance, email)
+
+    async def spend(self, email, app_id, tokens, description=""):
+        return await self._call(self._bank.spend_now, email, app_id, tokens, description)
+
+    async def reserve(self, email, app_id, tokens, description="", ttl_seconds=300):
+        return await self._call(self._bank.reserve_tokens, email, tokens, app_id, description, ttl_seconds)
+
+    async def capture(self, hold_id):
+        return await self._call(self._bank.capture_hold, hold_id)
+
+    async def release(self, hold_id):
+        return await self._call(self._bank.release_hold, hold_id)
+
+
+class HttpBankClient(BankClient):
+    """Bank over HTTP with one pooled keep-alive connection set per process"""
+
+    def __init__(self, base_url=None, max_connections=20, timeout=5.0):
+        import httpx
+        self._httpx = httpx
+        self.base_url = base_url or os.getenv("CENTRAL_BANK_URL", "http://localhost:8000")
+        from shared.internal_auth import internal_headers
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=internal_headers(),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def _request(self, method, path, **kwargs):
+        try:
+            response = await self._client.request(method, path, **kwargs)
+        except self._httpx.HTTPError as e:
+            raise BankUnavailable(f"{type(e).__name__}: {e}")
+        if response.status_code == 402:
+            raise InsufficientTokens(kwargs.get("json", {}).get("email"))
+        if response.status_code == 404 and path.startswith("/holds/"):
+            raise HoldNotFound(path)
+        if response.status_code != 200:
+            raise BankUnavailable(f"Bank returned {response.status_code}: {response.text}")
+        return response.json()
+
+    async def get_balance(self, email):
+        data = await self._request("GET", "/balance", params={"email": email})
+        return data["balance"]
+
+    async def spend(self, email, app_id, tokens, description=""):
+        data = await self._request("POST", "/spend", json={
+            "email": email, "app_id": app_id, "tokens": tokens, "description": description
+        })
+        return data["remaining"]
+
+    async def reserve(self, email, app_id, tokens, description="", ttl_seconds=300):
+        return await self._request("POST", "/holds", json={
+            "email": email, "app_id": app_id, "tokens": tokens,
+            "description": description, "ttl_seconds": ttl_seconds
+        })
+
+    async def capture(self, hold_id):
+        return await self._request("POST", f"/holds/{hold_id}/capture")
+
+    async def release(self, hold_id):
+        return await self._request("POST", f"/holds/{hold_id}/release")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+async def settle_hold(hold_id: str, action: str):
+    """Capture or release a token hold (e.g. as a background task); unsettled holds expire on their own"""
+    bank = get_bank_client()
+    try:
+        if action == "capture":
+            await bank.capture(hold_id)
+        else:
+            await bank.release(hold_id)
+    except BankError as e:
+        print(f"Token hold {action} failed: {e}")
+
+
+_bank_client = None
+
+
+def get_bank_client() -> BankClient:
+    """Process-wide bank client chosen by BANK_CLIENT"""
+    global _bank_client
+    if _bank_client is None:
+        mode = os.getenv("BANK_CLIENT", "local").lower()
+        _bank_client = HttpBankClient() if mode == "http" else LocalBankClient()
+        print(f"🏦 Bank client: {type(_bank_client).__name__}")
+    return _bank_client
@@ -0,0 +1,134 @@
+"""The app catalog: every app, its dashboard card and what its operations cost.
+
+app_catalog.json (APP_CATALOG_PATH) is the only place prices are written
+down; billing (bank reservations, the thumbnail proxy, passports, the
+passport middleware) and the dashboard all read them from here.
+
+get_catalog() returns an immutable Catalog. reload_catalog() builds a new
+one and swaps it in with a single assignment, so a price change needs no
+restart and a request that took the catalog once keeps a consistent view
+until it finishes. Apps with a running server can call watch_catalog() from
+a startup hook to pick up edits to the file every
+APP_CATALOG_RELOAD_INTERVAL seconds.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+CATALOG_PATH = os.getenv("APP_CATALOG_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                          "app_catalog.json"))
+RELOAD_INTERVAL = float(os.getenv("APP_CATALOG_RELOAD_INTERVAL", "30"))
+
+
+class CatalogError(ValueError):
+    pass
+
+
+class AppEntry(NamedTuple):
+    app_id: str
+    name: str
+    icon: str
+    url: str
+    description: str
+    costs: Mapping[str, int]  # operation -> tokens, read-only
+    status: str = "ready"
+
+    @property
+    def cost(self) -> int:
+        """Price shown on the dashboard card: the app's first operation"""
+        return next(iter(self.costs.values()), 0)
+
+
+class Catalog:
+    """Immutable snapshot of app_catalog.json"""
+
+    __slots__ = ("apps", "version", "_by_id")
+
+    def __init__(self, apps: Tuple[AppEntry, ...], version: str):
+        object.__setattr__(self, "apps", apps)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "_by_id", MappingProxyType({app.app_id: app for app in apps}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Catalog is immutable; use reload_catalog()")
+
+    def __contains__(self, app_id):
+        return app_id in self._by_id
+
+    def app(self, app_id) -> AppEntry:
+        try:
+            return self._by_id[app_id]
+        except KeyError:
+            raise CatalogError(f"Unknown app: {app_id}") from None
+
+    def cost(self, app_id, operation=None) -> int:
+        """Tokens for one operation of app_id (its first operation if not given)"""
+        app = self.app(app_id)
+        if operation is None:
+            return app.cost
+        try:
+            return app.costs[operation]
+        except KeyError:
+            raise CatalogError(f"Unknown operation {operation!r} for {app_id}") from None
+
+    def pricing(self):
+        """{app_id: {operation: cost}}, the shape of the old pricing.PRICING"""
+        return {app.app_id: dict(app.costs) for app in self.apps}
+
+
+def parse_catalog(raw: bytes) -> Catalog:
+    """Catalog from the JSON file's bytes; CatalogError if it is malformed"""
+    try:
+        data = json.loads(raw)
+        apps = tuple(AppEntry(app_id=entry["app_id"], name=entry["name"], icon=entry.get("icon", ""),
+                              url=entry.get("url", ""), description=entry.get("description", ""),
+                              costs=MappingProxyType({op: int(cost) for op, cost in entry["costs"].items()}),
+                              status=entry.get("status", "ready"))
+                     for entry in data["apps"])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise CatalogError(f"Bad app catalog: {type(e).__name__}: {e}") from None
+    if len({app.app_id for app in apps}) != len(apps):
+        raise CatalogError("Bad app catalog: duplicate app_id")
+    if any(cost < 0 for app in apps for cost in app.costs.values()):
+        raise CatalogError("Bad app catalog: negative cost")
+    return Catalog(apps, hashlib.blake2b(raw, digest_size=8).hexdigest())
+
+
+_catalog = None
+_catalog_mtime = None
+_reload_lock = threading.Lock()
+
+
+def reload_catalog(path=None) -> Catalog:
+    """Read the file again and swap the new catalog in. A bad file leaves the old one in place."""
+    global _catalog, _catalog_mtime
+    path = path or CATALOG_PATH
+    with _reload_lock:
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            catalog = parse_catalog(f.read())
+        if _catalog is not None and catalog.version != _catalog.version:
+            print(f"📒 App catalog reloaded: version {catalog.version}")
+        _catalog, _catalog_mtime = catalog, mtime
+        return catalog
+
+
+def get_catalog() -> Catalog:
+    """Current catalog (loaded on first use). Take it once per request."""
+    return _catalog or reload_catalog()
+
+
+async def watch_catalog(interval=RELOAD_INTERVAL, path=None):
+    """Reload whenever the file changes. Runs until cancelled."""
+    path = path or CATALOG_PATH
+    while interval > 0:
+        await asyncio.sleep(interval)
+        try:
+            if os.stat(path).st_mtime_ns != _catalog_mtime:
+                await asyncio.to_thread(reload_catalog, path)
+        except (OSError, CatalogError) as e:
+            print(f"⚠️ App catalog not reloaded: {e}")
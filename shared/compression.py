@@ -0,0 +1,151 @@
+"""HTTP response compression: gzip, and brotli when the package is installed.
+
+CompressionMiddleware compresses whole responses (one body message, which is
+every plain Response) of a compressible type once they reach
+COMPRESSION_MINIMUM_SIZE bytes, picking the encoding from Accept-Encoding.
+Streaming responses (SSE, job events, files) pass through untouched, as do
+responses that already carry a Content-Encoding.
+
+Pages that are the same for every request (wizard steps, the single-page
+wizard bundle) should not be recompressed each time: precompressed_response()
+compresses a body once per encoding, at the highest levels, and keeps the
+results for the PRECOMPRESSED_CACHE_SIZE most recent bodies.
+
+brotli is optional (pip install brotli); without it only gzip is offered.
+"""
+import functools
+import gzip
+import os
+from typing import NamedTuple, Optional
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+PRECOMPRESSED_CACHE_SIZE = int(os.getenv("PRECOMPRESSED_CACHE_SIZE", "512"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+@functools.lru_cache(maxsize=None)
+def brotli_module():
+    """The brotli module, or None when it isn't installed (imported on first use)"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def available_encodings():
+    """Encodings we can produce, best first"""
+    return ("br", "gzip") if brotli_module() else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts (q > 0), or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip()] = q
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, best=False) -> bytes:
+    """body in encoding; best=True spends the CPU on the smallest output (for cached bodies)"""
+    if encoding == "br":
+        return brotli_module().compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) and "text/event-stream" not in content_type
+
+
+class Precompressed(NamedTuple):
+    identity: bytes
+    encoded: dict  # encoding -> compressed bytes
+
+
+@functools.lru_cache(maxsize=PRECOMPRESSED_CACHE_SIZE)
+def precompressed(body) -> Precompressed:
+    """body (str or bytes) compressed once in every available encoding"""
+    raw = body.encode() if isinstance(body, str) else body
+    if len(raw) < MINIMUM_SIZE:
+        return Precompressed(raw, {})
+    return Precompressed(raw, {encoding: compress(raw, encoding, best=True) for encoding in available_encodings()})
+
+
+def precompressed_response(request, body, media_type="text/html", status_code=200, headers=None):
+    """Response with the cached variant of body that this request accepts.
+
+    Pass the same str object per page (e.g. from a cache) so the lookup is cheap.
+    Only for bodies from a bounded set: anything a client can vary at will would
+    churn the cache and pay the highest compression level on every request.
+    """
+    from starlette.responses import Response
+    variants = precompressed(body)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    headers = dict(headers or {})
+    if variants.encoded:
+        headers["Vary"] = "Accept-Encoding"
+    if encoding in variants.encoded:
+        headers["Content-Encoding"] = encoding
+        return Response(variants.encoded[encoding], status_code=status_code, media_type=media_type, headers=headers)
+    return Response(variants.identity, status_code=status_code, media_type=media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """Compress single-message responses the client accepts an encoding for"""
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        from starlette.datastructures import Headers, MutableHeaders
+        self._Headers = Headers
+        self._MutableHeaders = MutableHeaders
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(self._Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough or message["type"] not in ("http.response.start", "http.response.body"):
+                # e.g. http.response.debug, which TemplateResponse sends under test clients
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message  # held back until we know what the body looks like
+                return
+            headers = self._MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if (message.get("more_body") or "content-encoding" in headers or len(body) < self.minimum_size
+                    or not is_compressible(headers.get("content-type", ""))):
+                passthrough = True
+                await send(start)
+                return await send(message)
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,192 @@
+"""Housekeeping for the bank database: drop dead login tokens, reclaim space.
+
+clean_app runs a Compactor pass every DB_COMPACTION_INTERVAL seconds. A pass
+deletes expired (or used) login tokens and sessions in batches of
+DB_COMPACTION_BATCH rows, each its own short write transaction so logins
+never wait long on the lock, and stops after DB_COMPACTION_MAX_BATCHES so
+one pass is bounded too. It then hands up to DB_VACUUM_PAGES free pages
+back to the filesystem (only in incremental auto-vacuum mode, see
+enable_incremental_vacuum) and runs PRAGMA optimize.
+
+Only one process compacts at a time: a pass first takes the "compactor" row
+in maintenance_leases, so with several workers the others skip their turn.
+The sizes kept for the metrics are the cheap page counts; row counts and
+per-table bytes (COUNT(*) and a dbstat scan) are for table_sizes(detailed=True).
+"""
+import asyncio
+import datetime
+import os
+import secrets
+import sqlite3
+import time
+
+from shared.auth import get_db_path, MAGIC_LINK_TTL
+
+COMPACTION_INTERVAL = float(os.getenv("DB_COMPACTION_INTERVAL", "600"))
+COMPACTION_BATCH = int(os.getenv("DB_COMPACTION_BATCH", "1000"))
+COMPACTION_MAX_BATCHES = int(os.getenv("DB_COMPACTION_MAX_BATCHES", "500"))
+VACUUM_PAGES = int(os.getenv("DB_VACUUM_PAGES", "2000"))
+
+# Tables whose row counts are reported in the metrics
+TOKEN_TABLES = ("sessions", "magic_links", "web_sessions")
+
+
+def _connect(db_path):
+    return sqlite3.connect(db_path, timeout=10, isolation_level=None)
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def purge_sessions(conn, now, batch_size):
+    """Delete one batch of expired sessions (used ones are expired on use). Returns rows deleted."""
+    return conn.execute('DELETE FROM sessions WHERE token_hash IN '
+                        '(SELECT token_hash FROM sessions WHERE expires < ? LIMIT ?)',
+                        (now, batch_size)).rowcount
+
+
+def purge_web_sessions(conn, now, batch_size):
+    """Delete one batch of expired login sessions (shared.session_store). Returns rows deleted."""
+    return conn.execute('DELETE FROM web_sessions WHERE id_hash IN '
+                        '(SELECT id_hash FROM web_sessions WHERE expires < ? LIMIT ?)',
+                        (now, batch_size)).rowcount
+
+
+def purge_legacy_magic_links(conn, now, batch_size):
+    """Delete one batch of old-style tokens that can no longer verify. Returns rows deleted."""
+    cutoff = str(datetime.datetime.utcfromtimestamp(now - MAGIC_LINK_TTL))
+    return conn.execute('DELETE FROM magic_links WHERE rowid IN '
+                        '(SELECT rowid FROM magic_links WHERE used OR created < ? LIMIT ?)',
+                        (cutoff, batch_size)).rowcount
+
+
+def table_sizes(conn, detailed=False):
+    """File and free bytes from the page counts. detailed also adds rows per token
+    table and bytes per table/index (bytes need the dbstat vtable); that reads
+    every page, so it is for benchmarks and one-off checks, not every pass."""
+    sizes = {"tables": {}, "file_bytes": None, "free_bytes": None}
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    sizes["file_bytes"] = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    sizes["free_bytes"] = conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    if not detailed:
+        return sizes
+    for table in TOKEN_TABLES:
+        if _has_table(conn, table):
+            sizes["tables"][table] = {"rows": conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]}
+    try:
+        for name, size in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"):
+            sizes["tables"].setdefault(name, {})["bytes"] = size
+    except sqlite3.OperationalError:
+        pass  # SQLite built without dbstat: rows and file size only
+    return sizes
+
+
+def take_lease(conn, name, holder, ttl, now=None):
+    """Claim (or renew) the named lease for holder. True if holder has it now."""
+    now = time.time() if now is None else now
+    conn.execute('CREATE TABLE IF NOT EXISTS maintenance_leases '
+                 '(name TEXT PRIMARY KEY, holder TEXT, expires REAL)')
+    # One statement, so two workers can't both see the lease as free
+    return conn.execute('INSERT INTO maintenance_leases VALUES (?, ?, ?) '
+                        'ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires '
+                        'WHERE maintenance_leases.holder = excluded.holder OR maintenance_leases.expires < ?',
+                        (name, holder, now + ttl, now)).rowcount == 1
+
+
+def enable_incremental_vacuum(db_path=None):
+    """One-off switch to incremental auto-vacuum. Runs a full VACUUM, so do it during quiet time."""
+    conn = _connect(db_path or get_db_path())
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+class Compactor:
+    def __init__(self, db_path=None, batch_size=COMPACTION_BATCH, max_batches=COMPACTION_MAX_BATCHES,
+                 vacuum_pages=VACUUM_PAGES):
+        self.db_path = db_path or get_db_path()
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.vacuum_pages = vacuum_pages
+        self.holder = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.leader = False
+        self.passes = 0
+        self.deleted_total = 0
+        self.last_pass = None
+        self.sizes = None
+
+    def run_once(self, measure=True):
+        """One bounded pass. Returns its stats (also kept for metrics())."""
+        started = time.perf_counter()
+        stats = {"deleted": {}, "batches": 0, "longest_batch_ms": 0.0, "freed_pages": 0}
+        conn = _connect(self.db_path)
+        try:
+            now = time.time()
+            for table, purge in (("sessions", purge_sessions), ("web_sessions", purge_web_sessions),
+                                 ("magic_links", purge_legacy_magic_links)):
+                stats["deleted"][table] = 0
+                if not _has_table(conn, table):
+                    continue
+                while stats["batches"] < self.max_batches:
+                    batch_started = time.perf_counter()
+                    deleted = purge(conn, now, self.batch_size)
+                    stats["batches"] += 1
+                    stats["longest_batch_ms"] = max(stats["longest_batch_ms"],
+                                                    (time.perf_counter() - batch_started) * 1000)
+                    stats["deleted"][table] += deleted
+                    if deleted < self.batch_size:
+                        break
+
+            if self.vacuum_pages > 0 and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # executescript steps the pragma to completion; execute() frees a single page
+                conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+                stats["freed_pages"] = free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("PRAGMA optimize")
+            if measure:
+                self.sizes = table_sizes(conn)
+        finally:
+            conn.close()
+
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["longest_batch_ms"] = round(stats["longest_batch_ms"], 2)
+        self.passes += 1
+        self.deleted_total += sum(stats["deleted"].values())
+        self.last_pass = stats
+        return stats
+
+    def take_turn(self, ttl):
+        """True if this process holds the compactor lease for the next ttl seconds"""
+        conn = _connect(self.db_path)
+        try:
+            self.leader = take_lease(conn, "compactor", self.holder, ttl)
+        finally:
+            conn.close()
+        return self.leader
+
+    def metrics(self):
+        return {
+            "leader": self.leader,
+            "passes": self.passes,
+            "deleted_total": self.deleted_total,
+            "last_pass": self.last_pass,
+            "sizes": self.sizes,
+        }
+
+    async def run_forever(self, interval=COMPACTION_INTERVAL):
+        while True:
+            try:
+                # The lease outlives one interval, so the leader keeps it while it is alive
+                if not await asyncio.to_thread(self.take_turn, interval * 2):
+                    await asyncio.sleep(interval)
+                    continue
+                stats = await asyncio.to_thread(self.run_once)
+                if any(stats["deleted"].values()):
+                    print(f"🧹 Compaction removed {stats['deleted']} in {stats['seconds']}s")
+            except Exception as e:
+                print(f"⚠️ DB compaction failed: {e}")
+            await asyncio.sleep(interval)
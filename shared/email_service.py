@@ -1,26 +1,21 @@
 import os
-import resend
 from shared.auth import create_magic_link  # ← CHANGED THIS LINE
-from dotenv import load_dotenv
 
-load_dotenv()
+# Nothing happens at import: .env and the resend SDK are only loaded when
+# the first email actually goes out (keeps them off the cold-start path)
+_env_loaded = False
 
-# Detect environment
-is_render = os.getenv("RENDER") is not None
-
-if is_render:
-    public_url = os.getenv("PUBLIC_URL", "https://promptsalchemy.com")
-    print(f"🔐 PRODUCTION: Using {public_url}")
-else:
-    public_url = "http://localhost:10000"
-    print(f"🔧 LOCAL: Using {public_url}")
-
-print(f"DEBUG: Loading .env from {os.path.abspath('.env')}")
-print(f"DEBUG: RESEND_API_KEY = {'SET' if os.getenv('RESEND_API_KEY') else 'NOT SET'}")
+def _load_env():
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 def send_magic_link_email(email: str):
     """Send magic link email via Resend.com"""
     print(f"📨 [email_service] Starting for {email}")
+    _load_env()
     
     try:
         # Create a proper token using shared.auth
@@ -44,6 +39,8 @@ def send_magic_link_email(email: str):
             return magic_link
         
         # ... rest of email sending code
+        import resend
+        resend.api_key = api_key
         print(f"📨 [email_service] Would send real email")
         return magic_link
         
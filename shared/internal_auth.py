@@ -0,0 +1,56 @@
+"""Shared-secret auth for service-to-service routes (the bank).
+
+The bank's routes move money (/deposit mints tokens) and must not be
+reachable by browsers. Wherever the bank is served over HTTP next to public
+apps (platform_app's /bank mount), InternalOnlyMiddleware lets a request
+through only with `X-Internal-Token: $BANK_INTERNAL_TOKEN`. Paths in
+`public_paths` check their own credentials (e.g. /settle and its app keys).
+Without BANK_INTERNAL_TOKEN nothing but those paths is reachable.
+
+Callers (HttpBankClient, TokenASGIMiddleware) add internal_headers() to
+their requests.
+"""
+import hmac
+import os
+
+HEADER = "x-internal-token"
+
+
+def internal_token():
+    """BANK_INTERNAL_TOKEN, read when used so a late-loaded .env still applies"""
+    return os.getenv("BANK_INTERNAL_TOKEN", "")
+
+
+def internal_headers():
+    """Headers that authenticate this service to the bank, if a token is configured"""
+    token = internal_token()
+    return {HEADER: token} if token else {}
+
+
+def is_internal(token, expected=None):
+    expected = internal_token() if expected is None else expected
+    return bool(expected) and bool(token) and hmac.compare_digest(token, expected)
+
+
+class InternalOnlyMiddleware:
+    """403 for requests without the internal token, except public_paths"""
+
+    def __init__(self, app, public_paths=(), token=None):
+        from starlette.datastructures import Headers
+        from starlette.responses import JSONResponse
+        self._Headers = Headers
+        self._JSONResponse = JSONResponse
+        self.app = app
+        self.public_paths = frozenset(public_paths)
+        self.token = token  # None: BANK_INTERNAL_TOKEN
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):  # newer starlette keeps the mount prefix in path
+            path = path[len(root_path):] or "/"
+        if path in self.public_paths or is_internal(self._Headers(scope=scope).get(HEADER), self.token):
+            return await self.app(scope, receive, send)
+        return await self._JSONResponse({"error": "Internal endpoint"}, status_code=403)(scope, receive, send)
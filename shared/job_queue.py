@@ -0,0 +1,247 @@
+"""SQLite-backed background job queue with a small worker pool.
+
+Jobs live in the `jobs` table of the bank database, so anything queued or
+running when the process dies is picked up again. Several processes may
+share the table (serve.py --workers N): a claimed job records its owner and
+a lease that the owner's WorkerPool keeps renewing, and only jobs whose lease
+ran out (their process is gone) are re-queued.
+"""
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from shared.auth import get_db_path
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# A running job whose owner hasn't renewed its lease for this long is presumed orphaned
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Longest pause of a worker after database errors, in seconds
+MAX_BACKOFF = 30.0
+
+
+class JobQueue:
+    def __init__(self, db_path=None, max_attempts=3, lease_seconds=LEASE_SECONDS):
+        self.db_path = db_path or get_db_path()
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        # Identifies this queue object (and so this process) as the owner of the jobs it claims
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._wakeup = threading.Condition()
+        self.init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                        (id TEXT PRIMARY KEY, kind TEXT, email TEXT, payload TEXT,
+                         status TEXT, result TEXT, error TEXT, attempts INTEGER DEFAULT 0,
+                         created REAL, started REAL, finished REAL)''')
+        columns = {row["name"] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created)')
+        conn.close()
+
+    def enqueue(self, kind, payload, email=None):
+        """Store a new job and wake a worker. Returns the job id."""
+        job_id = secrets.token_urlsafe(12)
+        conn = self._connect()
+        conn.execute('INSERT INTO jobs (id, kind, email, payload, status, created) VALUES (?, ?, ?, ?, ?, ?)',
+                     (job_id, kind, email, json.dumps(payload), QUEUED, time.time()))
+        conn.close()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest queued job to running. Returns a dict or None."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1', (QUEUED,)).fetchone()
+            if not row:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute('UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1, owner = ?, lease_until = ? '
+                         'WHERE id = ?', (RUNNING, now, self.owner, now + self.lease_seconds, row["id"]))
+            conn.execute('COMMIT')
+        except Exception:
+            # BEGIN itself may be what failed ("database is locked"): nothing to roll back then
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def complete(self, job_id, result):
+        return self._finish(job_id, DONE, result=result)
+
+    def fail(self, job_id, error):
+        return self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """Record the outcome, unless the lease was lost and another process owns the job now"""
+        conn = self._connect()
+        finished = conn.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL '
+                                'WHERE id = ? AND status = ? AND owner = ?',
+                                (status, result, error, time.time(), job_id, RUNNING, self.owner)).rowcount
+        conn.close()
+        if not finished:
+            print(f"⚠️ Job {job_id} is no longer ours (lease expired?); result dropped")
+        return bool(finished)
+
+    def renew_leases(self):
+        """Extend the lease of every job this queue is running. Returns how many."""
+        conn = self._connect()
+        renewed = conn.execute('UPDATE jobs SET lease_until = ? WHERE status = ? AND owner = ?',
+                               (time.time() + self.lease_seconds, RUNNING, self.owner)).rowcount
+        conn.close()
+        return renewed
+
+    def get(self, job_id):
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        if not row:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def recover(self):
+        """Re-queue running jobs whose lease expired (their process died); give up after max_attempts.
+
+        Jobs that live workers, in this process or a sibling, keep renewing are left alone.
+        """
+        now = time.time()
+        expired = 'status = ? AND (lease_until IS NULL OR lease_until < ?)'
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'UPDATE jobs SET status = ?, error = ?, finished = ?, owner = NULL, lease_until = NULL '
+                         f'WHERE {expired} AND attempts >= ?',
+                         (FAILED, "Worker stopped while processing this job", now, RUNNING, now, self.max_attempts))
+            requeued = conn.execute(f'UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL WHERE {expired}',
+                                    (QUEUED, RUNNING, now)).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        if requeued:
+            print(f"♻️ Re-queued {requeued} interrupted job(s)")
+        return requeued
+
+    def wait_for_work(self, timeout):
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+
+class WorkerPool:
+    """N threads pulling jobs from a JobQueue and running registered handlers"""
+
+    def __init__(self, queue, handlers, concurrency=None, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency or int(os.getenv("JOB_WORKERS", "2"))
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.queue.recover()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        print(f"👷 Started {self.concurrency} job worker(s)")
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self.queue._wakeup:
+            self.queue._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _heartbeat(self):
+        """Keep our leases alive and pick up jobs orphaned by processes that died"""
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.renew_leases()
+                if self.queue.recover():
+                    with self.queue._wakeup:
+                        self.queue._wakeup.notify_all()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+
+    def _run(self):
+        errors = 0
+        while not self._stop.is_set():
+            try:
+                worked = self._run_one()
+            except Exception as e:
+                # e.g. "database is locked" past the busy timeout: back off, don't let the thread die
+                errors += 1
+                delay = min(MAX_BACKOFF, self.poll_interval * 2 ** min(errors, 6))
+                print(f"⚠️ Job worker error, retrying in {delay:.1f}s: {type(e).__name__}: {e}")
+                self._stop.wait(delay)
+                continue
+            errors = 0
+            if not worked:
+                self.queue.wait_for_work(self.poll_interval)
+
+    def _run_one(self):
+        """Claim and run one job. False if there was none."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self._record(self.queue.fail, job["id"], f"No handler for job kind '{job['kind']}'")
+            return True
+        try:
+            result = handler(job["payload"])
+        except Exception as e:
+            traceback.print_exc()
+            self._record(self.queue.fail, job["id"], f"{type(e).__name__}: {e}")
+        else:
+            self._record(self.queue.complete, job["id"], result)
+        return True
+
+    def _record(self, finish, job_id, value):
+        """complete()/fail(), retried through database errors: a job we hold but
+        never finish would have its lease renewed forever. Gives up on stop()."""
+        delay = self.poll_interval
+        while True:
+            try:
+                return finish(job_id, value)
+            except sqlite3.Error as e:
+                if self._stop.is_set():
+                    raise
+                print(f"⚠️ Could not record job {job_id}, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(MAX_BACKOFF, delay * 2)
@@ -0,0 +1,326 @@
+"""Resilient client for the upstream LLM (DeepSeek chat completions).
+
+Every call goes through one shared client that:
+- retries retryable statuses / network errors with jittered exponential backoff
+- optionally hedges a second request once the first passes the observed p95
+- fails fast through a circuit breaker while upstream is unhealthy
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_API_URL = "https://api.deepseek.com/chat/completions"
+
+# 408/425/429 are "try again later", 5xx are upstream trouble
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Upstream call failed (after retries)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling upstream while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """True if a request may go upstream right now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one probe through
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def end_trial(self):
+        """The probe ended without a verdict: let the next call probe again"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "times_opened": self.times_opened,
+            }
+
+
+class LLMClient:
+    """Chat-completions caller with retry, hedging and a circuit breaker"""
+
+    def __init__(
+        self,
+        api_url=None,
+        attempt_timeout=30.0,
+        deadline=45.0,
+        max_attempts=3,
+        backoff_base=0.5,
+        backoff_cap=8.0,
+        hedge=False,
+        hedge_min_samples=20,
+        breaker=None,
+    ):
+        self.api_url = api_url or DEFAULT_API_URL
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+
+        import requests  # deferred: keeps it out of app cold start until the first LLM call
+        self._session = requests.Session()
+        # Timeouts, refused connections, broken chunked bodies, ...
+        self._transport_errors = (requests.RequestException,)
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge") if hedge else None
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "short_circuited": 0,
+        }
+
+    # ---------- metrics ----------
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def p95_latency(self):
+        """p95 of recent successful attempt latencies, or None if too few samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self._counters)
+        p95 = self.p95_latency()
+        return {
+            "breaker": self.breaker.snapshot(),
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedging": self.hedge,
+            **counters,
+        }
+
+    # ---------- calls ----------
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.backoff_cap, retry_after)
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _post(self, headers, payload, timeout):
+        """One HTTP attempt. Returns content or raises LLMError."""
+        started = time.monotonic()
+        try:
+            response = self._session.post(self.api_url, headers=headers, json=payload, timeout=timeout)
+        except self._transport_errors as e:
+            raise LLMError(f"{type(e).__name__}: {e}", status_code=None)
+
+        if response.status_code != 200:
+            error = LLMError(response.text, status_code=response.status_code)
+            error.retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            raise error
+
+        try:
+            content = response.json()["choices"][0]["message"]["content"].strip()
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Malformed API response: {e}", status_code=502)
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return content
+
+    def _attempt(self, headers, payload, timeout):
+        """One logical attempt, hedged with a second request after p95 if enabled"""
+        hedge_after = self.p95_latency() if self.hedge else None
+        if hedge_after is None or hedge_after >= timeout:
+            return self._post(headers, payload, timeout)
+
+        primary = self._executor.submit(self._post, headers, payload, timeout)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        self._count("hedges")
+        secondary = self._executor.submit(self._post, headers, payload, max(0.1, timeout - hedge_after))
+        pending = {primary, secondary}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except LLMError as e:
+                    last_error = e
+                    continue
+                if future is secondary:
+                    self._count("hedge_wins")
+                return result
+        raise last_error
+
+    def chat(self, messages, api_key, **params):
+        """Send a chat completion and return the message content.
+
+        Raises CircuitOpenError while upstream is marked unhealthy and
+        LLMError once retries are exhausted or the error is not retryable.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("AI service temporarily unavailable")
+
+        try:
+            return self._chat(messages, api_key, params)
+        finally:
+            # Whatever happened, a half-open probe must not stay "in flight"
+            self.breaker.end_trial()
+
+    def _chat(self, messages, api_key, params):
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        payload = {"model": "deepseek-chat", "messages": messages, **params}
+        give_up_at = time.monotonic() + self.deadline
+        last_error = None
+
+        for attempt in range(self.max_attempts):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt > 0:
+                self._count("retries")
+            try:
+                content = self._attempt(headers, payload, min(self.attempt_timeout, remaining))
+            except LLMError as e:
+                last_error = e
+                if e.status_code is not None and e.status_code not in RETRYABLE_STATUSES:
+                    # Our request is wrong (bad key, bad payload) - upstream is fine
+                    self.breaker.record_success()
+                    break
+                self.breaker.record_failure()
+                if attempt + 1 >= self.max_attempts or not self.breaker.allow():
+                    break
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                if time.monotonic() + delay >= give_up_at:
+                    break
+                time.sleep(delay)
+                continue
+            except Exception as e:
+                # Not one of ours (a bug, an unexpected library error): still an
+                # unhealthy call as far as the breaker is concerned
+                self.breaker.record_failure()
+                self._count("failures")
+                raise LLMError(f"{type(e).__name__}: {e}") from e
+
+            self.breaker.record_success()
+            self._count("successes")
+            return content
+
+        self._count("failures")
+        raise last_error or LLMError("Upstream deadline exceeded")
+
+
+def _parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Process-wide client configured from the environment"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = LLMClient(
+                api_url=os.getenv("DEEPSEEK_API_URL", DEFAULT_API_URL),
+                attempt_timeout=_env_float("LLM_ATTEMPT_TIMEOUT", 30.0),
+                deadline=_env_float("LLM_DEADLINE", 45.0),
+                max_attempts=int(_env_float("LLM_MAX_ATTEMPTS", 3)),
+                hedge=os.getenv("LLM_HEDGE", "0") == "1",
+                breaker=CircuitBreaker(
+                    failure_threshold=int(_env_float("LLM_BREAKER_THRESHOLD", 5)),
+                    reset_timeout=_env_float("LLM_BREAKER_RESET", 30.0),
+                ),
+            )
+        return _default_client
@@ -0,0 +1,160 @@
+"""Passports: signed spending authority an AI app can check without the bank.
+
+Version 2 is a fixed 50-byte record, base64url encoded (67 characters):
+
+    version   B    2
+    app       B    APP_CODES index of the app the passport is for
+    budget    I    tokens it may still spend
+    expires   I    unix time
+    nonce     8s   random; its hex form is the passport_id
+    email     16s  BLAKE2b digest of the email, binds it to one account
+    mac       16s  BLAKE2b keyed with PASSPORT_SECRET over everything above
+
+The email itself isn't in the token: the bank records passport_id -> email
+when it issues one (central_bank.register_passport) and resolves it there.
+
+Apps report spends to the bank's /settle with their app key (app_key(app_id),
+sent as X-App-Key). It is derived from BANK_APP_SECRET, which only the bank
+needs; give each app its own key in BANK_APP_KEY.
+
+Version 1 is the old itsdangerous URLSafeTimedSerializer JSON. Those tokens
+always contain a "." (v2 never does), so decode() tells them apart and keeps
+accepting them until PASSPORT_ACCEPT_V1=0 at the end of the rollout.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import time
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+SECRET = os.getenv("PASSPORT_SECRET", "your-secret-key-here")
+PASSPORT_TTL = int(os.getenv("PASSPORT_MAX_AGE", str(24 * 3600)))
+# Which format issue() writes; set to 1 until every AI app can read v2
+ISSUE_VERSION = int(os.getenv("PASSPORT_FORMAT", "2"))
+ACCEPT_V1 = os.getenv("PASSPORT_ACCEPT_V1", "1") != "0"
+APP_SECRET = os.getenv("BANK_APP_SECRET", SECRET)
+
+# Append only: the index is what goes on the wire
+APP_CODES = (
+    "thumbnail_wizard",
+    "document_wizard",
+    "prompt_wizard",
+    "script_wizard",
+    "hook_wizard",
+    "a11y_wizard",
+)
+_APP_INDEX = {app_id: index for index, app_id in enumerate(APP_CODES)}
+
+_BODY = struct.Struct(">BBII8s16s")
+MAC_SIZE = 16
+V2_SIZE = _BODY.size + MAC_SIZE
+
+v1_serializer = URLSafeTimedSerializer(SECRET)
+_mac_key = hashlib.blake2b(SECRET.encode(), digest_size=32, person=b"passport-v2").digest()
+
+
+class InvalidPassport(Exception):
+    """Bad signature, wrong app, malformed or expired"""
+
+
+def email_digest(email):
+    return hashlib.blake2b(email.strip().lower().encode(), digest_size=16).digest()
+
+
+def app_key(app_id):
+    """Credential an app presents to the bank when settling its spends"""
+    return hmac.new(APP_SECRET.encode(), f"app-key:{app_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_app_key(app_id, key):
+    return bool(key) and hmac.compare_digest(key, app_key(app_id))
+
+
+def _mac(body):
+    return hashlib.blake2b(body, key=_mac_key, digest_size=MAC_SIZE).digest()
+
+
+def issue(email, app_id, budget, ttl=PASSPORT_TTL, version=None):
+    """New passport token for email/app_id. Returns (token, passport dict)."""
+    passport = {
+        "version": version or ISSUE_VERSION,
+        "email": email,
+        "email_hash": email_digest(email),
+        "app_id": app_id,
+        "budget": budget,
+        "expires": int(time.time()) + ttl,
+        "passport_id": secrets.token_hex(8),
+    }
+    return encode(passport), passport
+
+
+def encode(passport):
+    """Sign a passport dict (as returned by decode) in its own version's format"""
+    if passport.get("version", 2) == 1:
+        fields = {key: passport[key] for key in ("email", "app_id", "budget", "passport_id")}
+        return v1_serializer.dumps(fields, salt=f'passport-{passport["app_id"]}')
+
+    if passport["app_id"] not in _APP_INDEX:
+        raise ValueError(f"No passport app code for {passport['app_id']!r}")
+    body = _BODY.pack(
+        2,
+        _APP_INDEX[passport["app_id"]],
+        passport["budget"],
+        passport["expires"],
+        bytes.fromhex(passport["passport_id"]),
+        passport.get("email_hash") or email_digest(passport["email"]),
+    )
+    return base64.urlsafe_b64encode(body + _mac(body)).rstrip(b"=").decode()
+
+
+def decode(token, app_id, max_age=PASSPORT_TTL):
+    """Verify a token for app_id and return the passport dict, or raise InvalidPassport.
+
+    v2 passports carry no email ("email" is None); use passport_id with the bank.
+    """
+    if not token:
+        raise InvalidPassport("missing")
+    if "." in token:
+        return _decode_v1(token, app_id, max_age)
+
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidPassport("malformed")
+    if len(raw) != V2_SIZE:
+        raise InvalidPassport("malformed")
+    body, mac = raw[:_BODY.size], raw[_BODY.size:]
+    if not hmac.compare_digest(mac, _mac(body)):
+        raise InvalidPassport("bad signature")
+
+    version, app_code, budget, expires, nonce, email_hash = _BODY.unpack(body)
+    if version != 2:
+        raise InvalidPassport(f"unknown version {version}")
+    if app_code >= len(APP_CODES) or APP_CODES[app_code] != app_id:
+        raise InvalidPassport("issued for another app")
+    if expires < time.time():
+        raise InvalidPassport("expired")
+    return {
+        "version": 2,
+        "email": None,
+        "email_hash": email_hash,
+        "app_id": app_id,
+        "budget": budget,
+        "expires": expires,
+        "passport_id": nonce.hex(),
+    }
+
+
+def _decode_v1(token, app_id, max_age):
+    if not ACCEPT_V1:
+        raise InvalidPassport("v1 passports are no longer accepted")
+    try:
+        passport = v1_serializer.loads(token, salt=f'passport-{app_id}', max_age=max_age)
+    except BadSignature as e:
+        raise InvalidPassport(str(e))
+    passport["version"] = 1
+    return passport
@@ -0,0 +1,407 @@
+"""Login sessions, kept apart from the one-time magic-link tokens.
+
+/auth spends a magic link once and gets back a session id (128 random bits)
+for the `session` cookie. Lookups go to a per-process LRU first, so a page
+view is a dict hit; creates and deletes write through to the persistent
+backend so other workers and restarts see them.
+
+SESSION_BACKEND picks the persistent side:
+- sqlite (default): `web_sessions` table in the bank database
+- redis: any Redis-compatible server at REDIS_URL (needs the redis package)
+- memory: no persistence, single process only (tests, local hacking)
+
+With SESSION_STATELESS=1, read-only pages can skip even that: the
+StatelessSessionMiddleware hands out a short-lived signed `session_sig`
+cookie (email + expiry) and checks it in CPU alone. The store is consulted
+again only when that cookie is missing or due for a refresh. Logouts revoke
+the signed cookies through the `revoked_sessions` table in the bank
+database; each worker reads new rows at most every SESSION_REVOCATION_POLL
+seconds, so a logout reaches every worker within that time.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from shared.auth import SECRET_KEY, get_db_path, token_hash, verify_magic_link
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+# How long a worker trusts its cached copy before re-reading (bounds how
+# stale a logout done on another worker can be)
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+# Accept old-style cookies (the magic-link token itself) while they last.
+# Off unless asked for: the rollout that needed it is over.
+ACCEPT_LOGIN_TOKENS = os.getenv("SESSION_ACCEPT_LOGIN_TOKENS", "0") == "1"
+STATELESS_SESSIONS = os.getenv("SESSION_STATELESS", "0") == "1"
+STATELESS_TTL = int(os.getenv("SESSION_STATELESS_TTL", "300"))
+REVOCATION_POLL = float(os.getenv("SESSION_REVOCATION_POLL", "2"))
+SIGNED_COOKIE = "session_sig"
+
+
+class MemorySessionBackend:
+    """LRU of session id -> (email, expires, cached_until), thread safe"""
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            email, expires, cached_until = entry
+            now = time.time()
+            if expires <= now or cached_until <= now:
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return email
+
+    def put(self, session_id, email, expires, cache_ttl=None):
+        cached_until = expires if cache_ttl is None else min(expires, time.time() + cache_ttl)
+        with self._lock:
+            self._entries[session_id] = (email, expires, cached_until)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteSessionBackend:
+    """web_sessions table, keyed by the hash of the session id"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_db_path()
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS web_sessions
+                        (id_hash BLOB PRIMARY KEY, email TEXT NOT NULL, created REAL NOT NULL,
+                         expires REAL NOT NULL) WITHOUT ROWID''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_web_sessions_expires ON web_sessions (expires)')
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def get(self, session_id):
+        """(email, expires) or None"""
+        conn = self._connect()
+        row = conn.execute('SELECT email, expires FROM web_sessions WHERE id_hash = ? AND expires > ?',
+                           (token_hash(session_id), time.time())).fetchone()
+        conn.close()
+        return row
+
+    def put(self, session_id, email, expires):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO web_sessions VALUES (?, ?, ?, ?)',
+                     (token_hash(session_id), email, time.time(), expires))
+        conn.close()
+
+    def delete(self, session_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM web_sessions WHERE id_hash = ?', (token_hash(session_id),))
+        conn.close()
+
+
+class RedisSessionBackend:
+    """Sessions as expiring keys on a Redis-compatible server"""
+
+    def __init__(self, url=None, client=None, prefix="session:"):
+        if client is None:
+            import redis  # optional: only needed with SESSION_BACKEND=redis
+            client = redis.Redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, session_id):
+        return self.prefix + token_hash(session_id).hex()
+
+    def get(self, session_id):
+        key = self._key(session_id)
+        email = self.client.get(key)
+        if email is None:
+            return None
+        ttl = self.client.ttl(key)
+        email = email.decode() if isinstance(email, bytes) else email
+        return email, time.time() + max(ttl, 0)
+
+    def put(self, session_id, email, expires):
+        self.client.setex(self._key(session_id), max(1, int(expires - time.time())), email)
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+
+class SessionStore:
+    def __init__(self, backend=None, cache=None, ttl=SESSION_TTL, cache_ttl=SESSION_CACHE_TTL):
+        self.backend = backend
+        self.cache = cache or MemorySessionBackend()
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl if backend is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def create(self, email):
+        """New session for email. Returns its id (for the cookie)."""
+        session_id = secrets.token_urlsafe(16)
+        expires = time.time() + self.ttl
+        if self.backend is not None:
+            self.backend.put(session_id, email, expires)
+        self.cache.put(session_id, email, expires, self.cache_ttl)
+        return session_id
+
+    def get(self, session_id):
+        """Email for a live session, or None"""
+        if not session_id:
+            return None
+        email = self.cache.get(session_id)
+        if email is not None:
+            self.hits += 1
+            return email
+        self.misses += 1
+        if self.backend is None:
+            return None
+        found = self.backend.get(session_id)
+        if found is None:
+            return None
+        email, expires = found
+        self.cache.put(session_id, email, expires, self.cache_ttl)
+        return email
+
+    def delete(self, session_id):
+        if not session_id:
+            return
+        self.cache.delete(session_id)
+        if self.backend is not None:
+            self.backend.delete(session_id)
+
+    def metrics(self):
+        return {"cached": len(self.cache), "hits": self.hits, "misses": self.misses,
+                "backend": type(self.backend).__name__ if self.backend else "memory only"}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide store, backend chosen by SESSION_BACKEND"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            kind = os.getenv("SESSION_BACKEND", "sqlite")
+            if kind == "memory":
+                backend = None
+            elif kind == "redis":
+                backend = RedisSessionBackend()
+            else:
+                backend = SQLiteSessionBackend()
+            _store = SessionStore(backend)
+        return _store
+
+
+def session_email(session_id):
+    """Email behind a session cookie, or None.
+
+    With SESSION_ACCEPT_LOGIN_TOKENS=1 a cookie may still hold a magic-link
+    token, checked the old way (local test_ tokens only outside RENDER).
+    """
+    if not session_id:
+        return None
+    email = get_session_store().get(session_id)
+    if email is None and ACCEPT_LOGIN_TOKENS:
+        email = verify_magic_link(session_id, mark_used=False)
+    return email
+
+
+def request_email(request, session_id):
+    """Email for this request: from StatelessSessionMiddleware when it ran, else the store"""
+    state = request.scope.get("state") or {}
+    if "session_email" in state:
+        return state["session_email"]
+    return session_email(session_id)
+
+
+class SignedSessionCookies:
+    """Short-lived signed copy of a session, verified without any I/O.
+
+    Layout (base64url): version B, expires I, session digest 8s, email, then a
+    16-byte keyed BLAKE2b MAC. The digest ties the cookie to the `session`
+    cookie it was minted from, which is also what revoke() blocks.
+
+    Revocations are written to `revoked_sessions` and verify() picks up the
+    ones other processes made every poll_interval seconds (one indexed read),
+    so apart from that a check is still CPU only.
+    """
+
+    _HEADER = struct.Struct(">BI8s")
+    MAC_SIZE = 16
+
+    def __init__(self, secret=SECRET_KEY, ttl=STATELESS_TTL, max_revoked=10000, db_path=None,
+                 poll_interval=REVOCATION_POLL):
+        self.ttl = ttl
+        self.max_revoked = max_revoked
+        self.db_path = db_path  # None: the bank database, resolved when first used
+        self.poll_interval = poll_interval
+        self._key = hashlib.blake2b(secret.encode(), digest_size=32, person=b"session-cookie").digest()
+        self._revoked = OrderedDict()  # digest -> time after which no cookie for it can be valid
+        self._lock = threading.Lock()
+        self._next_poll = 0.0
+        self._last_rowid = 0  # newest revoked_sessions row already merged
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path or get_db_path(), timeout=10, isolation_level=None)
+        conn.execute('CREATE TABLE IF NOT EXISTS revoked_sessions (digest BLOB PRIMARY KEY, until REAL NOT NULL)')
+        return conn
+
+    def _remember(self, digest, until, now):
+        """Add to the local set (caller holds the lock)"""
+        self._revoked[digest] = until
+        self._revoked.move_to_end(digest)
+        # Entries only need to outlive the longest cookie they could match
+        while self._revoked and (len(self._revoked) > self.max_revoked
+                                 or next(iter(self._revoked.values())) < now):
+            self._revoked.popitem(last=False)
+
+    def _poll_revocations(self):
+        """Merge revocations made by other processes, at most once per poll_interval"""
+        with self._lock:
+            if time.monotonic() < self._next_poll:
+                return
+            self._next_poll = time.monotonic() + self.poll_interval
+            last_rowid = self._last_rowid
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute('SELECT rowid, digest, until FROM revoked_sessions WHERE rowid > ? ORDER BY rowid',
+                                    (last_rowid,)).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not read session revocations, retrying in {self.poll_interval}s: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for rowid, digest, until in rows:
+                self._last_rowid = max(self._last_rowid, rowid)
+                if until > now:
+                    self._remember(digest, until, now)
+
+    @staticmethod
+    def digest(session_id):
+        return token_hash(session_id)[:8]
+
+    def _mac(self, body):
+        return hashlib.blake2b(body, key=self._key, digest_size=self.MAC_SIZE).digest()
+
+    def sign(self, email, session_id):
+        body = self._HEADER.pack(1, int(time.time()) + self.ttl, self.digest(session_id)) + email.encode()
+        return base64.urlsafe_b64encode(body + self._mac(body)).rstrip(b"=").decode()
+
+    def verify(self, cookie):
+        """{"email", "expires", "digest"} for a valid, unexpired, unrevoked cookie, else None"""
+        if not cookie:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cookie + "=" * (-len(cookie) % 4))
+        except (ValueError, TypeError):
+            return None
+        if len(raw) <= self._HEADER.size + self.MAC_SIZE:
+            return None
+        body, mac = raw[:-self.MAC_SIZE], raw[-self.MAC_SIZE:]
+        if not hmac.compare_digest(mac, self._mac(body)):
+            return None
+        version, expires, digest = self._HEADER.unpack_from(body)
+        if version != 1 or expires <= time.time():
+            return None
+        self._poll_revocations()
+        if digest in self._revoked:
+            return None
+        return {"email": body[self._HEADER.size:].decode(), "expires": expires, "digest": digest}
+
+    def needs_refresh(self, expires):
+        """Sliding window: re-check with the store once half the lifetime is gone"""
+        return expires - time.time() < self.ttl / 2
+
+    def revoke(self, session_id):
+        """Reject this session's cookies from now on, here at once and in other processes within poll_interval"""
+        if not session_id:
+            return
+        now = time.time()
+        digest, until = self.digest(session_id), now + self.ttl
+        with self._lock:
+            self._remember(digest, until, now)
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM revoked_sessions WHERE until < ?', (now,))
+            conn.execute('INSERT OR REPLACE INTO revoked_sessions VALUES (?, ?)', (digest, until))
+        finally:
+            conn.close()
+
+
+signed_cookies = SignedSessionCookies()
+# Per worker on purpose: the session LRU is a write-through cache bounded by
+# SESSION_CACHE_TTL, and revocations are shared through revoked_sessions
+WORKER_LOCAL = ("_store", "signed_cookies")
+
+
+class StatelessSessionMiddleware:
+    """Resolve the session of read-only pages from the signed cookie alone.
+
+    For paths starting with one of `paths`, puts the email (or None) in
+    request.state.session_email (see request_email) and sets a fresh
+    `session_sig` cookie whenever it had to ask the session store.
+    """
+
+    def __init__(self, app, paths, cookies=None):
+        from starlette.datastructures import MutableHeaders
+        from starlette.requests import HTTPConnection
+        self._MutableHeaders = MutableHeaders
+        self._HTTPConnection = HTTPConnection
+        self.app = app
+        self.paths = tuple(paths)
+        self.cookies = cookies or signed_cookies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        cookies = self._HTTPConnection(scope).cookies
+        session_id = cookies.get("session")
+        signed = self.cookies.verify(cookies.get(SIGNED_COOKIE)) if session_id else None
+        new_cookie = None
+        if signed and signed["digest"] == self.cookies.digest(session_id):
+            email = signed["email"]
+            if self.cookies.needs_refresh(signed["expires"]):
+                email = session_email(session_id)
+                new_cookie = email and self.cookies.sign(email, session_id)
+        else:
+            email = session_email(session_id)
+            new_cookie = email and self.cookies.sign(email, session_id)
+        scope.setdefault("state", {})["session_email"] = email
+
+        if not new_cookie:
+            return await self.app(scope, receive, send)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                self._MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{SIGNED_COOKIE}={new_cookie}; Max-Age={self.cookies.ttl}; HttpOnly; Path=/; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,79 @@
+"""One Jinja2 environment for every app.
+
+Templates are looked up in dashboard/templates, then templates/. Compiled
+templates go to a bytecode cache on disk (TEMPLATE_CACHE_DIR, default a
+per-user directory under /tmp), so a new worker loads them instead of
+parsing them again. In production (RENDER set) auto_reload is off: templates
+are not stat()ed on every render. TEMPLATE_AUTO_RELOAD=1/0 overrides.
+
+Apps call precompile() from a startup hook so the first visitor doesn't pay
+for compilation either.
+
+Parts of a page that are the same for every user (the dashboard app grid)
+go through render_fragment(): rendered once per version of their data and
+then pasted into the per-user page as ready-made markup.
+"""
+import os
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIRS = [os.path.join(ROOT, "dashboard", "templates"), os.path.join(ROOT, "templates")]
+AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0" if os.getenv("RENDER") else "1") == "1"
+CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+
+_templates = None
+_lock = threading.Lock()
+_fragments = {}  # template name -> (version, Markup)
+# Per-worker caches, safe under serve.py --workers N
+WORKER_LOCAL = ("_fragments",)
+
+
+def build_templates(directories=None, auto_reload=AUTO_RELOAD, cache_dir=CACHE_DIR):
+    """A Jinja2Templates with the shared settings (jinja2 imported here, not at import)"""
+    import jinja2
+    from starlette.templating import Jinja2Templates
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    return Jinja2Templates(directory=directories or TEMPLATE_DIRS, auto_reload=auto_reload,
+                           bytecode_cache=jinja2.FileSystemBytecodeCache(cache_dir))
+
+
+def get_templates():
+    """Process-wide templates, built on first use"""
+    global _templates
+    with _lock:
+        if _templates is None:
+            _templates = build_templates()
+        return _templates
+
+
+def precompile(templates=None):
+    """Compile (or load from the bytecode cache) every template. Returns {"templates", "seconds"}."""
+    import jinja2
+    env = (templates or get_templates()).env
+    started = time.perf_counter()
+    compiled = 0
+    for name in env.list_templates(extensions=["html"]):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except jinja2.TemplateError as e:
+            print(f"⚠️ Template {name} does not compile: {e}")
+    return {"templates": compiled, "seconds": round(time.perf_counter() - started, 4)}
+
+
+def render_fragment(name, version, **context):
+    """Render template `name` once per `version` and return it as Markup.
+
+    `version` must change whenever the context would (e.g. the app catalog
+    version); None renders every time. Only the latest version is kept.
+    """
+    from markupsafe import Markup
+    cached = _fragments.get(name)
+    if cached is not None and version is not None and cached[0] == version:
+        return cached[1]
+    markup = Markup(get_templates().get_template(name).render(**context))
+    if version is not None:
+        _fragments[name] = (version, markup)
+    return markup
@@ -0,0 +1,258 @@
+"""Data-driven multi-step wizards (the Prompt Wizard, and any wizard like it).
+
+A wizard is declared as data: a tuple of choice Steps, each with its Options,
+followed by a final form. Wizard() renders every page once, up front, through
+the app's own layout; what depends on the request (the choices carried in
+the query string, the summary, the hidden form fields) is left as markers.
+Serving a step is then one dict lookup per choice and a join, and the
+WIZARD_PAGE_CACHE_SIZE most recent paths through a wizard are kept rendered:
+
+    WIZARD = Wizard("/prompt-wizard", STEPS, FORM, layout, icons=ICON_MAP)
+
+    @app.get("/prompt-wizard/step/{number}")
+    async def step(number: int, request: Request):
+        page = WIZARD.render(number, request.query_params, request.scope.get("root_path", ""))
+        ...
+
+Links into the wizard start with the app's mount point (scope["root_path"]),
+so it keeps working when the app is mounted under a prefix; the layout and
+form can put ROOT in front of their own absolute links for the same effect.
+
+Choice values are echoed back URL-encoded and HTML-escaped; values that are
+not in a step's options are kept (the final generate route decides what to
+do with them) but shown escaped. Such pages are rendered every time rather
+than cached, and known() tells the caller not to cache them either (e.g. in
+shared.compression's precompressed cache): there is no bound on how many
+distinct ones a client can ask for.
+"""
+import functools
+import os
+from html import escape
+from typing import Callable, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+PAGE_CACHE_SIZE = int(os.getenv("WIZARD_PAGE_CACHE_SIZE", "512"))
+
+# Markers left in the precomputed pages ("\x00name\x00" never occurs in HTML)
+_QUERY = "\x00query\x00"
+_SUMMARY = "\x00summary\x00"
+BACK = "\x00back\x00"  # href of the previous step; usable in the final form
+ROOT = "\x00root\x00"  # the mount point render() was given; put it before absolute links into the app
+FORM_FIELDS = "\x00fields\x00"  # hidden inputs carrying every choice; put it inside the final <form>
+
+
+def checked(name):
+    """Marker for a checkbox in the final form that Option.checks can turn on"""
+    return f"\x00check:{name}\x00"
+
+
+class Option(NamedTuple):
+    value: str
+    label: str
+    description: str
+    checks: str = ""  # final-form checkbox this choice ticks by default
+
+
+class Step(NamedTuple):
+    field: str  # query parameter
+    name: str  # short name for the progress bar and summary
+    title: str
+    subtitle: str
+    options: Tuple[Option, ...]
+    default: Optional[str] = None  # used when the parameter is missing; first option if None
+
+
+class _Choice(NamedTuple):
+    """One choice's share of a page, escaped"""
+    query: str  # field=value for hrefs
+    field: str  # hidden input for the final form
+    label: str
+    checks: str
+
+
+DEFAULT_CARD = '''
+        <a href="{href}" class="step-card">
+            <div class="step-icon">
+                <i class="{icon}"></i>
+            </div>
+            <h3>{label}</h3>
+            <p>{description}</p>
+        </a>
+        '''
+
+
+def _compile(text):
+    """Literal chunks at even indexes, marker names at odd ones"""
+    return tuple(text.split("\x00"))
+
+
+def _fill(parts, values):
+    out = list(parts)
+    out[1::2] = [values[name] for name in parts[1::2]]
+    return "".join(out)
+
+
+class Wizard:
+    def __init__(self, path: str, steps: Tuple[Step, ...], form: str, layout: Callable[[str, str], str],
+                 icons: Mapping[str, str] = None, exit_url="/dashboard", exit_label="Back to Dashboard",
+                 form_title="Enter Your Prompt", form_subtitle="Type your original prompt, and AI will optimize it",
+                 card=DEFAULT_CARD):
+        """layout(title, content) -> full HTML page. form is the final step's body and must
+        contain FORM_FIELDS; it may use BACK and checked(name)."""
+        self.path = path
+        self.steps = tuple(steps)
+        self.icons = dict(icons or {})
+        self.form_title = form_title
+        self.form_subtitle = form_subtitle
+        self.form = form
+        self._defaults = tuple(step.default or step.options[0].value for step in self.steps)
+        self._checkboxes = {option.checks for step in self.steps for option in step.options if option.checks}
+        # Per step, every known option's pieces of a page, ready to join
+        self._choices = tuple({option.value: self._choice(index, option.value, option.label, option.checks)
+                               for option in step.options} for index, step in enumerate(self.steps))
+        # Popular paths through the wizard are rendered once; the cache is per process
+        self._render = functools.lru_cache(maxsize=PAGE_CACHE_SIZE)(self._render)
+        self._pages = tuple(_compile(layout(title, content)) for title, content in self._contents(exit_url, exit_label,
+                                                                                                   card))
+
+    def icon(self, value):
+        return self.icons.get(value, "fa-solid fa-question")
+
+    def url(self, number, root=""):
+        return f"{root}{self.path}/step/{number}"
+
+    @property
+    def last(self):
+        """Number of the final (form) step"""
+        return len(self.steps) + 1
+
+    def render(self, number: int, params: Mapping[str, str], root: str = "") -> Optional[str]:
+        """Page for step number (1-based) given the query parameters, or None if there is no such step.
+        root is the path the app is mounted at."""
+        if not 1 <= number <= self.last:
+            return None
+        picked = self._picked(number, params)
+        if self._all_known(picked):
+            return self._render(number, picked, root)
+        return self._render.__wrapped__(number, picked, root)
+
+    def known(self, number: int, params: Mapping[str, str]) -> bool:
+        """True if every choice for step number is one of its step's options,
+        i.e. the page is one of a bounded set and safe to cache"""
+        return self._all_known(self._picked(number, params))
+
+    def _picked(self, number, params):
+        return tuple(params.get(step.field) or default
+                     for step, default in zip(self.steps[:number - 1], self._defaults))
+
+    def _all_known(self, picked):
+        return all(value in choices for value, choices in zip(picked, self._choices))
+
+    def _render(self, number, picked, root=""):
+        """Step number for the picked values, one per earlier step"""
+        parts = self._pages[number - 1]
+        choices = []
+        for index, value in enumerate(picked):
+            choice = self._choices[index].get(value)
+            choices.append(choice or self._choice(index, value, value.replace("-", " ").title()))
+        root = escape(root)
+        values = {
+            "root": root,
+            "query": "&amp;".join(choice.query for choice in choices),
+            "back": self.url(number - 1, root) + ("?" + "&amp;".join(choice.query for choice in choices[:-1])
+                                            if number > 2 else ""),
+        }
+        if number == self.last:
+            values["fields"] = "".join(choice.field for choice in choices)
+            values["summary"] = self._summary_grid(choices)
+            ticked = {choice.checks for choice in choices}
+            for name in self._checkboxes:
+                values["check:" + name] = " checked" if name in ticked else ""
+        else:
+            values["summary"] = self._summary_line(choices)
+        return _fill(parts, values)
+
+    def blank_form(self, root=""):
+        """The final form with empty hidden fields and nothing pre-ticked, for client-side wizards"""
+        values = {"fields": "".join(f'<input type="hidden" name="{step.field}">' for step in self.steps),
+                  "back": f"#step-{len(self.steps)}", "root": escape(root)}
+        values.update(("check:" + name, "") for name in self._checkboxes)
+        return _fill(_compile(self.form), values)
+
+    def _choice(self, index, value, label, checks=""):
+        field = self.steps[index].field
+        return _Choice(query=escape(urlencode({field: value})),
+                       field=f'<input type="hidden" name="{field}" value="{escape(value)}">',
+                       label=escape(label), checks=checks)
+
+    def _summary_line(self, choices):
+        picked = " · ".join(choice.label for choice in choices)
+        return f'''
+            <div class="card secondary" style="margin: 1rem auto; max-width: 600px; text-align: left;">
+                <p><strong>Selected:</strong> {picked}</p>
+            </div>'''
+
+    def _summary_grid(self, choices):
+        cells = "".join(f'''
+            <div>
+                <small>{step.name}</small><br>
+                <strong>{choice.label}</strong>
+            </div>''' for step, choice in zip(self.steps, choices))
+        return f'''
+    <div class="card secondary" style="margin: 1rem 0 2rem 0;">
+        <div class="grid" style="grid-template-columns: repeat({len(choices)}, 1fr); gap: 0.5rem; text-align: center;">{cells}
+        </div>
+    </div>'''
+
+    def _header(self, number, title, subtitle):
+        names = [step.name for step in self.steps] + ["Prompt"]
+        progress = "".join(f'''
+                    <div class="progress-step{' active' if n == number else ''}">{n}. {name}</div>'''
+                           for n, name in enumerate(names, 1))
+        return f'''
+        <header style="text-align: center; margin-bottom: 2rem;">
+            <hgroup>
+                <h1>Step {number}: {title}</h1>
+                <p>{subtitle}</p>
+            </hgroup>
+
+            <div class="progress-container">
+                <div class="progress-bar">
+                    <div class="progress-fill" style="width: {number / self.last * 100:.1f}% !important;"></div>
+                </div>
+                <div class="progress-steps">{progress}
+                </div>
+            </div>
+            {_SUMMARY if number > 1 else ""}
+        </header>'''
+
+    def _contents(self, exit_url, exit_label, card):
+        """(title, content) for every step, markers in place of the request's choices"""
+        for number, step in enumerate(self.steps, 1):
+            query = _QUERY + "&amp;" if number > 1 else ""
+            cards = "".join(card.format(href=escape(f"{self.url(number + 1, ROOT)}?") + query
+                                        + escape(urlencode({step.field: option.value})),
+                                        icon=self.icon(option.value), label=escape(option.label),
+                                        description=escape(option.description))
+                            for option in step.options)
+            if number == 1:
+                back = f'<a href="{exit_url}" class="secondary">\n                <i class="fas fa-home"></i> {exit_label}\n            </a>'
+            else:
+                back = f'<a href="{BACK}" class="secondary">\n                <i class="fas fa-arrow-left"></i> Back to Step {number - 1}\n            </a>'
+            yield f"Step {number}: {step.name} Selection", f'''
+    <article>{self._header(number, step.title, step.subtitle)}
+
+        <div class="grid" style="grid-template-columns: repeat(2, 1fr); gap: 1rem;">
+            {cards}
+        </div>
+
+        <div style="text-align: center; margin-top: 3rem;">
+            {back}
+        </div>
+    </article>
+    '''
+        yield f"Step {self.last}: {self.form_title}", f'''
+    <article>{self._header(self.last, self.form_title, self.form_subtitle)}
+        {self.form}
+    </article>
+    '''
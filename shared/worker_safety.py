@@ -0,0 +1,88 @@
+"""Checks that an app can run as several worker processes.
+
+With more than one worker every request may land in a different process, so
+anything a request writes must live in the bank database (or Redis), not in
+a module-level dict. serve.py runs these checks before forking workers.
+
+Module-level caches that are fine per worker (each process fills its own and
+nothing breaks when another worker doesn't see an entry) are declared in a
+WORKER_LOCAL tuple in that module.
+
+State kept inside an object counts too: a module-level instance of one of
+this repository's classes is flagged if its attributes hold mutable
+containers (an LRU, a revocation set, a subscriber map). Declare it in
+WORKER_LOCAL where it is created; modules that import it inherit that.
+"""
+import os
+import sqlite3
+import sys
+from collections import OrderedDict, defaultdict
+
+from shared.auth import get_db_path
+
+MUTABLE_TYPES = (dict, list, set, OrderedDict, defaultdict)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_ours(cls):
+    """True for classes defined in this repository (not the stdlib or site-packages)"""
+    path = getattr(sys.modules.get(cls.__module__), "__file__", None) or ""
+    return path.startswith(ROOT + os.sep) and os.sep + "site-packages" + os.sep not in path
+
+
+def _declared_worker_local(value):
+    """True if the module defining value's class lists this very object in WORKER_LOCAL"""
+    home = sys.modules.get(type(value).__module__)
+    return any(getattr(home, name, None) is value for name in getattr(home, "WORKER_LOCAL", ()))
+
+
+def _mutable_state(value):
+    """Attribute names of value that hold mutable containers"""
+    attributes = getattr(value, "__dict__", None) or {}
+    return [name for name, attribute in attributes.items() if isinstance(attribute, MUTABLE_TYPES)]
+
+
+def unsafe_globals(module):
+    """Module-level mutable state that would diverge between workers.
+
+    Returns [(name, kind)]: containers, and instances of our own classes
+    with containers in their attributes ("AuthorizationCache._allowed_until").
+    ALL_CAPS names are treated as constants and names listed in
+    module.WORKER_LOCAL as deliberate per-worker caches.
+    """
+    allowed = set(getattr(module, "WORKER_LOCAL", ()))
+    found = []
+    for name, value in vars(module).items():
+        if name.startswith("__") or name.isupper() or name in allowed:
+            continue
+        if isinstance(value, MUTABLE_TYPES):
+            found.append((name, type(value).__name__))
+        elif not isinstance(value, type) and _is_ours(type(value)) and not _declared_worker_local(value):
+            state = _mutable_state(value)
+            if state:
+                found.append((name, f"{type(value).__name__}.{', '.join(state)}"))
+    return found
+
+
+def enable_wal(db_path=None):
+    """Put the bank database in WAL mode (persistent), so readers in one
+    worker don't block on writers in another. Returns the journal mode."""
+    conn = sqlite3.connect(db_path or get_db_path(), timeout=10)
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def check_multi_worker(modules, workers):
+    """Problems that break an app once it runs in more than one worker"""
+    if workers <= 1:
+        return []
+    problems = []
+    for module in modules:
+        for name, kind in unsafe_globals(module):
+            problems.append(f"{module.__name__}.{name} is a process-local {kind}; "
+                            f"move it to the database or list it in WORKER_LOCAL")
+    if os.getenv("SESSION_BACKEND") == "memory":
+        problems.append("SESSION_BACKEND=memory keeps sessions in one process; use sqlite or redis")
+    return problems
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the DeepSeek chat completions API, with fault injection.
+
+Run it and point the apps at it:
+    python stub_deepseek.py            # listens on :8090
+    DEEPSEEK_API_URL=http://localhost:8090/chat/completions python clean_app.py
+
+Faults are queued with POST /_faults, e.g.
+    {"status": 503, "count": 3}          next 3 calls return 503
+    {"delay": 2.0, "count": 1}           next call sleeps 2 s before answering
+    {"status": 429, "retry_after": 1}    429 with a Retry-After header
+POST /_faults with {"reset": true} clears the queue and the call counter.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import threading
+import time
+
+
+class FaultPlan:
+    """Queue of faults applied to upcoming /chat/completions calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = []
+        self.base_delay = 0.0
+        self.calls = 0
+
+    def add(self, status=200, delay=0.0, count=1, retry_after=None):
+        with self._lock:
+            for _ in range(count):
+                self._queue.append({"status": status, "delay": delay, "retry_after": retry_after})
+
+    def reset(self):
+        with self._lock:
+            self._queue.clear()
+            self.base_delay = 0.0
+            self.calls = 0
+
+    def next(self):
+        with self._lock:
+            self.calls += 1
+            if self._queue:
+                return self._queue.pop(0)
+            return {"status": 200, "delay": self.base_delay, "retry_after": None}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    plan = None  # set by make_server
+
+    def _send_json(self, status, body, extra_headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        if self.path == "/_faults":
+            body = self._read_json()
+            if body.get("reset"):
+                self.plan.reset()
+            elif "base_delay" in body:
+                self.plan.base_delay = float(body["base_delay"])
+            else:
+                self.plan.add(
+                    status=int(body.get("status", 200)),
+                    delay=float(body.get("delay", 0.0)),
+                    count=int(body.get("count", 1)),
+                    retry_after=body.get("retry_after"),
+                )
+            self._send_json(200, {"ok": True})
+            return
+
+        if self.path != "/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        request = self._read_json()
+        fault = self.plan.next()
+        if fault["delay"]:
+            time.sleep(fault["delay"])
+
+        if fault["status"] != 200:
+            headers = {}
+            if fault["retry_after"] is not None:
+                headers["Retry-After"] = str(fault["retry_after"])
+            self._send_json(fault["status"], {"error": {"message": "injected fault"}}, headers)
+            return
+
+        last_message = request.get("messages", [{}])[-1].get("content", "")
+        self._send_json(200, {
+            "id": f"stub-{self.plan.calls}",
+            "object": "chat.completion",
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Stub answer ({len(last_message)} chars in)"},
+                "finish_reason": "stop",
+            }],
+        })
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            self._send_json(200, {"calls": self.plan.calls})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        pass  # Silence logs
+
+
+def make_server(host="127.0.0.1", port=8090, plan=None):
+    """Build a stub server; port=0 picks a free port"""
+    handler = type("BoundStubHandler", (StubHandler,), {"plan": plan or FaultPlan()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.plan = handler.plan
+    return server
+
+
+def serve_in_thread(port=0):
+    """Start a stub server in a daemon thread. Returns (server, base_url)."""
+    server = make_server(port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    print("🧪 Stub DeepSeek API at http://localhost:8090/chat/completions")
+    make_server(host="0.0.0.0").serve_forever()
@@ -0,0 +1,167 @@
+# test_ai_app_middleware.py
+# SpendLedger: a passport's budget only goes down, settlements are reported once, rejections revoke.
+# TokenASGIMiddleware: charges priced routes through the bank, hands back a refreshed passport, settles on shutdown
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+sys.path.insert(0, '.')
+
+import httpx
+from fastapi import FastAPI, Request
+
+import central_bank
+from ai_app_middleware import SpendLedger, TokenASGIMiddleware
+from shared.catalog import CatalogError, get_catalog
+from shared.passport import decode, issue
+
+EMAIL = "ledger@example.com"
+
+
+def new_ledger():
+    return SpendLedger(tempfile.mkstemp(suffix=".db")[1])
+
+
+def test_replayed_passport_does_not_restore_budget():
+    ledger = new_ledger()
+    token, _ = issue(EMAIL, "thumbnail_wizard", 10)
+    fresh = decode(token, "thumbnail_wizard")
+
+    assert ledger.debit(fresh, 6, "analyze") == 4
+    # The same (unchanged) token shown again still carries budget=10
+    assert ledger.debit(decode(token, "thumbnail_wizard"), 6, "analyze") is None
+    assert ledger.debit(decode(token, "thumbnail_wizard"), 4, "analyze") == 0
+    assert [entry["tokens"] for entry in ledger.pending()] == [6, 4]
+
+
+def test_reconcile_clears_settled_and_duplicates():
+    ledger = new_ledger()
+    passport = decode(issue(EMAIL, "thumbnail_wizard", 10)[0], "thumbnail_wizard")
+    ledger.debit(passport, 1, "analyze")
+    ledger.debit(passport, 1, "analyze")
+    first, second = (entry["id"] for entry in ledger.pending())
+
+    # A retried batch comes back as "duplicate": just as done as "settled"
+    ledger.reconcile({first: "settled", second: "duplicate"})
+    assert ledger.pending() == []
+    assert ledger.debit(passport, 1, "analyze") == 7
+
+
+def test_rejected_settlement_revokes_the_passport():
+    ledger = new_ledger()
+    passport = decode(issue(EMAIL, "thumbnail_wizard", 10)[0], "thumbnail_wizard")
+    other = decode(issue(EMAIL, "thumbnail_wizard", 10)[0], "thumbnail_wizard")
+    ledger.debit(passport, 2, "analyze")
+    ledger.debit(other, 2, "analyze")
+    rejected = next(entry["id"] for entry in ledger.pending() if entry["passport_id"] == passport["passport_id"])
+
+    ledger.reconcile({rejected: "rejected"})
+    assert ledger.debit(passport, 1, "analyze") is None  # bank said no: no more local credit
+    assert ledger.debit(other, 1, "analyze") == 7
+
+
+def test_every_charged_route_needs_a_price():
+    for routes, costs in (({"/go": "no-such-operation"}, None), ({"/go": "optimize"}, {"other": 1})):
+        try:
+            TokenASGIMiddleware(None, "prompt_wizard", "http://bank", routes=routes, costs=costs)
+            assert False, f"unpriced route accepted: {routes} {costs}"
+        except (CatalogError, ValueError):
+            pass
+
+
+def test_asgi_middleware_charges_refreshes_passport_and_refuses_when_broke():
+    email = "asgi-charge@example.com"
+    price = get_catalog().cost("prompt_wizard", "optimize")
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (email, price * 2))
+    conn.commit()
+    conn.close()
+    token, passport = issue(email, "prompt_wizard", price * 10)
+    central_bank.register_passport(passport)
+
+    inner = FastAPI()
+
+    @inner.post("/optimize")
+    async def optimize(request: Request):
+        return {"remaining": request.state.passport["remaining_budget"]}
+
+    @inner.get("/free")
+    async def free():
+        return {"ok": True}
+
+    app = TokenASGIMiddleware(inner, "prompt_wizard", "http://bank", routes={("POST", "/optimize"): "optimize"})
+
+    async def go():
+        # The bank in-process instead of over the network
+        await app._client.aclose()
+        app._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=central_bank.app), base_url="http://bank")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://ai") as client:
+            responses = [await client.get("/free"), await client.post("/optimize")]
+            current = token
+            for _ in range(3):
+                response = await client.post("/optimize", headers={"X-Passport": current})
+                responses.append(response)
+                current = response.headers.get("x-passport", current)
+        await app._client.aclose()
+        return responses
+
+    free_page, missing, first, second, broke = asyncio.run(go())
+    assert free_page.status_code == 200 and "x-passport" not in free_page.headers
+    assert missing.status_code == 401
+
+    assert first.status_code == 200 and first.json() == {"remaining": price * 9}
+    refreshed = first.headers["x-passport"]
+    assert refreshed != token and decode(refreshed, "prompt_wizard")["budget"] == price * 9
+    assert f"passport={refreshed}" in first.headers["set-cookie"]
+    assert second.status_code == 200 and decode(second.headers["x-passport"], "prompt_wizard")["budget"] == price * 8
+
+    assert broke.status_code == 402 and "x-passport" not in broke.headers
+    assert central_bank.get_balance(email) == 0
+
+
+def test_shutdown_flushes_settlements_and_closes_the_client():
+    email = "closing@example.com"
+    central_bank.get_balance(email)  # opens the account with the free tokens
+    before = central_bank.get_balance(email)
+    price = get_catalog().cost("prompt_wizard", "optimize")
+    token, passport = issue(email, "prompt_wizard", price * 2)
+    central_bank.register_passport(passport)
+    ledger = new_ledger()
+
+    inner = FastAPI()
+
+    @inner.post("/optimize")
+    async def optimize():
+        return {"ok": True}
+
+    # Settling only on shutdown: the interval never comes round during the test
+    app = TokenASGIMiddleware(inner, "prompt_wizard", "http://bank", routes={("POST", "/optimize"): "optimize"},
+                              ledger=ledger, settle_interval=3600)
+
+    async def go():
+        await app._client.aclose()
+        app._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=central_bank.app), base_url="http://bank")
+        lifespan_messages = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await lifespan_messages.put({"type": "lifespan.startup"})
+        lifespan = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}},
+                                           lifespan_messages.get, send))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://ai") as client:
+            response = await client.post("/optimize", headers={"X-Passport": token})
+        settler = app._settler
+        await lifespan_messages.put({"type": "lifespan.shutdown"})
+        await lifespan
+        return response, settler, sent
+
+    response, settler, sent = asyncio.run(go())
+    assert response.status_code == 200
+    assert settler.cancelled() and app._settler is None
+    assert ledger.pending() == []
+    assert central_bank.get_balance(email) == before - price
+    assert app._client.is_closed
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
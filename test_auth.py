@@ -0,0 +1,123 @@
+# test_auth.py
+# Opaque magic-link tokens: hashed at rest, single use, expiring, legacy tokens still accepted
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, '.')
+
+from shared import auth
+from shared.db_maintenance import Compactor, table_sizes, take_lease
+
+
+def production_token(email):
+    os.environ["RENDER"] = "1"
+    try:
+        return auth.create_magic_link(email)
+    finally:
+        del os.environ["RENDER"]
+
+
+def test_opaque_token_is_stored_only_as_hash():
+    token = production_token("opaque@example.com")
+
+    assert len(token) == 22 and "." not in token
+    conn = sqlite3.connect(auth.get_db_path())
+    rows = conn.execute("SELECT token_hash, email FROM sessions WHERE email = ?",
+                        ("opaque@example.com",)).fetchall()
+    conn.close()
+    assert rows == [(auth.token_hash(token), "opaque@example.com")]
+    assert auth.verify_magic_link(token, mark_used=False) == "opaque@example.com"
+
+
+def test_token_is_single_use_and_expires():
+    token = production_token("once@example.com")
+
+    assert auth.verify_magic_link(token) == "once@example.com"
+    assert auth.verify_magic_link(token) is None
+    assert auth.verify_magic_link(production_token("old@example.com"), max_age=0) is None
+
+    short = "short-lived-token-xyz"
+    auth.store_magic_token("short@example.com", short, ttl=-1)
+    assert auth.verify_magic_link(short, mark_used=False) is None
+    assert auth.verify_magic_link("never-issued-token-abc", mark_used=False) is None
+
+
+def test_racing_clicks_on_one_link_log_in_once():
+    token = production_token("race@example.com")
+    start = threading.Barrier(8)
+    winners = []
+
+    def click():
+        start.wait()
+        winners.append(auth.verify_magic_link(token))
+
+    threads = [threading.Thread(target=click) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert winners.count("race@example.com") == 1 and winners.count(None) == 7
+
+
+def test_legacy_itsdangerous_tokens_still_verify():
+    token = auth.serializer.dumps("legacy@example.com", salt="magic-link")
+    conn = sqlite3.connect(auth.get_db_path())
+    conn.execute('''CREATE TABLE IF NOT EXISTS magic_links
+                    (token TEXT PRIMARY KEY, email TEXT, created DATETIME, used BOOLEAN)''')
+    conn.execute("INSERT INTO magic_links VALUES (?, ?, datetime('now'), 0)", (token, "legacy@example.com"))
+    conn.commit()
+    conn.close()
+
+    assert auth.verify_magic_link(token, mark_used=False) == "legacy@example.com"
+    assert auth.verify_magic_link(token) == "legacy@example.com"
+    assert auth.verify_magic_link(token) is None
+
+
+def test_test_tokens_only_work_outside_production():
+    assert auth.verify_magic_link("test_dev@example.com") == "dev@example.com"
+    os.environ["RENDER"] = "1"
+    try:
+        assert auth.verify_magic_link("test_dev@example.com", mark_used=False) is None
+    finally:
+        del os.environ["RENDER"]
+
+
+def test_compactor_drops_expired_and_used_tokens_in_batches():
+    db_path = tempfile.mkstemp(suffix=".db")[1]
+    previous = os.environ["BANK_DB_PATH"]
+    os.environ["BANK_DB_PATH"] = db_path
+    try:
+        for i in range(25):
+            auth.store_magic_token(f"gone{i}@example.com", f"expired-token-{i}", ttl=-10)
+        auth.store_magic_token("live@example.com", "live-token-xyz")
+        auth.store_magic_token("used@example.com", "used-token-xyz")
+        assert auth.verify_magic_link("used-token-xyz") == "used@example.com"
+
+        compactor = Compactor(db_path=db_path, batch_size=10)
+        stats = compactor.run_once()
+
+        assert stats["deleted"]["sessions"] == 26 and stats["batches"] == 3
+        assert compactor.metrics()["sizes"]["tables"] == {}  # page counts only, no table scans
+        conn = sqlite3.connect(db_path)
+        assert table_sizes(conn, detailed=True)["tables"]["sessions"]["rows"] == 1
+        conn.close()
+        assert auth.verify_magic_link("live-token-xyz", mark_used=False) == "live@example.com"
+    finally:
+        os.environ["BANK_DB_PATH"] = previous
+
+
+def test_only_one_compactor_holds_the_lease():
+    db_path = tempfile.mkstemp(suffix=".db")[1]
+    first, second = Compactor(db_path=db_path), Compactor(db_path=db_path)
+    assert first.take_turn(60) and not second.take_turn(60)
+    assert first.take_turn(60)  # the leader renews its own lease
+    assert first.metrics()["leader"] and not second.metrics()["leader"]
+
+    conn = sqlite3.connect(db_path)
+    assert take_lease(conn, "compactor", second.holder, 60, now=time.time() + 61)  # the leader went away
+    conn.commit()
+    conn.close()
+    assert not first.take_turn(60)
@@ -0,0 +1,75 @@
+# test_balance_events.py
+# Balance changes are pushed to subscribers in process: from any thread, newest value wins
+import asyncio
+import sys
+import threading
+sys.path.insert(0, '.')
+
+import central_bank
+from central_bank import Deposit
+from shared.balance_events import BalanceHub, balance_hub
+
+
+def test_publish_from_a_thread_wakes_subscriber_with_newest_balance():
+    hub = BalanceHub()
+
+    async def listen():
+        subscription = hub.subscribe("hub@example.com")
+        assert await subscription.next(timeout=0.01) is None
+
+        def bank_thread():
+            hub.publish("hub@example.com", 10, -5, "spend")
+            hub.publish("hub@example.com", 7, -3, "spend")
+        worker = threading.Thread(target=bank_thread)
+        worker.start()
+        worker.join()
+
+        event = await subscription.next(timeout=1)
+        subscription.close()
+        return event
+
+    assert asyncio.run(listen()) == {"balance": 7, "delta": -3, "reason": "spend"}
+    assert hub.metrics()["connections"] == 0
+    assert hub.publish("hub@example.com", 1) == 0
+
+
+def test_bank_operations_publish_to_watchers():
+    email = "watched@example.com"
+    central_bank.get_balance(email)
+
+    async def watch():
+        subscription = balance_hub.subscribe(email)
+        seen = []
+        try:
+            for operation in (
+                lambda: central_bank.deposit_funds(Deposit(email=email, tokens=100, payment_id="test")),
+                lambda: central_bank.spend_now(email, "prompt_wizard", 5, "test"),
+                lambda: central_bank.release_hold(central_bank.reserve_tokens(email, 10, "prompt_wizard")["hold_id"]),
+            ):
+                await asyncio.to_thread(operation)
+                while (event := await subscription.next(timeout=0.2)) is not None:
+                    seen.append((event["balance"], event["reason"]))
+        finally:
+            subscription.close()
+        return seen
+
+    # reserve + release are conflated into the final (refunded) balance
+    assert asyncio.run(watch()) == [(115, "deposit"), (110, "prompt_wizard"), (110, "refund")]
+
+
+def test_concurrent_first_reads_create_one_account():
+    email = "racing@example.com"
+    results, errors = [], []
+
+    def read():
+        try:
+            results.append(central_bank.get_balance(email))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors and results == [15] * 8
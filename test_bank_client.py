@@ -0,0 +1,115 @@
+# test_bank_client.py
+# In-process bank client: database failures surface as BankUnavailable, like HTTP failures do
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import central_bank
+from shared.bank_client import BankClient, LocalBankClient, BankUnavailable, InsufficientTokens, HoldNotFound
+
+
+def fresh_bank(balance, email="client@example.com"):
+    """Point the bank at a new temp database holding one funded account"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["BANK_DB_PATH"] = path
+    central_bank.init_bank()
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO accounts (email, tokens) VALUES (?, ?)', (email, balance))
+    conn.commit()
+    conn.close()
+    return email
+
+
+def test_bank_client_is_abstract():
+    try:
+        BankClient()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("BankClient must not be instantiable")
+
+    class Partial(BankClient):
+        async def get_balance(self, email):
+            return 0
+
+    try:
+        Partial()
+    except TypeError as e:
+        assert "capture" in str(e)
+    else:
+        raise AssertionError("a backend missing methods must fail at construction")
+
+
+def test_local_reserve_capture_release():
+    email = fresh_bank(20)
+    client = LocalBankClient()
+
+    async def flow():
+        kept = await client.reserve(email, "prompt_wizard", 5, "kept")
+        returned = await client.reserve(email, "prompt_wizard", 5, "returned")
+        assert returned["remaining"] == 10
+        captured = await client.capture(kept["hold_id"])
+        released = await client.release(returned["hold_id"])
+        try:
+            await client.capture(returned["hold_id"])
+        except HoldNotFound:
+            pass
+        else:
+            raise AssertionError("a released hold must not be capturable")
+        try:
+            await client.reserve(email, "prompt_wizard", 16)
+        except InsufficientTokens:
+            pass
+        else:
+            raise AssertionError("expected InsufficientTokens")
+        return captured, released, await client.get_balance(email)
+
+    captured, released, balance = asyncio.run(flow())
+    assert captured["status"] == "captured" and released["status"] == "released"
+    assert balance == 15
+
+
+def test_sqlite_errors_become_bank_unavailable():
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    client = LocalBankClient()
+    client._bank = SimpleNamespace(get_balance=locked, spend_now=locked, reserve_tokens=locked,
+                                   capture_hold=locked, release_hold=locked)
+    for call in (client.get_balance("a@example.com"), client.spend("a@example.com", "app", 1),
+                 client.reserve("a@example.com", "app", 1), client.capture("h"), client.release("h")):
+        try:
+            asyncio.run(call)
+        except BankUnavailable as e:
+            assert "database is locked" in str(e)
+        else:
+            raise AssertionError("expected BankUnavailable")
+
+
+def test_unusable_database_becomes_bank_unavailable():
+    fresh_bank(20)
+    os.environ["BANK_DB_PATH"] = tempfile.mkdtemp()  # a directory: sqlite can't open it
+    client = LocalBankClient()
+    for call in (client.get_balance("client@example.com"), client.reserve("client@example.com", "app", 1)):
+        try:
+            asyncio.run(call)
+        except BankUnavailable as e:
+            assert "OperationalError" in str(e)
+        else:
+            raise AssertionError("expected BankUnavailable")
+    fresh_bank(20)
+
+
+def test_bank_errors_pass_through():
+    client = LocalBankClient()
+    try:
+        asyncio.run(client.spend("broke@example.com", "prompt_wizard", 10_000))
+    except InsufficientTokens:
+        pass
+    else:
+        raise AssertionError("expected InsufficientTokens")
@@ -0,0 +1,104 @@
+# test_catalog.py
+# One immutable app catalog for prices and dashboard cards, reloadable without a restart
+import json
+import os
+import sys
+import tempfile
+sys.path.insert(0, '.')
+
+from shared import catalog as catalog_module
+from shared.catalog import CatalogError, get_catalog, reload_catalog
+
+CATALOG_SOURCE = catalog_module.CATALOG_PATH
+
+
+def write_catalog(path, prompt_cost):
+    with open(CATALOG_SOURCE) as f:
+        data = json.load(f)
+    for app in data["apps"]:
+        if app["app_id"] == "prompt_wizard":
+            app["costs"]["optimize"] = prompt_cost
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_lookups_by_app_and_operation():
+    catalog = get_catalog()
+
+    assert catalog.cost("thumbnail_wizard", "analyze") == 4
+    assert catalog.cost("prompt_wizard") == 5
+    assert catalog.app("hook_wizard").name == "Hook Wizard"
+    assert "a11y_wizard" in catalog and "nope" not in catalog
+    for bad in (lambda: catalog.app("nope"), lambda: catalog.cost("prompt_wizard", "nope")):
+        try:
+            bad()
+            assert False, "expected CatalogError"
+        except CatalogError:
+            pass
+
+
+def test_catalog_is_immutable():
+    catalog = get_catalog()
+    for mutate in (lambda: setattr(catalog, "version", "x"),
+                   lambda: catalog.app("prompt_wizard").costs.__setitem__("optimize", 0),
+                   lambda: setattr(catalog.app("prompt_wizard"), "name", "x")):
+        try:
+            mutate()
+            assert False, "expected the catalog to refuse"
+        except (AttributeError, TypeError):
+            pass
+
+
+def test_reload_swaps_atomically_and_keeps_old_catalog_on_bad_file():
+    path = tempfile.mkstemp(suffix=".json")[1]
+    try:
+        write_catalog(path, 5)
+        before = reload_catalog(path)
+        write_catalog(path, 7)
+        after = reload_catalog(path)
+
+        assert before.cost("prompt_wizard") == 5  # a request holding the old snapshot
+        assert after.cost("prompt_wizard") == 7 and get_catalog() is after
+        assert after.version != before.version
+
+        with open(path, "w") as f:
+            f.write('{"apps": [{"app_id": "broken"}]}')
+        try:
+            reload_catalog(path)
+            assert False, "expected CatalogError"
+        except CatalogError:
+            pass
+        assert get_catalog() is after
+    finally:
+        reload_catalog(CATALOG_SOURCE)
+        os.unlink(path)
+
+
+def test_passport_middleware_charges_current_price():
+    from ai_app_middleware import TokenASGIMiddleware
+
+    middleware = TokenASGIMiddleware(None, "prompt_wizard", "http://bank", routes={"/go": "optimize"})
+    path = tempfile.mkstemp(suffix=".json")[1]
+    try:
+        assert middleware.cost_of("optimize") == 5
+        write_catalog(path, 9)
+        reload_catalog(path)
+        assert middleware.cost_of("optimize") == 9
+    finally:
+        reload_catalog(CATALOG_SOURCE)
+        os.unlink(path)
+
+
+def test_catalog_watcher_is_cancelled_on_shutdown():
+    import asyncio
+    import clean_app
+
+    async def cycle():
+        await clean_app.start_catalog_watcher()
+        watcher = clean_app._catalog_watcher
+        await asyncio.sleep(0)
+        await clean_app.stop_catalog_watcher()
+        return watcher
+
+    watcher = asyncio.run(cycle())
+    assert watcher.cancelled() and clean_app._catalog_watcher is None
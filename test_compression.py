@@ -0,0 +1,152 @@
+# test_compression.py
+# Response compression: Accept-Encoding negotiation, size threshold, streams untouched, precompressed pages
+import asyncio
+import gzip
+import sys
+sys.path.insert(0, '.')
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+from shared.compression import (CompressionMiddleware, choose_encoding, precompressed, precompressed_response,
+                                brotli_module)
+
+PAGE = "<p>" + "compress me " * 200 + "</p>"
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/page")
+    async def page():
+        return HTMLResponse(PAGE)
+
+    @app.get("/small")
+    async def small():
+        return HTMLResponse("<p>tiny</p>")
+
+    @app.get("/events")
+    async def events():
+        async def stream():
+            yield "data: " + "x" * 1000 + "\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/static")
+    async def static(request: Request):
+        return precompressed_response(request, PAGE)
+
+    return app
+
+
+def fetch(path, accept_encoding):
+    async def go():
+        transport = httpx.ASGITransport(app=make_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            async with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+                raw = b"".join([chunk async for chunk in response.aiter_raw()])
+                return response, raw
+    return asyncio.run(go())
+
+
+def test_choose_encoding():
+    assert choose_encoding("") is None
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == ("br" if brotli_module() else "gzip")
+    assert choose_encoding("br") == ("br" if brotli_module() else None)
+
+
+def test_large_html_is_compressed_when_accepted():
+    response, raw = fetch("/page", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert int(response.headers["content-length"]) == len(raw) < len(PAGE)
+    assert gzip.decompress(raw).decode() == PAGE
+
+    response, raw = fetch("/page", "identity")
+    assert "content-encoding" not in response.headers and raw.decode() == PAGE
+
+
+def test_small_and_streaming_responses_pass_through():
+    response, raw = fetch("/small", "gzip")
+    assert "content-encoding" not in response.headers and raw == b"<p>tiny</p>"
+
+    response, raw = fetch("/events", "gzip")
+    assert "content-encoding" not in response.headers and raw.startswith(b"data: ")
+
+
+def test_precompressed_page_is_compressed_once():
+    first = precompressed(PAGE)
+    assert precompressed(PAGE) is first
+    response, raw = fetch("/static", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert raw == first.encoded["gzip"]  # not recompressed by the middleware
+
+
+def test_wizard_step_with_made_up_choices_skips_the_precompressed_cache():
+    import clean_app
+    from shared.session_store import get_session_store
+
+    async def go():
+        session_id = get_session_store().create("compress@example.com")
+        transport = httpx.ASGITransport(app=clean_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app",
+                                     cookies={"session": session_id}) as client:
+            responses = []
+            for query in ("goal=explain", "goal=made-up-1", "goal=made-up-2"):
+                async with client.stream("GET", f"/prompt-wizard/step/2?{query}",
+                                         headers={"Accept-Encoding": "gzip"}) as response:
+                    responses.append((response, b"".join([chunk async for chunk in response.aiter_raw()])))
+            return responses
+
+    precompressed.cache_clear()
+    (known, known_raw), *made_up = asyncio.run(go())
+    assert precompressed.cache_info().currsize == 1  # only the real choice
+    assert known.headers["content-encoding"] == "gzip" and known_raw == precompressed(
+        clean_app.PROMPT_WIZARD.render(2, {"goal": "explain"})).encoded["gzip"]
+    for response, raw in made_up:
+        # still compressed, by the middleware at its normal level
+        assert response.headers["content-encoding"] == "gzip" and b"made-up" in gzip.decompress(raw)
+
+
+def test_template_responses_under_a_test_client_pass_their_debug_message_through():
+    import os
+    import tempfile
+    from fastapi.templating import Jinja2Templates
+
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, "page.html"), "w") as f:
+        f.write(PAGE)
+    templates = Jinja2Templates(directory=directory)
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/template")
+    async def template(request: Request):
+        return templates.TemplateResponse("page.html", {"request": request})
+
+    async def go():
+        messages = []
+        requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            return requests.pop() if requests else {"type": "http.disconnect"}
+
+        async def capture(message):
+            messages.append(message)
+
+        # Starlette's TestClient advertises this extension; TemplateResponse then sends the extra message
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                 "scheme": "http", "path": "/template", "raw_path": b"/template", "root_path": "",
+                 "query_string": b"", "headers": [(b"host", b"app"), (b"accept-encoding", b"gzip")],
+                 "client": ("127.0.0.1", 1), "server": ("app", 80), "extensions": {"http.response.debug": {}}}
+        await app(scope, receive, capture)
+        return messages
+
+    messages = asyncio.run(go())
+    assert [m["type"] for m in messages] == ["http.response.debug", "http.response.start", "http.response.body"]
+    assert (b"content-encoding", b"gzip") in messages[1]["headers"]
+    assert gzip.decompress(messages[2]["body"]).decode() == PAGE
@@ -36,8 +36,8 @@ cursor.execute("SELECT email, tokens FROM accounts")
 accounts = cursor.fetchall()
 print(f"\n📊 Accounts in database: {accounts}")
 
-cursor.execute("SELECT COUNT(*) FROM magic_links")
+cursor.execute("SELECT COUNT(*) FROM sessions")
 magic_count = cursor.fetchone()[0]
-print(f"📊 Magic links in database: {magic_count}")
+print(f"📊 Sessions in database: {magic_count}")
 
 conn.close()
@@ -0,0 +1,98 @@
+# test_dashboard_app.py
+# Dashboard prompt generation: session login, hold captured on success, released when the LLM fails
+import asyncio
+import os
+import sqlite3
+import sys
+sys.path.insert(0, '.')
+
+import httpx
+
+import central_bank
+from dashboard import app as dashboard
+from shared.catalog import get_catalog
+from shared.llm_client import LLMError
+from shared.session_store import get_session_store
+
+FORM = {"goal": "Explain", "audience": "Beginners", "platform": "ChatGPT", "style": "Step", "tone": "Friendly"}
+
+
+class FakeLLM:
+    def __init__(self, reply=None, error=None):
+        self.reply = reply
+        self.error = error
+
+    def chat(self, messages, api_key, **params):
+        if self.error:
+            raise self.error
+        return self.reply
+
+
+def funded_session(email, tokens):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (email, tokens))
+    conn.commit()
+    conn.close()
+    return get_session_store().create(email)
+
+
+def holds_of(email):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    rows = conn.execute('SELECT status FROM holds WHERE email = ?', (email,)).fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def generate(session_id, llm):
+    original = dashboard.get_llm_client
+    dashboard.get_llm_client = lambda: llm
+    os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
+
+    async def post():
+        transport = httpx.ASGITransport(app=dashboard.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://dashboard",
+                                     cookies={"session": session_id}) as client:
+            return await client.post("/generate-prompt", data=FORM)
+
+    try:
+        return asyncio.run(post())
+    finally:
+        dashboard.get_llm_client = original
+
+
+def test_generation_captures_the_hold():
+    cost = get_catalog().cost("prompt_wizard", "optimize")
+    session_id = funded_session("captured@example.com", 20)
+    response = generate(session_id, FakeLLM(reply="A ready-to-use prompt"))
+    assert response.status_code == 200 and "A ready-to-use prompt" in response.text
+    assert central_bank.get_balance("captured@example.com") == 20 - cost
+    assert holds_of("captured@example.com") == ["captured"]
+
+
+def test_llm_failure_releases_the_hold():
+    session_id = funded_session("released@example.com", 20)
+    response = generate(session_id, FakeLLM(error=LLMError("upstream down", status_code=503)))
+    assert response.status_code == 200 and "API Error 503" in response.text
+    assert central_bank.get_balance("released@example.com") == 20
+    assert holds_of("released@example.com") == ["released"]
+
+
+def test_result_reports_the_catalog_price():
+    class RepricedCatalog:
+        def cost(self, app_id, operation):
+            return 7
+
+    session_id = funded_session("repriced@example.com", 20)
+    original = dashboard.get_catalog
+    dashboard.get_catalog = lambda: RepricedCatalog()
+    try:
+        response = generate(session_id, FakeLLM(reply="A ready-to-use prompt"))
+    finally:
+        dashboard.get_catalog = original
+    assert "7 tokens spent" in response.text
+    assert central_bank.get_balance("repriced@example.com") == 13
+
+
+def test_generation_needs_a_session():
+    response = generate("not-a-session", FakeLLM(reply="never"))
+    assert response.status_code == 307 and response.headers["location"] == "/login"
@@ -0,0 +1,215 @@
+# test_job_queue.py
+# SQLite job queue: worker pool processing and restart recovery
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, '.')
+
+from shared.job_queue import JobQueue, WorkerPool, QUEUED, RUNNING, DONE, FAILED
+
+
+def temp_db():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    return path
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_worker_pool_processes_jobs_concurrently():
+    queue = JobQueue(db_path=temp_db())
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_echo(payload):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.2)
+        with lock:
+            running.pop()
+        return payload["text"].upper()
+
+    pool = WorkerPool(queue, {"echo": slow_echo}, concurrency=3, poll_interval=0.05)
+    pool.start()
+    try:
+        ids = [queue.enqueue("echo", {"text": f"job {i}"}, email="a@example.com") for i in range(6)]
+        assert wait_until(lambda: all(queue.get(i)["status"] == DONE for i in ids))
+        assert queue.get(ids[0])["result"] == "JOB 0"
+        assert max(peak) == 3
+    finally:
+        pool.stop()
+
+
+def test_handler_errors_mark_job_failed():
+    queue = JobQueue(db_path=temp_db())
+
+    def boom(payload):
+        raise RuntimeError("upstream exploded")
+
+    pool = WorkerPool(queue, {"boom": boom}, concurrency=1, poll_interval=0.05)
+    pool.start()
+    try:
+        job_id = queue.enqueue("boom", {})
+        assert wait_until(lambda: queue.get(job_id)["status"] == FAILED)
+        assert "upstream exploded" in queue.get(job_id)["error"]
+    finally:
+        pool.stop()
+
+
+def test_jobs_survive_restart():
+    path = temp_db()
+    queue = JobQueue(db_path=path, max_attempts=2, lease_seconds=0.1)
+    waiting = queue.enqueue("echo", {"text": "waiting"})
+    interrupted = queue.enqueue("echo", {"text": "interrupted"})
+    claimed = queue.claim()  # a worker took it, then the process died
+    assert claimed["id"] == waiting
+    assert queue.get(waiting)["status"] == RUNNING
+    time.sleep(0.2)  # nobody renews the dead process's lease
+
+    # New process, same database
+    restarted = JobQueue(db_path=path, max_attempts=2)
+    pool = WorkerPool(restarted, {"echo": lambda p: p["text"]}, concurrency=1, poll_interval=0.05)
+    pool.start()
+    try:
+        assert wait_until(lambda: restarted.get(waiting)["status"] == DONE)
+        assert wait_until(lambda: restarted.get(interrupted)["status"] == DONE)
+        assert restarted.get(waiting)["attempts"] == 2
+    finally:
+        pool.stop()
+
+
+def test_recover_gives_up_after_max_attempts():
+    queue = JobQueue(db_path=temp_db(), max_attempts=1, lease_seconds=0.1)
+    job_id = queue.enqueue("echo", {"text": "poison"})
+    queue.claim()
+    time.sleep(0.2)
+    queue.recover()
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.claim() is None
+    assert queue.get(job_id)["status"] != QUEUED
+
+
+
+def test_sibling_workers_do_not_requeue_live_jobs():
+    path = temp_db()
+    busy = JobQueue(db_path=path, lease_seconds=0.3)
+    job_id = busy.enqueue("echo", {"text": "slow"})
+    assert busy.claim()["id"] == job_id
+
+    # Another worker process starting up while the job is still running
+    sibling = JobQueue(db_path=path, lease_seconds=0.3)
+    for _ in range(3):
+        time.sleep(0.2)
+        busy.renew_leases()
+        assert sibling.recover() == 0
+    assert sibling.claim() is None
+    assert busy.complete(job_id, "SLOW") is True
+    assert busy.get(job_id)["status"] == DONE
+
+
+def test_expired_lease_is_requeued_and_late_result_dropped():
+    path = temp_db()
+    stalled = JobQueue(db_path=path, lease_seconds=0.1)
+    job_id = stalled.enqueue("echo", {"text": "stalled"})
+    stalled.claim()
+    time.sleep(0.2)
+
+    sibling = JobQueue(db_path=path, lease_seconds=0.1)
+    assert sibling.recover() == 1
+    assert sibling.claim()["id"] == job_id
+    assert stalled.complete(job_id, "late") is False  # the old owner wakes up: not its job any more
+    assert sibling.get(job_id)["status"] == RUNNING
+    sibling.complete(job_id, "STALLED")
+    assert sibling.get(job_id)["result"] == "STALLED"
+
+
+class QuickTimeoutQueue(JobQueue):
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=0.05, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def test_claim_on_a_locked_database_raises_the_lock_error():
+    queue = QuickTimeoutQueue(db_path=temp_db())
+    queue.enqueue("echo", {"text": "x"})
+    holder = sqlite3.connect(queue.db_path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        queue.claim()
+        assert False, "claim should fail while another writer holds the lock"
+    except sqlite3.OperationalError as e:
+        assert "locked" in str(e)  # not "cannot rollback - no transaction is active"
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+
+
+class FlakyQueue(JobQueue):
+    """Fails the first claims and the first complete like a busy database would"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = {"claim": 2, "complete": 1}
+
+    def _flake(self, name):
+        if self.failures[name]:
+            self.failures[name] -= 1
+            raise sqlite3.OperationalError("database is locked")
+
+    def claim(self):
+        self._flake("claim")
+        return super().claim()
+
+    def complete(self, job_id, result):
+        self._flake("complete")
+        return super().complete(job_id, result)
+
+
+def test_workers_survive_database_errors():
+    queue = FlakyQueue(db_path=temp_db())
+    pool = WorkerPool(queue, {"echo": lambda payload: payload["text"]}, concurrency=1, poll_interval=0.01)
+    pool.start()
+    try:
+        job_id = queue.enqueue("echo", {"text": "still here"})
+        assert wait_until(lambda: queue.get(job_id)["status"] == DONE)
+        assert queue.failures == {"claim": 0, "complete": 0}
+        assert all(thread.is_alive() for thread in pool._threads)
+    finally:
+        pool.stop()
+
+
+def test_job_events_report_a_job_that_disappears():
+    import clean_app
+    from shared.session_store import get_session_store
+
+    session_id = get_session_store().create("jobs@example.com")
+    job_id = clean_app.get_job_queue().enqueue("never-run", {}, email="jobs@example.com")
+
+    async def watch():
+        # httpx's ASGITransport buffers whole responses, so read the SSE stream from the endpoint directly
+        response = await clean_app.job_events(job_id, session=session_id)
+        events = []
+        async for chunk in response.body_iterator:
+            events.append(chunk.split("\n", 1)[0].split(":", 1)[1].strip())
+            if len(events) == 1:
+                conn = sqlite3.connect(clean_app.get_job_queue().db_path)
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                conn.commit()
+                conn.close()
+        return events
+
+    assert asyncio.run(asyncio.wait_for(watch(), 10)) == ["status", "error"]
@@ -0,0 +1,155 @@
+# test_llm_client.py
+# Retry / hedging / circuit breaker behaviour against stub_deepseek.py fault injection
+import sys
+import time
+sys.path.insert(0, '.')
+
+import requests
+
+from shared.llm_client import LLMClient, CircuitBreaker, LLMError, CircuitOpenError
+from stub_deepseek import serve_in_thread
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def start_stub():
+    server, base_url = serve_in_thread()
+    return server, base_url
+
+
+def inject(base_url, **fault):
+    requests.post(f"{base_url}/_faults", json=fault, timeout=2)
+
+
+def make_client(base_url, **kwargs):
+    options = dict(backoff_base=0.01, backoff_cap=0.05, attempt_timeout=2.0, deadline=5.0)
+    options.update(kwargs)
+    return LLMClient(api_url=f"{base_url}/chat/completions", **options)
+
+
+def test_retries_retryable_status_then_succeeds():
+    server, base_url = start_stub()
+    try:
+        inject(base_url, status=503, count=2)
+        client = make_client(base_url, max_attempts=3)
+        answer = client.chat(MESSAGES, "key")
+        assert answer.startswith("Stub answer")
+        assert server.plan.calls == 3
+        assert client.metrics()["retries"] == 2
+        assert client.breaker.state == CircuitBreaker.CLOSED
+    finally:
+        server.shutdown()
+
+
+def test_does_not_retry_client_errors():
+    server, base_url = start_stub()
+    try:
+        inject(base_url, status=401, count=1)
+        client = make_client(base_url, max_attempts=3)
+        try:
+            client.chat(MESSAGES, "bad-key")
+            assert False, "expected LLMError"
+        except LLMError as e:
+            assert e.status_code == 401
+        assert server.plan.calls == 1
+    finally:
+        server.shutdown()
+
+
+def test_timeout_is_retried_within_deadline():
+    server, base_url = start_stub()
+    try:
+        inject(base_url, delay=1.0, count=1)
+        client = make_client(base_url, attempt_timeout=0.3, max_attempts=2)
+        started = time.monotonic()
+        assert client.chat(MESSAGES, "key").startswith("Stub answer")
+        assert time.monotonic() - started < 1.0
+    finally:
+        server.shutdown()
+
+
+def test_breaker_opens_and_fails_fast_then_recovers():
+    server, base_url = start_stub()
+    try:
+        inject(base_url, status=503, count=4)
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.3)
+        client = make_client(base_url, max_attempts=2, breaker=breaker)
+
+        try:
+            client.chat(MESSAGES, "key")
+            assert False, "expected LLMError"
+        except LLMError:
+            pass
+        assert breaker.state == CircuitBreaker.OPEN
+        calls_before = server.plan.calls
+
+        # While open: no upstream traffic, immediate failure
+        started = time.monotonic()
+        try:
+            client.chat(MESSAGES, "key")
+            assert False, "expected CircuitOpenError"
+        except CircuitOpenError:
+            pass
+        assert time.monotonic() - started < 0.05
+        assert server.plan.calls == calls_before
+        assert client.metrics()["breaker"]["state"] == "open"
+        assert client.metrics()["short_circuited"] == 1
+
+        # After reset_timeout a single probe goes through; drain the remaining faults first
+        inject(base_url, reset=True)
+        time.sleep(0.35)
+        assert client.chat(MESSAGES, "key").startswith("Stub answer")
+        assert breaker.state == CircuitBreaker.CLOSED
+    finally:
+        server.shutdown()
+
+
+class ExplodingSession:
+    """Fails every call with an error the client doesn't expect"""
+
+    def post(self, *args, **kwargs):
+        raise RuntimeError("stream broke mid-body")
+
+
+def test_unexpected_probe_error_reopens_instead_of_wedging_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    client = LLMClient(api_url="http://unused", breaker=breaker, max_attempts=1)
+    client._session = ExplodingSession()
+
+    for _ in range(3):
+        time.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN or breaker.state == CircuitBreaker.CLOSED
+        try:
+            client.chat(MESSAGES, "key")
+            assert False, "expected LLMError"
+        except CircuitOpenError:
+            assert False, "probe was short-circuited: breaker stuck half-open"
+        except LLMError:
+            pass
+        assert breaker.state == CircuitBreaker.OPEN
+    assert client.metrics()["short_circuited"] == 0
+
+
+def test_hedged_request_beats_slow_primary():
+    server, base_url = start_stub()
+    try:
+        client = make_client(base_url, hedge=True, hedge_min_samples=5, attempt_timeout=3.0)
+        for _ in range(5):
+            client.chat(MESSAGES, "key")  # warm up latency samples
+
+        inject(base_url, delay=1.5, count=1)  # only the primary is slow
+        started = time.monotonic()
+        assert client.chat(MESSAGES, "key").startswith("Stub answer")
+        assert time.monotonic() - started < 1.0
+        metrics = client.metrics()
+        assert metrics["hedges"] == 1
+        assert metrics["hedge_wins"] == 1
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_"):
+            func()
+            print(f"✅ {name}")
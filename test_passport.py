@@ -0,0 +1,185 @@
+# test_passport.py
+# v2 binary passports: round trip, tampering, expiry, v1 fallback and bank-side email lookup
+import os
+import sqlite3
+import sys
+import time
+sys.path.insert(0, '.')
+
+import asyncio
+
+import httpx
+import pydantic
+
+import central_bank
+from central_bank import register_passport, settle_spends, SettlementEntry
+from passport_generator import issue_passports
+from pricing import PRICING
+from shared.passport import app_key, issue, encode, decode, InvalidPassport, V2_SIZE
+
+EMAIL = "passport@example.com"
+
+
+def rejected(token, app_id="thumbnail_wizard"):
+    try:
+        decode(token, app_id)
+    except InvalidPassport:
+        return True
+    return False
+
+
+def test_v2_round_trip_is_compact():
+    token, issued = issue(EMAIL, "thumbnail_wizard", 200)
+    passport = decode(token, "thumbnail_wizard")
+
+    assert "." not in token and len(token) == 67 and V2_SIZE == 50
+    assert passport["budget"] == 200
+    assert passport["passport_id"] == issued["passport_id"]
+    assert passport["email"] is None and passport["email_hash"] == issued["email_hash"]
+
+    passport["budget"] -= 4
+    assert decode(encode(passport), "thumbnail_wizard")["budget"] == 196
+
+
+def test_v2_rejects_tampering_other_apps_and_expiry():
+    token, _ = issue(EMAIL, "thumbnail_wizard", 200)
+    flipped = token[:10] + ("A" if token[10] != "A" else "B") + token[11:]
+
+    assert rejected(flipped)
+    assert rejected(token[:-2])
+    assert rejected(token, app_id="prompt_wizard")
+    assert rejected(issue(EMAIL, "thumbnail_wizard", 200, ttl=-1)[0])
+
+
+def test_v1_passports_still_verify():
+    token, _ = issue(EMAIL, "prompt_wizard", 50, version=1)
+    passport = decode(token, "prompt_wizard")
+
+    assert "." in token
+    assert passport["version"] == 1 and passport["email"] == EMAIL
+    # Re-signing keeps the old format for apps that only read v1
+    passport["budget"] -= 5
+    assert "." in encode(passport)
+    assert rejected(token, app_id="thumbnail_wizard")
+
+
+def test_bank_settles_v2_spends_by_passport_id():
+    central_bank.init_bank()
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (EMAIL, 10))
+    conn.commit()
+    conn.close()
+
+    token, passport = issue(EMAIL, "thumbnail_wizard", 10)
+    register_passport(passport)
+    spend = decode(token, "thumbnail_wizard")
+    results = settle_spends("thumbnail_wizard", [
+        SettlementEntry(id=f"s-{time.time()}", passport_id=spend["passport_id"], tokens=4),
+        SettlementEntry(id=f"u-{time.time()}", passport_id="0000000000000000", tokens=4),
+    ])
+
+    assert sorted(results.values()) == ["rejected", "settled"]
+    assert central_bank.get_balance(EMAIL) == 6
+
+
+def test_settlement_needs_positive_amounts_and_app_credentials():
+    central_bank.init_bank()
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    conn.execute('INSERT OR REPLACE INTO accounts (email, tokens) VALUES (?, ?)', (EMAIL, 10))
+    conn.commit()
+    conn.close()
+    _, passport = issue(EMAIL, "thumbnail_wizard", 10)
+    register_passport(passport)
+
+    for tokens in (0, -50):
+        try:
+            SettlementEntry(id="bad", passport_id=passport["passport_id"], tokens=tokens)
+            assert False, f"{tokens} tokens accepted"
+        except pydantic.ValidationError:
+            pass
+    # One bad entry refuses the whole batch, even when called in-process
+    good = SettlementEntry(id=f"g-{time.time()}", passport_id=passport["passport_id"], tokens=1)
+    bad = SettlementEntry.model_construct(id=f"b-{time.time()}", passport_id=passport["passport_id"], tokens=-50)
+    try:
+        settle_spends("thumbnail_wizard", [good, bad])
+        assert False, "negative settlement accepted"
+    except ValueError:
+        pass
+    assert central_bank.get_balance(EMAIL) == 10
+
+    # Another app can't settle against this passport
+    assert settle_spends("prompt_wizard", [good]) == {good.id: "rejected"}
+
+    async def post(key, tokens=1):
+        transport = httpx.ASGITransport(app=central_bank.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bank") as client:
+            entry = {"id": f"h-{time.time()}", "passport_id": passport["passport_id"], "tokens": tokens}
+            response = await client.post("/settle", json={"app_id": "thumbnail_wizard", "entries": [entry]},
+                                         headers={"X-App-Key": key} if key else {})
+            return response.status_code
+
+    assert asyncio.run(post(None)) == 401
+    assert asyncio.run(post(app_key("prompt_wizard"))) == 401
+    assert asyncio.run(post(app_key("thumbnail_wizard"), tokens=-5)) == 422
+    assert asyncio.run(post(app_key("thumbnail_wizard"))) == 200
+    assert central_bank.get_balance(EMAIL) == 9
+
+
+def test_bulk_issue_covers_every_app_with_one_registry_write():
+    central_bank.init_bank()
+    result = issue_passports(EMAIL)
+
+    assert set(result["passports"]) == set(PRICING)
+    ids = [decode(token, app_id)["passport_id"] for app_id, token in result["passports"].items()]
+    assert all(central_bank.passport_email(passport_id) == EMAIL for passport_id in ids)
+    try:
+        issue_passports(EMAIL, ["thumbnail_wizard", "nope"])
+        assert False, "unknown app accepted"
+    except ValueError:
+        pass
+
+
+def test_bulk_budgets_share_one_session_budget():
+    central_bank.init_bank()
+    central_bank.get_balance("shared@example.com")
+    result = issue_passports("shared@example.com")
+    budgets = {app_id: decode(token, app_id)["budget"] for app_id, token in result["passports"].items()}
+    assert budgets == result["budgets"]
+    assert sum(budgets.values()) == result["session_budget"] <= result["total_balance"]
+    assert max(budgets.values()) - min(budgets.values()) <= 1
+
+
+def test_spends_must_be_positive():
+    central_bank.init_bank()
+    before = central_bank.get_balance("spender@example.com")
+    try:
+        central_bank.spend_now("spender@example.com", "thumbnail_wizard", -50, "refund myself")
+        assert False, "negative spend accepted"
+    except ValueError:
+        pass
+
+    async def post(tokens):
+        transport = httpx.ASGITransport(app=central_bank.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bank") as client:
+            response = await client.post("/spend", json={"email": "spender@example.com", "app_id": "thumbnail_wizard",
+                                                         "tokens": tokens, "description": "x"})
+            return response.status_code
+
+    assert asyncio.run(post(-50)) == 422
+    assert asyncio.run(post(0)) == 422
+    assert central_bank.get_balance("spender@example.com") == before
+
+
+def test_apps_without_a_passport_code_are_refused():
+    import passport_generator
+    original = passport_generator.APP_CODES
+    passport_generator.APP_CODES = tuple(code for code in original if code != "a11y_wizard")
+    try:
+        for call in (lambda: issue_passports(EMAIL), lambda: issue_passports(EMAIL, ["a11y_wizard"])):
+            try:
+                call()
+                assert False, "app without a passport code accepted"
+            except ValueError as e:
+                assert "a11y_wizard" in str(e)
+    finally:
+        passport_generator.APP_CODES = original
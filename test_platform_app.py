@@ -0,0 +1,124 @@
+# test_platform_app.py
+# One composed app serves every mounted service, and runs their startup hooks; the bank stays internal
+import asyncio
+import os
+import sys
+sys.path.insert(0, '.')
+os.environ.setdefault("BANK_INTERNAL_TOKEN", "platform-test-token")
+
+import httpx
+
+
+def test_every_mount_answers_in_one_process():
+    import platform_app
+    from shared.session_store import get_session_store
+
+    async def walk():
+        await platform_app.start_mounted_apps()
+        try:
+            assert platform_app.thumbnail_proxy.upstream is not None  # proxy startup hook ran
+            session_id = get_session_store().create("platform@example.com")
+            transport = httpx.ASGITransport(app=platform_app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://platform",
+                                         cookies={"session": session_id}) as client:
+                internal = {"X-Internal-Token": os.environ["BANK_INTERNAL_TOKEN"]}
+                statuses = {path: (await client.get(path)).status_code for path in (
+                    "/dashboard",
+                    "/wizard/prompt-wizard/step/1",
+                    "/thumbnails/_proxy/metrics",
+                    "/dashboard-app/which-app-dashboard",
+                )}
+                statuses["internal /bank/balance"] = (await client.get(
+                    "/bank/balance?email=platform@example.com", headers=internal)).status_code
+                return statuses
+        finally:
+            await platform_app.stop_mounted_apps()
+
+    statuses = asyncio.run(walk())
+    assert set(statuses.values()) == {200}, statuses
+
+
+def test_bank_mount_needs_the_internal_token():
+    import platform_app
+
+    async def probe():
+        transport = httpx.ASGITransport(app=platform_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://platform") as client:
+            deposit = {"email": "mint@example.com", "tokens": 1000000, "payment_id": "free"}
+            return (
+                (await client.post("/bank/deposit", json=deposit)).status_code,
+                (await client.post("/bank/deposit", json=deposit, headers={"X-Internal-Token": "guess"})).status_code,
+                (await client.get("/bank/balance?email=mint@example.com")).status_code,
+                # /settle is reachable but checks its own app key
+                (await client.post("/bank/settle", json={"app_id": "thumbnail_wizard", "entries": []})).status_code,
+            )
+
+    assert asyncio.run(probe()) == (403, 403, 403, 401)
+    import central_bank
+    assert central_bank.get_balance("mint@example.com") == 15  # nothing minted
+
+
+def test_mounted_wizard_links_stay_under_the_mount():
+    import platform_app
+
+    async def pages():
+        transport = httpx.ASGITransport(app=platform_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://platform") as client:
+            return (await client.get("/wizard/")).text, (await client.get("/wizard/prompt-wizard/step/1")).text, \
+                (await client.get("/wizard/prompt-wizard/step/6?goal=explain")).text
+
+    home, first, form = asyncio.run(pages())
+    assert 'href="/wizard/prompt-wizard/step/1"' in home
+    assert 'href="/wizard/prompt-wizard/step/2?goal=explain"' in first
+    assert 'action="/wizard/prompt-wizard/generate"' in form
+    assert 'href="/prompt-wizard/' not in home + first + form
+
+
+def test_mounted_wizard_generate_needs_a_session_and_a_hold():
+    import platform_app
+    import prompt_wizard
+    from shared.catalog import get_catalog
+    from shared.session_store import get_session_store
+    import central_bank
+
+    calls = []
+
+    class FakeLLM:
+        def chat(self, messages, api_key, **params):
+            calls.append(messages)
+            return "## Role: Tutor"
+
+    original = prompt_wizard.get_llm_client
+    prompt_wizard.get_llm_client = lambda: FakeLLM()
+
+    async def generate(cookies):
+        transport = httpx.ASGITransport(app=platform_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://platform", cookies=cookies) as client:
+            return await client.get("/wizard/prompt-wizard/generate", params={"prompt": "explain tides"})
+
+    try:
+        anonymous = asyncio.run(generate({}))
+        forged = asyncio.run(generate({"session": "test_wizard@example.com"}))
+        before = central_bank.get_balance("wizard@example.com")
+        paid = asyncio.run(generate({"session": get_session_store().create("wizard@example.com")}))
+    finally:
+        prompt_wizard.get_llm_client = original
+
+    assert anonymous.status_code == 307 and anonymous.headers["location"].startswith("/login")
+    assert forged.status_code == 307
+    assert paid.status_code == 200 and "## Role: Tutor" in paid.text
+    assert len(calls) == 1  # only the paying request reached the LLM
+    assert central_bank.get_balance("wizard@example.com") == before - get_catalog().cost("prompt_wizard", "optimize")
+
+
+def test_dashboard_mount_has_no_debug_routes():
+    import platform_app
+
+    async def probe():
+        transport = httpx.ASGITransport(app=platform_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://platform") as client:
+            return ((await client.post("/dashboard-app/test-login", data={"email": "x@example.com"})).status_code,
+                    (await client.get("/dashboard-app/debug")).status_code,
+                    (await client.get("/dashboard-app/debug-file")).status_code)
+
+    assert asyncio.run(probe()) == (404, 404, 404)
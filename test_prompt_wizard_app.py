@@ -0,0 +1,46 @@
+# test_prompt_wizard_app.py
+# Single-page prompt wizard: one cached bundle built from the option tables
+import asyncio
+import json
+import re
+import sys
+sys.path.insert(0, '.')
+
+import httpx
+
+
+def test_bundle_carries_every_option():
+    import clean_app
+
+    body, etag = clean_app.prompt_wizard_bundle()
+    steps = json.loads(re.search(r'<script type="application/json" id="wizard-steps">(.*?)</script>', body, re.S).group(1))
+
+    assert [step["field"] for step in steps] == [step.field for step in clean_app.PROMPT_WIZARD.steps]
+    for step, definition in zip(steps, clean_app.PROMPT_WIZARD.steps):
+        assert [option["value"] for option in step["options"]] == [option.value for option in definition.options]
+        assert all(option["icon"] == clean_app.ICON_MAP[option["value"]] for option in step["options"])
+    # the final form sends exactly what /prompt-wizard/generate takes
+    for step in steps:
+        assert f'<input type="hidden" name="{step["field"]}">' in body
+    assert clean_app.prompt_wizard_bundle() == (body, etag)
+
+
+def test_bundle_is_revalidated_with_its_etag():
+    import clean_app
+    from shared.session_store import get_session_store
+
+    async def fetch():
+        session_id = get_session_store().create("wizard@example.com")
+        transport = httpx.ASGITransport(app=clean_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            anonymous = await client.get("/prompt-wizard/app")
+            client.cookies.set("session", session_id)
+            first = await client.get("/prompt-wizard/app")
+            again = await client.get("/prompt-wizard/app", headers={"If-None-Match": first.headers["etag"]})
+            return anonymous, first, again
+
+    anonymous, first, again = asyncio.run(fetch())
+    assert anonymous.status_code == 307 and "/login" in anonymous.headers["location"]
+    assert first.status_code == 200 and "Explain" in first.text
+    assert "no-cache" in first.headers["cache-control"]
+    assert again.status_code == 304 and again.content == b""
@@ -0,0 +1,170 @@
+# test_session_store.py
+# Session ids are separate from magic links: LRU cache in front, SQLite write-through behind
+import asyncio
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+import httpx
+from fastapi import FastAPI, Request
+
+from shared.session_store import (SessionStore, MemorySessionBackend, SQLiteSessionBackend, SignedSessionCookies,
+                                  StatelessSessionMiddleware, SIGNED_COOKIE, get_session_store, request_email)
+
+
+def sqlite_store(**kwargs):
+    return SessionStore(SQLiteSessionBackend(tempfile.mkstemp(suffix=".db")[1]), **kwargs)
+
+
+def test_lookups_are_served_from_cache_and_survive_a_restart():
+    store = sqlite_store()
+    session_id = store.create("cache@example.com")
+
+    assert store.get(session_id) == "cache@example.com"
+    assert store.metrics()["hits"] == 1 and store.metrics()["misses"] == 0
+
+    # Another worker / a restart: empty cache, same database
+    other = SessionStore(SQLiteSessionBackend(store.backend.db_path))
+    assert other.get(session_id) == "cache@example.com"
+    assert other.get(session_id) == "cache@example.com"
+    assert other.metrics()["misses"] == 1 and other.metrics()["hits"] == 1
+
+
+def test_delete_writes_through_and_cache_ttl_bounds_staleness():
+    store = sqlite_store(cache_ttl=0.05)
+    other = SessionStore(SQLiteSessionBackend(store.backend.db_path), cache_ttl=0.05)
+    session_id = store.create("logout@example.com")
+    assert other.get(session_id) == "logout@example.com"
+
+    store.delete(session_id)
+    assert store.get(session_id) is None
+    time.sleep(0.1)
+    assert other.get(session_id) is None
+
+
+def test_lru_evicts_least_recently_used_and_expired_sessions():
+    cache = MemorySessionBackend(max_entries=2)
+    cache.put("a", "a@example.com", time.time() + 60)
+    cache.put("b", "b@example.com", time.time() + 60)
+    cache.get("a")
+    cache.put("c", "c@example.com", time.time() + 60)
+    cache.put("old", "old@example.com", time.time() - 1)
+
+    assert cache.get("b") is None and cache.get("old") is None
+    assert SessionStore(ttl=-1).get(SessionStore(ttl=-1).create("x@example.com")) is None
+
+
+def test_auth_swaps_the_magic_link_for_a_session_once():
+    import clean_app
+    from shared import auth
+
+    os.environ["RENDER"] = "1"
+    try:
+        token = auth.create_magic_link("login@example.com")
+    finally:
+        del os.environ["RENDER"]
+
+    response = asyncio.run(clean_app.auth_callback(token))
+    cookie = response.headers["set-cookie"]
+    session_id = cookie.split("session=", 1)[1].split(";", 1)[0]
+
+    assert session_id != token
+    assert clean_app.session_email(session_id) == "login@example.com"
+    assert auth.verify_magic_link(token, mark_used=False) is None  # spent
+    assert asyncio.run(clean_app.auth_callback(token)).headers["location"].startswith("/login")
+
+
+def test_forged_test_cookies_are_refused_in_production():
+    from shared import session_store
+
+    forged = "test_victim@example.com"
+    assert session_store.session_email(forged) is None  # old-style cookies are off by default
+
+    original = session_store.ACCEPT_LOGIN_TOKENS
+    session_store.ACCEPT_LOGIN_TOKENS = True  # mid-rollout
+    os.environ["RENDER"] = "1"
+    try:
+        assert session_store.session_email(forged) is None
+    finally:
+        del os.environ["RENDER"]
+        session_store.ACCEPT_LOGIN_TOKENS = original
+
+
+def test_signed_cookie_checks_signature_expiry_and_revocation():
+    cookies = SignedSessionCookies(ttl=300)
+    cookie = cookies.sign("signed@example.com", "session-one")
+    verified = cookies.verify(cookie)
+
+    assert verified["email"] == "signed@example.com"
+    assert verified["digest"] == cookies.digest("session-one")
+    assert not cookies.needs_refresh(verified["expires"])
+    assert cookies.needs_refresh(time.time() + 100)
+
+    assert cookies.verify(cookie[:-3] + ("AAA" if cookie[-3:] != "AAA" else "BBB")) is None
+    assert SignedSessionCookies(secret="other").verify(cookie) is None
+    assert SignedSessionCookies(ttl=-1).verify(SignedSessionCookies(ttl=-1).sign("x@example.com", "s")) is None
+
+    cookies.revoke("session-one")
+    assert cookies.verify(cookie) is None
+    assert cookies.verify(cookies.sign("signed@example.com", "session-two")) is not None
+
+
+def test_logout_in_one_worker_revokes_the_cookie_in_the_others():
+    db_path = tempfile.mkstemp(suffix=".db")[1]
+    worker_a = SignedSessionCookies(ttl=300, db_path=db_path, poll_interval=0)
+    worker_b = SignedSessionCookies(ttl=300, db_path=db_path, poll_interval=0)
+    cookie = worker_a.sign("shared@example.com", "session-shared")
+    assert worker_b.verify(cookie) is not None
+
+    worker_a.revoke("session-shared")
+    assert worker_b.verify(cookie) is None
+    # A worker started after the logout knows about it too
+    assert SignedSessionCookies(ttl=300, db_path=db_path).verify(cookie) is None
+
+
+def test_stateless_pages_skip_the_store_only_for_a_good_signed_cookie():
+    cookies = SignedSessionCookies(ttl=300)
+    store = get_session_store()
+    session_id = store.create("stateless@example.com")
+
+    page = FastAPI()
+
+    @page.get("/read")
+    async def read(request: Request):
+        return {"email": request_email(request, request.cookies.get("session"))}
+
+    app = StatelessSessionMiddleware(page, paths=("/read",), cookies=cookies)
+
+    def get(signed):
+        """(email, new signed cookie or None, store lookups) for one request"""
+        async def go():
+            jar = {"session": session_id, **({SIGNED_COOKIE: signed} if signed else {})}
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app",
+                                         cookies=jar) as client:
+                return await client.get("/read")
+        before = store.metrics()
+        response = asyncio.run(go())
+        after = store.metrics()
+        lookups = after["hits"] + after["misses"] - before["hits"] - before["misses"]
+        return response.json()["email"], response.cookies.get(SIGNED_COOKIE), lookups
+
+    # No signed cookie yet: the store answers and a signed cookie is handed out
+    email, minted, lookups = get(None)
+    assert email == "stateless@example.com" and minted and lookups == 1
+
+    # Valid signed cookie: no store hit, nothing re-issued
+    assert get(minted) == ("stateless@example.com", None, 0)
+
+    # Tampered or expired: back to the store, and a fresh cookie
+    tampered = minted[:-3] + ("AAA" if minted[-3:] != "AAA" else "BBB")
+    expired = SignedSessionCookies(ttl=-1).sign("stateless@example.com", session_id)
+    for bad in (tampered, expired):
+        email, fresh, lookups = get(bad)
+        assert email == "stateless@example.com" and lookups == 1
+        assert cookies.verify(fresh)["email"] == "stateless@example.com"
+
+    # A signed cookie minted for another session is ignored too
+    email, fresh, lookups = get(cookies.sign("intruder@example.com", "someone-else"))
+    assert email == "stateless@example.com" and fresh and lookups == 1
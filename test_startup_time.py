@@ -0,0 +1,74 @@
+# test_startup_time.py
+# Importing clean_app must stay cheap and quiet: no HTTP/email/template libraries, no prints
+import os
+import subprocess
+import sys
+import tempfile
+sys.path.insert(0, '.')
+
+# Deferred until first use (LLM call, email, page render, startup hook)
+LAZY_MODULES = ("requests", "resend", "jinja2", "dotenv", "urllib3")
+# Time clean_app may add on top of FastAPI itself, in ms (override on slow CI boxes)
+IMPORT_BUDGET_MS = float(os.getenv("CLEAN_APP_IMPORT_BUDGET_MS", "150"))
+
+PROBE = """
+import sys
+before = set(sys.modules)
+import clean_app
+print("MODULES", " ".join(sorted(set(sys.modules) - before)))
+"""
+
+
+def import_clean_app():
+    """(stdout, importtime lines) of a fresh interpreter importing clean_app"""
+    env = dict(os.environ, BANK_DB_PATH=tempfile.mkstemp(suffix=".db")[1])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                            capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result.stdout, result.stderr.splitlines()
+
+
+def cumulative_us(lines, module):
+    for line in lines:
+        if line.startswith("import time:") and line.rsplit("|", 1)[1].strip() == module:
+            return int(line.split("|")[1])
+    raise AssertionError(f"{module} not in importtime output")
+
+
+def test_import_has_no_side_effects_or_heavy_dependencies():
+    stdout, _ = import_clean_app()
+    printed, modules = stdout.rsplit("MODULES", 1)
+    loaded = {name.split(".")[0] for name in modules.split()}
+
+    assert printed.strip() == "", f"import printed: {printed!r}"
+    assert not loaded & set(LAZY_MODULES), sorted(loaded & set(LAZY_MODULES))
+
+
+def test_launcher_loads_env_file_before_the_app_reads_it():
+    env_file = tempfile.mkstemp(suffix=".env")[1]
+    with open(env_file, "w") as f:
+        f.write("PROMPT_WIZARD_SPA=1\n")
+    env = dict(os.environ, BANK_DB_PATH=tempfile.mkstemp(suffix=".db")[1], ENV_FILE=env_file)
+    env.pop("PROMPT_WIZARD_SPA", None)
+    probe = "import serve; serve.load_env(); import clean_app; print('SPA', clean_app.WIZARD_SPA)"
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    os.unlink(env_file)
+
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert "SPA True" in result.stdout
+
+
+def test_import_time_stays_within_budget():
+    _, lines = import_clean_app()
+    own_ms = (cumulative_us(lines, "clean_app") - cumulative_us(lines, "fastapi")) / 1000
+
+    assert own_ms <= IMPORT_BUDGET_MS, f"clean_app adds {own_ms:.0f} ms on top of fastapi"
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_"):
+            func()
+            print(f"✅ {name}")
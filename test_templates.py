@@ -0,0 +1,49 @@
+# test_templates.py
+# Shared Jinja2 environment: every app template compiles, bytecode lands in the cache directory
+import os
+import sys
+import tempfile
+sys.path.insert(0, '.')
+
+from shared.templates import build_templates, precompile
+
+
+def test_precompile_fills_the_bytecode_cache():
+    cache_dir = tempfile.mkdtemp()
+    templates = build_templates(auto_reload=False, cache_dir=cache_dir)
+
+    stats = precompile(templates)
+    assert stats["templates"] >= 10
+    assert len(os.listdir(cache_dir)) == stats["templates"]
+    assert templates.env.auto_reload is False
+
+    # A second process (new environment, same directory) loads instead of compiling
+    again = build_templates(auto_reload=False, cache_dir=cache_dir)
+    assert precompile(again)["templates"] == stats["templates"]
+    assert len(os.listdir(cache_dir)) == stats["templates"]
+
+
+def test_templates_from_both_directories_resolve():
+    templates = build_templates(cache_dir=tempfile.mkdtemp())
+
+    assert templates.get_template("dashboard.html").filename.endswith(os.path.join("dashboard", "templates", "dashboard.html"))
+    assert templates.get_template("homepage.html").filename.endswith(os.path.join("templates", "homepage.html"))
+
+
+def test_fragment_is_rendered_once_per_version():
+    from shared.templates import render_fragment
+    apps = [{"name": "Grid <Wizard>", "cost": 4, "icon": "x", "url": "/grid", "description": "d"}]
+
+    first = render_fragment("_app_grid.html", "v1", apps=apps)
+    assert "Grid &lt;Wizard&gt;" in first
+    assert render_fragment("_app_grid.html", "v1", apps=[]) is first
+
+    apps[0]["cost"] = 7
+    assert "7 tokens" in render_fragment("_app_grid.html", "v2", apps=apps)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_"):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,236 @@
+# test_thumbnail_proxy.py
+# Proxy: path normalization, login/billing checks, body limits, streamed passthrough, cached bank decisions
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import httpx
+
+import thumbnail_proxy
+from shared.session_store import get_session_store
+
+
+def streamed(*chunks):
+    """Upstream body that arrives in pieces, like a real streamed response"""
+    async def body():
+        for chunk in chunks:
+            yield chunk
+    return body()
+
+
+def proxy_request(method, path, headers=(), chunks=(b"",), upstream=None):
+    """Run one raw ASGI request through the proxy against a mock upstream.
+    httpx would clean up "..", so call the app directly."""
+    forwarded = []  # httpx.Request objects the upstream received, bodies read
+
+    def record(request):
+        forwarded.append(request)
+        return upstream(request) if upstream else httpx.Response(200, content=streamed(b"ok"))
+
+    async def go():
+        thumbnail_proxy.upstream = httpx.AsyncClient(transport=httpx.MockTransport(record), base_url="http://real")
+        messages = []
+        requests = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            await asyncio.Event().wait()  # the client never disconnects
+
+        async def capture(message):
+            messages.append(message)
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+                 "headers": [(b"host", b"proxy")] + [(k.lower().encode(), v.encode()) for k, v in headers],
+                 "client": ("127.0.0.1", 1), "server": ("proxy", 80)}
+        try:
+            await thumbnail_proxy.app(scope, receive, capture)
+        finally:
+            await thumbnail_proxy.upstream.aclose()
+        return messages
+
+    messages = asyncio.run(go())
+    start = messages[0]
+    bodies = [m["body"] for m in messages[1:] if m["type"] == "http.response.body" and m.get("body")]
+    return SimpleNamespace(status=start["status"],
+                           headers=[(k.decode(), v.decode()) for k, v in start["headers"]],
+                           body=b"".join(bodies), body_messages=bodies, forwarded=forwarded)
+
+
+def send(method, path):
+    """(status, forwarded paths) for a raw request line"""
+    result = proxy_request(method, path)
+    return result.status, [request.url.raw_path.decode() for request in result.forwarded]
+
+
+def logged_in(email="proxy@example.com"):
+    """Cookie header for a fresh session"""
+    return ("cookie", f"dashboard_token={get_session_store().create(email)}")
+
+
+def test_normalize_route():
+    assert thumbnail_proxy.normalize_route("static/app.css") == "/static/app.css"
+    assert thumbnail_proxy.normalize_route("static/./img/") == "/static/img/"
+    assert thumbnail_proxy.normalize_route("") == "/"
+    for path in ("static/../analyze", "static/%2e%2e/analyze", "static/%2E%2e/analyze", "static/.%2e/analyze",
+                 "static//analyze", "static/%2e/x", ".."):
+        assert thumbnail_proxy.normalize_route(path) is None, path
+
+
+def test_traversal_out_of_static_is_rejected_before_forwarding():
+    for path in ("/static/../analyze", "/static/%2e%2e/analyze", "/assets/%2E%2E/analyze", "/static//analyze"):
+        status, forwarded = send("POST", path)
+        assert status == 400, (path, status)
+        assert forwarded == [], path
+
+
+def test_static_is_forwarded_normalized_and_the_rest_needs_login():
+    status, forwarded = send("GET", "/static/./app.css")
+    assert status == 200 and forwarded == ["/static/app.css"]
+
+    status, forwarded = send("POST", "/analyze")
+    assert status == 307 and forwarded == []  # login redirect, no upstream call
+
+
+def test_status_headers_and_cookies_pass_through():
+    def upstream(request):
+        headers = [("content-type", "image/png"), ("set-cookie", "a=1; Path=/"), ("set-cookie", "b=2; Path=/"),
+                   ("connection", "close"), ("x-thumbnail", "cached")]
+        return httpx.Response(201, headers=headers, content=streamed(b"png"))
+
+    result = proxy_request("GET", "/gallery", headers=[logged_in(), ("x-request-id", "r1"), ("te", "trailers")],
+                           upstream=upstream)
+    assert result.status == 201 and result.body == b"png"
+    assert [v for k, v in result.headers if k == "set-cookie"] == ["a=1; Path=/", "b=2; Path=/"]
+    assert ("x-thumbnail", "cached") in result.headers and ("content-type", "image/png") in result.headers
+    assert "connection" not in dict(result.headers)  # hop-by-hop, not forwarded back
+    sent = result.forwarded[0].headers
+    assert sent["x-request-id"] == "r1" and "te" not in sent
+
+
+def test_responses_are_streamed_chunk_by_chunk():
+    chunks = [b"a" * 1024, b"b" * 1024, b"c" * 1024]
+    result = proxy_request("GET", "/static/big.png",
+                           upstream=lambda request: httpx.Response(200, content=streamed(*chunks)))
+    assert result.body_messages == chunks  # each upstream chunk goes out as it arrives, nothing buffered
+
+
+def test_upstream_failures_become_gateway_errors():
+    def down(request):
+        raise httpx.ConnectError("refused")
+
+    def slow(request):
+        raise httpx.ReadTimeout("slow")
+
+    assert proxy_request("GET", "/static/a.css", upstream=down).status == 502
+    assert proxy_request("GET", "/static/a.css", upstream=slow).status == 504
+
+
+def with_body_limit(limit, run):
+    original = thumbnail_proxy.MAX_BODY_BYTES
+    thumbnail_proxy.MAX_BODY_BYTES = limit
+    try:
+        return run()
+    finally:
+        thumbnail_proxy.MAX_BODY_BYTES = original
+
+
+def test_uploads_stream_through_under_the_limit():
+    chunks = [b"x" * 4, b"y" * 4, b"z" * 4]
+    result = with_body_limit(12, lambda: proxy_request("POST", "/upload", headers=[logged_in()], chunks=chunks))
+    assert result.status == 200
+    assert result.forwarded[0].content == b"".join(chunks)
+
+
+def test_declared_oversize_upload_is_refused_before_forwarding():
+    result = with_body_limit(10, lambda: proxy_request(
+        "POST", "/upload", headers=[logged_in(), ("content-length", "11")], chunks=[b"x" * 11]))
+    assert result.status == 413 and result.forwarded == []
+
+
+def test_chunked_upload_is_cut_off_at_the_limit():
+    chunks = [b"x" * 6, b"y" * 6, b"z" * 6]  # no Content-Length: only counting while streaming can catch it
+    result = with_body_limit(10, lambda: proxy_request("POST", "/upload", headers=[logged_in()], chunks=chunks))
+    assert result.status == 413 and result.forwarded == []
+
+
+def test_static_bypass_is_for_reads_only():
+    assert send("GET", "/static/app.css")[0] == 200
+    assert send("HEAD", "/assets/logo.png")[0] == 200
+    for method in ("POST", "PUT", "DELETE"):
+        status, forwarded = send(method, "/static/upload")
+        assert status == 307 and forwarded == [], method  # login first, like every other write
+
+
+def test_is_billable():
+    assert thumbnail_proxy.is_billable("POST", "/analyze")
+    assert thumbnail_proxy.is_billable("PATCH", "/static/analyze")  # no free writes under static
+    assert not thumbnail_proxy.is_billable("GET", "/analyze")
+    assert not thumbnail_proxy.is_billable("DELETE", "/thumbnails/1")
+
+    original = thumbnail_proxy.BILLABLE_PREFIXES
+    thumbnail_proxy.BILLABLE_PREFIXES = ("/analyze",)
+    try:
+        assert thumbnail_proxy.is_billable("POST", "/analyze/batch")
+        assert not thumbnail_proxy.is_billable("POST", "/settings")
+    finally:
+        thumbnail_proxy.BILLABLE_PREFIXES = original
+
+
+def test_authorization_cache_expires():
+    cache = thumbnail_proxy.AuthorizationCache(ttl=0.05)
+    assert not cache.allowed("a@example.com")
+    cache.remember("a@example.com")
+    assert cache.allowed("a@example.com") and cache.hits == 1
+    time.sleep(0.06)
+    assert not cache.allowed("a@example.com")
+    cache.remember("a@example.com")
+    cache.forget("a@example.com")
+    assert not cache.allowed("a@example.com")
+
+
+def test_only_billable_requests_ask_the_bank_once_per_ttl():
+    thumbnail_proxy.auth_cache = thumbnail_proxy.AuthorizationCache(ttl=60)
+    cookie = logged_in("billed@example.com")  # new accounts start with enough for an analysis
+    assert proxy_request("GET", "/gallery", headers=[cookie]).status == 200
+    assert thumbnail_proxy.auth_cache.bank_checks == 0
+
+    for _ in range(3):
+        assert proxy_request("POST", "/analyze", headers=[cookie]).status == 200
+    assert thumbnail_proxy.auth_cache.bank_checks == 1
+    assert thumbnail_proxy.auth_cache.hits == 2
+
+
+def test_broke_users_are_sent_to_buy_tokens_and_not_cached():
+    import central_bank
+
+    thumbnail_proxy.auth_cache = thumbnail_proxy.AuthorizationCache(ttl=60)
+    central_bank.get_balance("broke@example.com")
+    central_bank.spend_now("broke@example.com", "test", central_bank.get_balance("broke@example.com"), "drain")
+    cookie = logged_in("broke@example.com")
+    for _ in range(2):
+        result = proxy_request("POST", "/analyze", headers=[cookie])
+        assert result.status == 307 and "buy-tokens" in dict(result.headers)["location"]
+        assert result.forwarded == []
+    assert thumbnail_proxy.auth_cache.bank_checks == 2
+
+
+def test_forged_test_cookie_is_refused_in_production():
+    from shared import session_store
+
+    forged = ("cookie", "dashboard_token=test_victim@example.com")
+    original = session_store.ACCEPT_LOGIN_TOKENS
+    session_store.ACCEPT_LOGIN_TOKENS = True  # even mid-rollout
+    os.environ["RENDER"] = "1"
+    try:
+        result = proxy_request("POST", "/analyze", headers=[forged])
+    finally:
+        del os.environ["RENDER"]
+        session_store.ACCEPT_LOGIN_TOKENS = original
+    assert result.status == 307 and "login" in dict(result.headers)["location"]
+    assert result.forwarded == []
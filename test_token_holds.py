@@ -0,0 +1,143 @@
+# test_token_holds.py
+# Reserve / capture / release holds in the central bank, including concurrent overspend
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, '.')
+
+import httpx
+
+import central_bank
+from central_bank import (reserve_tokens, capture_hold, release_hold, expire_holds,
+                          InsufficientTokens, HoldNotFound)
+
+
+def fresh_bank(balance, email="holder@example.com"):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["BANK_DB_PATH"] = path
+    central_bank.init_bank()
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO accounts (email, tokens) VALUES (?, ?)', (email, balance))
+    conn.commit()
+    conn.close()
+    return email
+
+
+def balance_of(email):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    row = conn.execute('SELECT tokens FROM accounts WHERE email = ?', (email,)).fetchone()
+    conn.close()
+    return row[0]
+
+
+def spends_recorded(email):
+    conn = sqlite3.connect(os.environ["BANK_DB_PATH"])
+    rows = conn.execute('SELECT amount FROM transactions WHERE email = ?', (email,)).fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def test_reserve_deducts_and_capture_records_spend():
+    email = fresh_bank(20)
+    hold = reserve_tokens(email, 5, "prompt_wizard", "test")
+    assert hold["remaining"] == 15
+    assert balance_of(email) == 15
+    assert spends_recorded(email) == []
+
+    capture_hold(hold["hold_id"])
+    assert balance_of(email) == 15
+    assert spends_recorded(email) == [-5]
+
+
+def test_release_returns_tokens_and_settles_once():
+    email = fresh_bank(20)
+    hold = reserve_tokens(email, 5, "prompt_wizard")
+    release_hold(hold["hold_id"])
+    assert balance_of(email) == 20
+    for settle in (capture_hold, release_hold):
+        try:
+            settle(hold["hold_id"])
+            assert False, "expected HoldNotFound"
+        except HoldNotFound:
+            pass
+    assert balance_of(email) == 20
+
+
+def test_insufficient_balance_is_rejected():
+    email = fresh_bank(4)
+    try:
+        reserve_tokens(email, 5, "prompt_wizard")
+        assert False, "expected InsufficientTokens"
+    except InsufficientTokens:
+        pass
+    assert balance_of(email) == 4
+
+
+def test_expired_holds_are_released():
+    email = fresh_bank(20)
+    stale = reserve_tokens(email, 5, "prompt_wizard", ttl_seconds=0)
+    live = reserve_tokens(email, 5, "prompt_wizard", ttl_seconds=300)
+    time.sleep(0.01)
+    assert expire_holds() == 1
+    assert balance_of(email) == 15
+    try:
+        capture_hold(stale["hold_id"])
+        assert False, "expired hold must not be capturable"
+    except HoldNotFound:
+        pass
+    capture_hold(live["hold_id"])
+
+
+def test_capture_after_expiry_refunds_instead_of_charging():
+    email = fresh_bank(20)
+    late = reserve_tokens(email, 5, "prompt_wizard", ttl_seconds=0)
+    time.sleep(0.01)  # expired, but the sweeper hasn't run yet
+    try:
+        capture_hold(late["hold_id"])
+        assert False, "expired hold must not be capturable"
+    except HoldNotFound:
+        pass
+    assert balance_of(email) == 20
+    assert spends_recorded(email) == []
+    assert expire_holds() == 0  # already refunded, not twice
+
+
+def test_hold_requests_are_bounded():
+    email = fresh_bank(20)
+    bodies = [{"tokens": -5}, {"tokens": 0}, {"tokens": 5, "ttl_seconds": 0},
+              {"tokens": 5, "ttl_seconds": central_bank.MAX_HOLD_TTL_SECONDS + 1}, {"tokens": 5}]
+
+    async def post_all():
+        transport = httpx.ASGITransport(app=central_bank.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bank") as client:
+            return [await client.post("/holds", json={"email": email, "app_id": "prompt_wizard", **body})
+                    for body in bodies]
+
+    *refused, accepted = asyncio.run(post_all())
+    assert [response.status_code for response in refused] == [422] * 4
+    assert accepted.status_code == 200 and accepted.json()["remaining"] == 15
+
+
+def test_concurrent_reservations_never_overspend():
+    email = fresh_bank(50)
+
+    def attempt(_):
+        try:
+            hold = reserve_tokens(email, 5, "prompt_wizard", "load test")
+        except InsufficientTokens:
+            return None
+        capture_hold(hold["hold_id"])
+        return hold["hold_id"]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(attempt, range(200)))
+
+    successes = [r for r in results if r]
+    assert len(successes) == 10
+    assert balance_of(email) == 0
+    assert sum(spends_recorded(email)) == -50
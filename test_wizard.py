@@ -0,0 +1,70 @@
+# test_wizard.py
+# Data-driven wizard engine: precomputed pages, choices carried and escaped
+import sys
+sys.path.insert(0, '.')
+
+from shared.wizard import Wizard, Step, Option, FORM_FIELDS, BACK, checked
+
+STEPS = (
+    Step("goal", "Goal", "Pick a goal", "", (Option("explain", "Explain", "e"), Option("create", "Create", "c"))),
+    Step("depth", "Depth", "How deep?", "", (Option("quick", "Quick", "q"),
+                                              Option("expert", "Expert", "x", checks="background")),
+         default="expert"),
+)
+FORM = f'<form>{FORM_FIELDS}<input type="checkbox" name="background"{checked("background")}><a href="{BACK}">Back</a></form>'
+
+
+def make():
+    return Wizard("/w", STEPS, FORM, lambda title, content: f"<title>{title}</title>{content}",
+                  icons={"explain": "fa-explain"})
+
+
+def test_first_step_is_static():
+    wizard = make()
+    page = wizard.render(1, {})
+    assert page is wizard.render(1, {"goal": "ignored"})
+    assert 'href="/w/step/2?goal=explain"' in page and "fa-explain" in page
+    assert "fa-solid fa-question" in page  # no icon for "create"
+    assert wizard.render(0, {}) is None and wizard.render(4, {}) is None
+
+
+def test_choices_are_carried_and_escaped():
+    page = make().render(2, {"goal": '"><script>'})
+    assert "<script>" not in page
+    assert 'href="/w/step/3?goal=%22%3E%3Cscript%3E&amp;depth=quick"' in page
+    assert 'href="/w/step/1"' in page
+
+
+def test_final_form_gets_hidden_fields_defaults_and_checks():
+    wizard = make()
+    page = wizard.render(3, {"goal": "create"})
+    assert '<input type="hidden" name="goal" value="create">' in page
+    assert '<input type="hidden" name="depth" value="expert">' in page  # step default
+    assert 'name="background" checked>' in page
+    assert 'href="/w/step/2?goal=create"' in page
+
+    page = wizard.render(3, {"goal": "create", "depth": "quick"})
+    assert 'name="background">' in page
+
+    blank = wizard.blank_form()
+    assert '<input type="hidden" name="depth">' in blank and 'href="#step-2"' in blank and "\x00" not in blank
+
+
+def test_made_up_choices_are_rendered_but_not_cached():
+    wizard = make()
+    assert wizard.known(3, {"goal": "create"}) and wizard.known(1, {"goal": "anything"})
+    assert not wizard.known(3, {"goal": "create", "depth": "made-up"})
+
+    before = wizard._render.cache_info().currsize
+    for n in range(20):
+        assert f'value="made-up-{n}"' in wizard.render(3, {"goal": "create", "depth": f"made-up-{n}"})
+    assert wizard._render.cache_info().currsize == before
+    wizard.render(3, {"goal": "create"})
+    assert wizard._render.cache_info().currsize == before + 1
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_"):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,59 @@
+# test_worker_safety.py
+# serve.py refuses to fork workers while request state lives in module-level containers
+import sqlite3
+import sys
+import tempfile
+import types
+sys.path.insert(0, '.')
+
+from shared.worker_safety import unsafe_globals, check_multi_worker, enable_wal
+
+
+def test_mutable_globals_are_flagged_unless_constant_or_declared():
+    module = types.ModuleType("fake_app")
+    module.sessions = {}
+    module.recent = []
+    module.PRICING = {"app": 1}
+    module._cache = {}
+    module.WORKER_LOCAL = ("_cache",)
+    module.app_name = "fake"
+
+    assert unsafe_globals(module) == [("sessions", "dict"), ("recent", "list")]
+    assert check_multi_worker([module], workers=1) == []
+    assert len(check_multi_worker([module], workers=4)) == 2
+
+
+def test_state_inside_our_objects_is_flagged():
+    from shared.session_store import SignedSessionCookies, signed_cookies
+    import thumbnail_proxy
+
+    module = types.ModuleType("fake_proxy")
+    module.auth_cache = thumbnail_proxy.AuthorizationCache(30)
+    module.revoked = SignedSessionCookies()
+    module.client = sqlite3.connect(":memory:")  # not our class: its insides aren't ours to judge
+    module.signed_cookies = signed_cookies  # imported: declared WORKER_LOCAL where it is created
+
+    assert unsafe_globals(module) == [("auth_cache", "AuthorizationCache._allowed_until"),
+                                      ("revoked", "SignedSessionCookies._revoked")]
+    module.WORKER_LOCAL = ("auth_cache", "revoked")
+    assert unsafe_globals(module) == []
+
+
+def test_our_apps_pass_the_preflight():
+    import clean_app
+    import working_dashboard
+    import dashboard.app
+    import thumbnail_proxy
+    from shared import balance_events, session_store
+
+    modules = [clean_app, working_dashboard, dashboard.app, thumbnail_proxy, balance_events, session_store]
+    assert check_multi_worker(modules, workers=4) == []
+
+
+def test_wal_is_enabled_on_the_bank_database():
+    db_path = tempfile.mkstemp(suffix=".db")[1]
+
+    assert enable_wal(db_path) == "wal"
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
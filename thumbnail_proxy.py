@@ -1,46 +1,213 @@
 # thumbnail_proxy.py
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from shared.session_store import session_email
+from shared.bank_client import get_bank_client, BankError
+from shared.catalog import get_catalog
 import httpx
 import os
+import posixpath
+import time
+from urllib.parse import unquote
 
 app = FastAPI()
-CENTRAL_BANK = "http://localhost:8000"  # Your token bank
-REAL_APP = "http://localhost:5001"      # Your actual thumbnail app
+# Bank: in-process by default, or BANK_CLIENT=http + CENTRAL_BANK_URL
+REAL_APP = os.getenv("THUMBNAIL_APP_URL", "http://localhost:5001")  # Your actual thumbnail app
+MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "100"))
+MAX_BODY_BYTES = int(os.getenv("PROXY_MAX_BODY_BYTES", str(100 * 1024 * 1024)))  # uploads, 100 MB
+APP_ID = "thumbnail_wizard"  # price comes from the app catalog
+AUTH_CACHE_TTL = float(os.getenv("PROXY_AUTH_TTL", "30"))  # seconds a "yes" from the bank is trusted
 
-@app.api_route("/{path:path}", methods=["GET", "POST"])
+# Served without login or bank checks, for reads only
+STATIC_PREFIXES = ("/static/", "/assets/", "/favicon.ico", "/robots.txt")
+STATIC_METHODS = {"GET", "HEAD"}
+# Only these paths cost tokens; empty means "any POST/PUT/PATCH outside static"
+BILLABLE_PREFIXES = tuple(p for p in os.getenv("PROXY_BILLABLE_PREFIXES", "").split(",") if p)
+BILLABLE_METHODS = {"POST", "PUT", "PATCH"}
+
+# Headers that only make sense for a single hop and must not be forwarded
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade", "host",
+}
+
+# uvicorn adds its own Date/Server on the way out
+SKIP_RESPONSE_HEADERS = HOP_BY_HOP | {"date", "server"}
+
+upstream = None  # httpx.AsyncClient, lives as long as the app
+
+@app.on_event("startup")
+async def open_upstream():
+    global upstream
+    upstream = httpx.AsyncClient(
+        base_url=REAL_APP,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+
+@app.on_event("shutdown")
+async def close_upstream():
+    if upstream:
+        await upstream.aclose()
+
+def forwardable(headers):
+    return [(name, value) for name, value in headers.items() if name.lower() not in HOP_BY_HOP]
+
+def normalize_route(path):
+    """Canonical "/path" for the static/billing checks and the upstream, or None
+    if it has empty or dot segments (also percent-encoded) that could climb out
+    of a static prefix, e.g. /static/../analyze"""
+    route = f"/{path}"
+    if "//" in route or ".." in unquote(route).split("/"):
+        return None
+    normalized = posixpath.normpath(route)
+    if route.endswith("/") and normalized != "/":
+        normalized += "/"
+    if "." in unquote(normalized).split("/"):  # "%2e", which normpath doesn't see
+        return None
+    return normalized
+
+def is_static(method, path):
+    """Asset reads skip login; a POST under /static/ is treated like any other route"""
+    return method in STATIC_METHODS and path.startswith(STATIC_PREFIXES)
+
+def is_billable(method, path):
+    """AI operations cost tokens; page loads and assets don't"""
+    if method not in BILLABLE_METHODS:
+        return False
+    return not BILLABLE_PREFIXES or path.startswith(BILLABLE_PREFIXES)
+
+class AuthorizationCache:
+    """Remembers positive spend decisions per user for a short TTL"""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._allowed_until = {}
+        self.hits = 0
+        self.bank_checks = 0
+
+    def allowed(self, email):
+        expires = self._allowed_until.get(email)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._allowed_until[email]
+            return False
+        self.hits += 1
+        return True
+
+    def remember(self, email):
+        if len(self._allowed_until) >= self.max_entries:
+            now = time.monotonic()
+            self._allowed_until = {e: t for e, t in self._allowed_until.items() if t >= now}
+            if len(self._allowed_until) >= self.max_entries:
+                self._allowed_until.clear()
+        self._allowed_until[email] = time.monotonic() + self.ttl
+
+    def forget(self, email):
+        self._allowed_until.pop(email, None)
+
+auth_cache = AuthorizationCache(AUTH_CACHE_TTL)
+# Each worker trusts its own bank answers for AUTH_CACHE_TTL; a miss just asks the bank
+WORKER_LOCAL = ("auth_cache",)
+
+async def authorize_spend(email):
+    """True if the user can afford an operation; asks the bank at most once per TTL"""
+    if auth_cache.allowed(email):
+        return True
+    auth_cache.bank_checks += 1
+    if await get_bank_client().can_spend(email, get_catalog().cost(APP_ID, "analyze")):
+        auth_cache.remember(email)
+        return True
+    return False
+
+class BodyTooLarge(Exception):
+    pass
+
+async def limited_body(request, limit):
+    """Pass the upload through chunk by chunk, stopping once it exceeds the limit"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise BodyTooLarge(received)
+        yield chunk
+
+def too_large():
+    return JSONResponse({"error": f"Request body larger than {MAX_BODY_BYTES} bytes"}, status_code=413)
+
+@app.get("/_proxy/metrics")
+async def proxy_metrics():
+    return {
+        "bank_checks": auth_cache.bank_checks,
+        "auth_cache_hits": auth_cache.hits,
+        "auth_cache_ttl": auth_cache.ttl,
+    }
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD"])
 async def proxy(request: Request, path: str):
-    # 1. Get user's token from cookie/session
-    user_token = request.cookies.get("dashboard_token")
-    if not user_token:
-        return RedirectResponse("https://dashboard.yourplatform.com/login")
-    
-    # 2. Ask central bank: "Can this user spend 4 tokens?"
+    route = normalize_route(path)
+    if route is None:
+        return JSONResponse({"error": "Invalid path"}, status_code=400)
+
+    if not is_static(request.method, route):
+        # 1. Get user's token from cookie/session
+        user_token = request.cookies.get("dashboard_token")
+        if not user_token:
+            return RedirectResponse("https://dashboard.yourplatform.com/login")
+
+        email = session_email(user_token)
+        if not email:
+            return RedirectResponse("https://dashboard.yourplatform.com/login")
+
+        # 2. Only AI operations ask the bank "Can this user afford an analysis?"
+        if is_billable(request.method, route):
+            try:
+                if not await authorize_spend(email):
+                    # Not enough tokens
+                    return RedirectResponse("https://dashboard.yourplatform.com/buy-tokens")
+
+            except BankError:
+                # Bank is down
+                return JSONResponse({"error": "Bank unavailable"}, status_code=503)
+
+    # 3. Forward to real app over the shared pool, streaming both directions.
+    # Neither body is ever held in memory as a whole: chunks go straight through.
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > MAX_BODY_BYTES:
+        return too_large()
+
+    upstream_request = upstream.build_request(
+        method=request.method,
+        url=route,
+        params=request.query_params,
+        headers=forwardable(request.headers),
+        content=limited_body(request, MAX_BODY_BYTES) if request.method not in ("GET", "HEAD") else None,
+    )
     try:
-        check = httpx.post(f"{CENTRAL_BANK}/can_spend", json={
-            "token": user_token,
-            "app": "thumbnail_wizard",
-            "cost": 4
-        })
-        
-        if check.status_code != 200:
-            # Not enough tokens
-            return RedirectResponse("https://dashboard.yourplatform.com/buy-tokens")
-    
-    except:
-        # Bank is down
-        return {"error": "Bank unavailable"}, 503
-    
-    # 3. Forward to real app
-    async with httpx.AsyncClient() as client:
-        response = await client.request(
-            method=request.method,
-            url=f"{REAL_APP}/{path}",
-            headers=dict(request.headers),
-            content=await request.body()
-        )
-    
-    return response.content
+        upstream_response = await upstream.send(upstream_request, stream=True)
+    except BodyTooLarge:
+        # Chunked upload without (or with a wrong) Content-Length went over the limit
+        return too_large()
+    except httpx.TimeoutException:
+        return JSONResponse({"error": "Thumbnail app timed out"}, status_code=504)
+    except httpx.HTTPError:
+        return JSONResponse({"error": "Thumbnail app unavailable"}, status_code=502)
+
+    response = StreamingResponse(
+        upstream_response.aiter_raw(),
+        status_code=upstream_response.status_code,
+        background=BackgroundTask(upstream_response.aclose),
+    )
+    # raw_headers keeps repeated headers (e.g. several Set-Cookie) intact
+    response.raw_headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in upstream_response.headers.multi_items()
+        if name.lower() not in SKIP_RESPONSE_HEADERS
+    ]
+    return response
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 import sqlite3
-import secrets
+from shared.auth import get_db_path
+from shared.session_store import get_session_store
 
 app = FastAPI()
-sessions = {}
+# Sessions live in the shared session store (web_sessions table), so any
+# worker can serve any request
 
 # SINGLE HTML with embedded form
 HTML = '''
@@ -49,11 +51,11 @@ async def home():
 @app.get("/api/status")
 async def status(request: Request):
     session_id = request.cookies.get("session_id")
-    if not session_id or session_id not in sessions:
+    email = get_session_store().get(session_id)
+    if not email:
         return {"logged_in": False}
     
-    email = sessions[session_id]
-    conn = sqlite3.connect('bank.db')
+    conn = sqlite3.connect(get_db_path())
     c = conn.cursor()
     c.execute('SELECT tokens FROM accounts WHERE email = ?', (email,))
     result = c.fetchone()
@@ -64,14 +66,14 @@ async def status(request: Request):
 
 @app.post("/login")
 async def login(email: str):
-    session_id = secrets.token_hex(16)
-    sessions[session_id] = email
+    session_id = get_session_store().create(email)
     response = RedirectResponse("/")
     response.set_cookie(key="session_id", value=session_id)
     return response
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request):
+    get_session_store().delete(request.cookies.get("session_id"))
     response = RedirectResponse("/")
     response.delete_cookie(key="session_id")
     return response